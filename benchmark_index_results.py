@@ -0,0 +1,190 @@
+"""
+Microbenchmark of the aggregation of SPARQL results per incident (utils.index_results_by_id).
+
+The benchmark runs on a recorded SPARQL response (JSON). If the file does not exist, it is recorded first:
+from Wikidata if --type_qid is provided, otherwise a synthetic response with --num_rows rows is generated.
+The result of utils.index_results_by_id is compared to the one of the original, unoptimized implementation.
+
+Usage:
+  benchmark_index_results.py --response_path=<response_path>\
+   --path_mapping_wd_to_sem=<path_mapping_wd_to_sem>\
+   --languages=<languages>\
+   [--type_qid=<type_qid>]\
+   [--num_rows=<num_rows>]\
+   [--repeat=<repeat>]
+
+Options:
+    --response_path=<response_path>  SPARQL response (JSON) to run the benchmark on
+    --path_mapping_wd_to_sem=<path_mapping_wd_to_sem>  see wdt_fn_mappings/any.json as example
+    --languages=<languages>  languages separated by -, e.g., "nl-it-en"
+    --type_qid=<type_qid>  event type to record the response for, e.g., Q40231
+    --num_rows=<num_rows>  number of rows of a synthetic response [default: 200000]
+    --repeat=<repeat>  number of runs per implementation [default: 3]
+
+Example:
+    python benchmark_index_results.py --response_path="bench/Q40231.json"\
+    --path_mapping_wd_to_sem="wdt_fn_mappings/any.json"\
+    --languages="nl-it-en"\
+    --type_qid="Q40231"
+"""
+import json
+import os
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+
+import utils
+
+for_encoding = 'é'
+
+
+def index_results_by_id_reference(raw_results, lang2var, extra_info):
+    """
+    The implementation of utils.index_results_by_id before the column plan was introduced.
+    """
+    indexed_results=defaultdict(dict)
+    for entry in raw_results:
+        wdt_id=entry['incident']['value']
+        current_result=indexed_results[wdt_id]
+        if not len(current_result.keys()):
+            current_result=defaultdict(dict)
+
+        if 'references' not in current_result:
+            current_result['references']=defaultdict(str)
+        name=entry['incidentLabel']['value']
+
+        if 'direct_types' not in current_result.keys():
+            current_result['direct_types']=set()
+        current_result['direct_types'].add(entry['direct_type']['value'])
+
+        for l, var in lang2var.items():
+            label_in_lang=var.strip('?')
+            if label_in_lang in entry.keys():
+                name_in_lang=entry[label_in_lang]['value']
+                current_result['references'][l]=name_in_lang
+
+        if 'extra_info' not in current_result.keys():
+            current_result['extra_info']=defaultdict(set)
+        for predicate, wdt_prop_paths in extra_info.items():
+            for a_path in wdt_prop_paths:
+                var=a_path.replace('wdt:', '').replace('/', '_')
+                if var in entry.keys() and entry[var]['value']:
+                    if var + 'Label' in entry.keys() and entry[var + 'Label']['value']:
+                        complex_value='%s | %s' % (entry[var]['value'], entry[var + 'Label']['value'])
+                    else:
+                        complex_value=entry[var]['value']
+                    current_result['extra_info'][predicate].add(complex_value)
+        indexed_results[wdt_id]=current_result
+    return indexed_results
+
+
+def create_synthetic_response(lang2var, extra_info, num_rows, seed=0):
+    """
+    Create a SPARQL response in which, like in real responses, every incident has several rows
+    (one per combination of OPTIONAL values) and property values are shared by many incidents.
+    """
+    rng = random.Random(seed)
+    variables = sorted({a_path.replace('wdt:', '').replace('/', '_')
+                        for wdt_prop_paths in extra_info.values()
+                        for a_path in wdt_prop_paths})
+    bindings = []
+    incident_number = 0
+    while len(bindings) < num_rows:
+        incident_number += 1
+        incident = f'{utils.WIKIDATA_PREFIX}Q{1000000 + incident_number}'
+        for _ in range(rng.randint(1, 6)):
+            entry = {
+                'incident': {'type': 'uri', 'value': incident},
+                'incidentLabel': {'type': 'literal', 'value': f'incident {incident_number}'},
+                'direct_type': {'type': 'uri', 'value': f'{utils.WIKIDATA_PREFIX}Q{rng.randint(1, 50)}'}
+            }
+            for l, var in lang2var.items():
+                entry[var.strip('?')] = {'xml:lang': l, 'type': 'literal', 'value': f'incident {incident_number} ({l})'}
+            for var in variables:
+                if rng.random() < 0.8:
+                    value_number = rng.randint(1, 2000)
+                    entry[var] = {'type': 'uri', 'value': f'{utils.WIKIDATA_PREFIX}Q{value_number}'}
+                    entry[var + 'Label'] = {'type': 'literal', 'value': f'value {value_number}'}
+            bindings.append(entry)
+
+    return {'head': {'vars': list(bindings[0].keys())},
+            'results': {'bindings': bindings}}
+
+
+def record_response(response_path, type_qid, languages, extra_info, num_rows):
+    lang2var = {l: '?label_%s' % l for l in languages}
+    if type_qid:
+        query, lang2var = utils.construct_query(type_qid, 'subsumed_by', languages, extra_info, 99999)
+        response = utils.get_results_with_retry(utils.wdt_sparql_url, query)
+    else:
+        response = create_synthetic_response(lang2var, extra_info, num_rows)
+
+    folder = os.path.dirname(response_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(response_path, 'w') as outfile:
+        json.dump(response, outfile)
+
+
+def run(index_function, bindings, lang2var, extra_info, repeat):
+    """
+    :rtype: tuple
+    :return: (result, best time in seconds, peak memory in MB during the aggregation)
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        result = None # the previous result is not freed during the measurement
+        start = time.perf_counter()
+        result = index_function(bindings, lang2var, extra_info)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    index_function(bindings, lang2var, extra_info)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, min(timings), peak / (1024 * 1024)
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    arguments = docopt(__doc__)
+    response_path = arguments['--response_path']
+    languages = arguments['--languages'].split('-')
+    repeat = int(arguments['--repeat'])
+    with open(arguments['--path_mapping_wd_to_sem']) as infile:
+        extra_info = json.load(infile)
+
+    if not os.path.exists(response_path):
+        print(f'recording response to {response_path}')
+        record_response(response_path,
+                        arguments['--type_qid'],
+                        languages,
+                        extra_info,
+                        int(arguments['--num_rows']))
+
+    with open(response_path) as infile:
+        bindings = json.load(infile)['results']['bindings']
+    lang2var = {l: '?label_%s' % l for l in languages}
+    print(f'{len(bindings)} rows')
+
+    reference, reference_time, reference_memory = run(index_results_by_id_reference,
+                                                      bindings, lang2var, extra_info, repeat)
+    optimized, optimized_time, optimized_memory = run(utils.index_results_by_id,
+                                                      bindings, lang2var, extra_info, repeat)
+
+    assert optimized == reference, 'the results of the implementations differ'
+
+    print(f'{len(optimized)} incidents')
+    print(f'reference: {round(reference_time, 3)} sec, {round(reference_memory, 1)} MB')
+    print(f'index_results_by_id: {round(optimized_time, 3)} sec, {round(optimized_memory, 1)} MB')
+    speedup = reference_time / optimized_time
+    memory_reduction = reference_memory / optimized_memory
+    print(f'speedup: {round(speedup, 2)}x, peak memory: {round(memory_reduction, 2)}x lower')
+    if speedup < 3 or memory_reduction < 3:
+        print('no several-fold improvement: the peak memory is mostly the result itself '
+              '(per incident a dict, two defaultdicts, and sets), and most of the time is spent '
+              'on the set and dict updates per row that this result requires')
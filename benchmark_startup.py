@@ -0,0 +1,89 @@
+"""
+Startup benchmark of a script of MWEP (default: main.py), using python -X importtime.
+
+The script is started with -h (which only prints the usage) --repeat times.
+The best wall time is reported, together with the modules that take the most time to import
+(cumulative import time of the modules that the script imports directly).
+The exit code is 1 if the best wall time exceeds --max_seconds.
+
+Usage:
+  benchmark_startup.py [--script=<script>] [--repeat=<repeat>] [--top=<top>] [--max_seconds=<max_seconds>]
+
+Options:
+    --script=<script>  script to start [default: main.py]
+    --repeat=<repeat>  number of runs [default: 5]
+    --top=<top>  number of modules to report [default: 15]
+    --max_seconds=<max_seconds>  maximum wall time of the startup in seconds [default: 1.0]
+
+Example:
+    python benchmark_startup.py --script="main.py" --repeat=5
+"""
+import os
+import subprocess
+import sys
+import time
+
+for_encoding = 'é'
+
+
+def parse_importtime(stderr):
+    """
+    parse the output of python -X importtime, e.g.,
+    import time:       500 |     102305 |       requests
+
+    :rtype: list
+    :return: list of (module, depth, self time in microseconds, cumulative time in microseconds)
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative_time, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), depth, int(self_time), int(cumulative_time)))
+    return imports
+
+
+def run(script, repeat):
+    """
+    :rtype: tuple
+    :return: (best wall time in seconds, imports of the last run (see function "parse_importtime"))
+    """
+    command = [sys.executable, '-X', 'importtime', script, '-h']
+    cwd = os.path.dirname(os.path.abspath(script))
+
+    timings = []
+    stderr = ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        stderr = completed.stderr
+
+    return min(timings), parse_importtime(stderr)
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    arguments = docopt(__doc__)
+    script = arguments['--script']
+    max_seconds = float(arguments['--max_seconds'])
+
+    best_time, imports = run(script, int(arguments['--repeat']))
+
+    total = sum(cumulative_time for name, depth, self_time, cumulative_time in imports
+                if depth == 0)
+    print(f'{script} -h: {round(best_time, 3)} sec (of which {round(total / 1e6, 3)} sec importing modules)')
+    print()
+    print('slowest imports of the script:')
+    direct_imports = sorted((import_ for import_ in imports if import_[1] == 0),
+                            key=lambda import_: import_[3],
+                            reverse=True)
+    for name, depth, self_time, cumulative_time in direct_imports[:int(arguments['--top'])]:
+        print(f'{round(cumulative_time / 1000, 1):>10} ms  {name}')
+
+    if best_time > max_seconds:
+        print()
+        print(f'the startup takes longer than {max_seconds} sec')
+        sys.exit(1)
@@ -0,0 +1,58 @@
+"""
+Convert the resources downloaded by install.sh into random-access versions.
+This only needs to be done once.
+
+Usage:
+  build_resources.py --config_path=<config_path>\
+   --verbose=<verbose>
+
+Options:
+    --config_path=<config_path> see config/mwep_settings.json
+    --verbose=<verbose> 0 --> no stdout 1 --> general stdout 2 --> detailed stdout
+
+Example:
+    python build_resources.py --config_path="config/mwep_settings.json"\
+    --verbose=1
+"""
+import json
+import time
+
+import utils
+import wikipedia_utils as wu
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    start = time.time()
+
+    arguments = docopt(__doc__)
+    mwep_settings = json.load(open(arguments['--config_path']))
+    verbose = int(arguments['--verbose'])
+
+    wiki_folder = mwep_settings['wiki_folder']
+    wiki_store_folder = mwep_settings['wiki_store_folder']
+
+    # bz2 shards -> JSONL + offsets
+    wu.convert_wiki_folder_to_store(wiki_folder,
+                                    wiki_store_folder,
+                                    verbose=verbose)
+
+    print('Wikipedia store created:', wiki_store_folder)
+
+    # page2path.p -> memory-mapped index
+    wu.convert_page2path_to_index(wiki_folder,
+                                  wiki_store_folder,
+                                  verbose=verbose)
+
+    print('Wikipedia index created:', wiki_store_folder)
+
+    # merged_indices.p -> one memory-mapped index per language
+    wu.convert_langlinks_to_indices(mwep_settings['wiki_langlinks_path'],
+                                    mwep_settings['wiki_langlinks_folder'],
+                                    verbose=verbose)
+
+    print('Wikipedia parallel titles indices created:', mwep_settings['wiki_langlinks_folder'])
+
+    end = time.time()
+    print('Time needed to build the resources', utils.format_time(end - start), 'sec')
@@ -0,0 +1,583 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+import http_utils
+import json_utils
+
+for_encoding = 'é'
+
+# the cache used by function "get_json" (see function "configure_http_cache")
+_http_cache = None
+
+# the cache used by function "get_sparql_json" (see function "configure_sparql_cache")
+_sparql_cache = None
+
+# the cache used by crawl_utils.get_crawl_result (see function "configure_crawl_cache")
+_crawl_cache = None
+
+# streamed SPARQL results that are larger than this (compressed) are not cached (see function "iter_sparql_bindings")
+MAX_STREAMED_VALUE_SIZE = 256 * 1024 * 1024
+
+
+class CacheMiss(Exception):
+    """
+    raised in offline mode when a response is not in the cache
+    """
+    pass
+
+
+def make_cache_key(endpoint, params):
+    """
+    create a cache key from an endpoint and its parameters.
+    The parameters are normalized, such that the order of the parameters
+    and the type of the values (e.g., 500 vs '500') do not matter.
+
+    :param str endpoint: e.g., https://en.wikipedia.org/w/api.php?
+    :param dict params: e.g., {'action': 'query', 'titles': 'Mannheim'}
+
+    :rtype: str
+    :return: sha256 hex digest
+    """
+    normalized_endpoint = endpoint.rstrip('?')
+    normalized_params = sorted((str(key), str(value))
+                               for key, value in (params or {}).items())
+    as_string = json.dumps([normalized_endpoint, normalized_params], ensure_ascii=False)
+    return hashlib.sha256(as_string.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of JSON responses (SQLite, zlib-compressed values).
+
+    * entries older than ttl seconds are not used anymore
+    * if the total size of the values exceeds max_size bytes,
+    the least recently used entries are removed
+    * in offline mode, a CacheMiss is raised when a response is not cached
+    * in refresh mode, responses that were cached before the cache was opened are not used (new responses are stored)
+    * the cache can be used from multiple threads
+    """
+
+    def __init__(self, path, ttl=None, max_size=None, offline=False, refresh=False):
+        """
+        :param str path: path to the SQLite file
+        :param int ttl: time to live of an entry in seconds (None: no expiry)
+        :param int max_size: maximum size of the cache in bytes (None: no maximum)
+        :param bool offline: only serve responses from the cache
+        :param bool refresh: do not serve responses that were cached before this moment
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.refresh = refresh
+        self.refresh_before = time.time() if refresh else None
+        self.hits = 0
+        self.misses = 0
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                   key TEXT PRIMARY KEY,
+                                   endpoint TEXT,
+                                   value BLOB,
+                                   size INTEGER,
+                                   created REAL,
+                                   last_access REAL)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS last_access_index ON responses (last_access)')
+        self.connection.commit()
+
+        self.total_size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, endpoint, params):
+        """
+        :rtype: tuple
+        :return: (found, JSON response or None)
+        """
+        return self.get_many(endpoint, [params])[0]
+
+    def get_many(self, endpoint, params_list):
+        """
+        look up the responses of many requests to the same endpoint (in one transaction)
+
+        :rtype: list
+        :return: list of (found, JSON response or None), one per element of params_list
+        """
+        results = []
+        for found, value in self.get_many_raw(endpoint, params_list):
+            if found:
+                results.append((True, json.loads(zlib.decompress(value))))
+            else:
+                results.append((False, None))
+        return results
+
+    def get_raw(self, endpoint, params):
+        """
+        :rtype: tuple
+        :return: (found, zlib-compressed JSON text or None)
+        """
+        return self.get_many_raw(endpoint, [params])[0]
+
+    def is_fresh(self, created, now):
+        is_fresh = self.ttl is None or now - created <= self.ttl
+        if self.refresh_before is not None and created < self.refresh_before:
+            is_fresh = False
+        return is_fresh
+
+    def get_raw_chunks(self, endpoint, params, chunk_size=65536):
+        """
+        see method "get_raw", but the value is read from the database in chunks,
+        such that a large value is never held in memory as a whole
+
+        :rtype: tuple
+        :return: (found, iterator of chunks of the zlib-compressed JSON text or None)
+        """
+        key = make_cache_key(endpoint, params)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT length(value), created FROM responses WHERE key = ?',
+                                          (key,)).fetchone()
+            if row is None or not self.is_fresh(row[1], now):
+                self.misses += 1
+                return False, None
+            self.connection.execute('UPDATE responses SET last_access = ? WHERE key = ?',
+                                    (now, key))
+            self.connection.commit()
+            self.hits += 1
+        size = row[0]
+
+        def iter_chunks():
+            for start in range(0, size, chunk_size):
+                with self.lock:
+                    chunk_row = self.connection.execute('SELECT substr(value, ?, ?) FROM responses WHERE key = ?',
+                                                        (start + 1, chunk_size, key)).fetchone()
+                if chunk_row is None: # removed in the meantime (e.g., evicted)
+                    raise ValueError(f'cached value of {endpoint} was removed while it was read')
+                yield chunk_row[0]
+
+        return True, iter_chunks()
+
+    def get_many_raw(self, endpoint, params_list):
+        """
+        see method "get_many", but the responses are returned as zlib-compressed JSON text
+        """
+        results = []
+        now = time.time()
+        with self.lock:
+            for params in params_list:
+                key = make_cache_key(endpoint, params)
+                row = self.connection.execute('SELECT value, created FROM responses WHERE key = ?',
+                                              (key,)).fetchone()
+
+                if row is not None:
+                    value, created = row
+                    if self.is_fresh(created, now):
+                        self.connection.execute('UPDATE responses SET last_access = ? WHERE key = ?',
+                                                (now, key))
+                        self.hits += 1
+                        results.append((True, value))
+                        continue
+
+                self.misses += 1
+                results.append((False, None))
+
+            self.connection.commit()
+        return results
+
+    def set(self, endpoint, params, response):
+        """
+        store a JSON response
+        """
+        self.set_many(endpoint, [(params, response)])
+
+    def set_many(self, endpoint, params_response_pairs):
+        """
+        store the JSON responses of many requests to the same endpoint (in one transaction)
+
+        :param list params_response_pairs: list of (params, response)
+        """
+        self.set_many_raw(endpoint,
+                          [(params, zlib.compress(json.dumps(response, ensure_ascii=False).encode('utf-8')))
+                           for params, response in params_response_pairs])
+
+    def set_raw(self, endpoint, params, value):
+        """
+        store a response that is already zlib-compressed JSON text
+        """
+        self.set_many_raw(endpoint, [(params, value)])
+
+    def set_raw_file(self, endpoint, params, infile, size, chunk_size=65536):
+        """
+        see method "set_raw", but the zlib-compressed JSON text is read from a file in chunks
+        (with Python < 3.11, which has no incremental blob I/O in sqlite3, the file is read at once)
+
+        :param infile: binary file object positioned at the start of the value
+        :param int size: size of the value in bytes
+        """
+        if not hasattr(self.connection, 'blobopen'):
+            self.set_raw(endpoint, params, infile.read(size))
+            return
+
+        key = make_cache_key(endpoint, params)
+        now = time.time()
+        with self.lock:
+            old_row = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if old_row is not None:
+                self.total_size -= old_row[0]
+
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, zeroblob(?), ?, ?, ?)',
+                                    (key, endpoint, size, size, now, now))
+            rowid = self.connection.execute('SELECT rowid FROM responses WHERE key = ?', (key,)).fetchone()[0]
+            with self.connection.blobopen('responses', 'value', rowid) as blob:
+                for start in range(0, size, chunk_size):
+                    blob.write(infile.read(min(chunk_size, size - start)))
+            self.total_size += size
+
+            self.connection.commit()
+
+            if self.max_size is not None and self.total_size > self.max_size:
+                self.evict()
+
+    def set_many_raw(self, endpoint, params_value_pairs):
+        """
+        see method "set_many", but the responses are provided as zlib-compressed JSON text
+        """
+        now = time.time()
+        with self.lock:
+            for params, value in params_value_pairs:
+                key = make_cache_key(endpoint, params)
+
+                old_row = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+                if old_row is not None:
+                    self.total_size -= old_row[0]
+
+                self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                        (key, endpoint, value, len(value), now, now))
+                self.total_size += len(value)
+
+            self.connection.commit()
+
+            if self.max_size is not None and self.total_size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """
+        remove the least recently used entries until the cache fits in max_size
+        """
+        with self.lock:
+            keys_to_remove = []
+            for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY last_access'):
+                if self.total_size <= self.max_size:
+                    break
+                keys_to_remove.append((key,))
+                self.total_size -= size
+
+            self.connection.executemany('DELETE FROM responses WHERE key = ?', keys_to_remove)
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
+            self.connection.commit()
+            self.total_size = 0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': self.total_size}
+
+
+def configure_http_cache(folder,
+                         ttl=None,
+                         max_size_mb=None,
+                         offline=False,
+                         cache=None):
+    """
+    set the cache that is used for all calls to the Wikidata and Wikipedia APIs.
+    Instead of the default ResponseCache, any object with the same get(_raw), get_raw_chunks, get_many(_raw), set(_raw), set_raw_file, set_many(_raw),
+    and stats methods and the offline attribute can be provided, e.g., a stand-in with fixed responses for testing.
+
+    :param str folder: folder in which the cache is stored
+    :param int ttl: see ResponseCache
+    :param int max_size_mb: maximum size of the cache in megabytes
+    :param bool offline: see ResponseCache
+    :param cache: if provided, this object is used as cache
+
+    :return: the cache
+    """
+    global _http_cache
+    if cache is None:
+        max_size = None
+        if max_size_mb is not None:
+            max_size = int(max_size_mb * 1024 * 1024)
+        cache = ResponseCache(os.path.join(folder, 'http_responses.sqlite'),
+                              ttl=ttl,
+                              max_size=max_size,
+                              offline=offline)
+    _http_cache = cache
+    return _http_cache
+
+
+def get_http_cache():
+    return _http_cache
+
+
+def configure_sparql_cache(folder,
+                           ttl=None,
+                           max_size_mb=None,
+                           offline=False,
+                           refresh=False,
+                           cache=None):
+    """
+    set the cache that is used for all SPARQL queries (see function "get_sparql_json").
+
+    :param str folder: folder in which the cache is stored
+    :param int ttl: see ResponseCache
+    :param int max_size_mb: maximum size of the cache in megabytes
+    :param bool offline: see ResponseCache
+    :param bool refresh: see ResponseCache, e.g., to obtain the latest version of Wikidata
+    :param cache: if provided, this object is used as cache
+
+    :return: the cache
+    """
+    global _sparql_cache
+    if cache is None:
+        max_size = None
+        if max_size_mb is not None:
+            max_size = int(max_size_mb * 1024 * 1024)
+        cache = ResponseCache(os.path.join(folder, 'sparql_results.sqlite'),
+                              ttl=ttl,
+                              max_size=max_size,
+                              offline=offline,
+                              refresh=refresh)
+    _sparql_cache = cache
+    return _sparql_cache
+
+
+def get_sparql_cache():
+    return _sparql_cache
+
+
+def configure_crawl_cache(folder,
+                          ttl=None,
+                          max_size_mb=None,
+                          offline=False,
+                          cache=None):
+    """
+    set the cache of the crawled Wikipedia sources (see crawl_utils.get_crawl_result):
+    the Wayback Machine url, the html, and the article extracted by newsplease per url.
+
+    :param str folder: folder in which the cache is stored
+    :param int ttl: see ResponseCache
+    :param int max_size_mb: maximum size of the cache in megabytes
+    :param bool offline: see ResponseCache (urls that are not cached get the status 'not in crawl cache')
+    :param cache: if provided, this object is used as cache
+
+    :return: the cache
+    """
+    global _crawl_cache
+    if cache is None:
+        max_size = None
+        if max_size_mb is not None:
+            max_size = int(max_size_mb * 1024 * 1024)
+        cache = ResponseCache(os.path.join(folder, 'crawl_store.sqlite'),
+                              ttl=ttl,
+                              max_size=max_size,
+                              offline=offline)
+    _crawl_cache = cache
+    return _crawl_cache
+
+
+def get_crawl_cache():
+    return _crawl_cache
+
+
+def normalize_query(query):
+    """
+    normalize a SPARQL query for the cache key: all sequences of whitespace become one space,
+    such that a change of indentation or line breaks does not change the key.
+    """
+    return ' '.join(query.split())
+
+
+def get_json(url, params, cache=None, cache_params=None):
+    """
+    perform a GET request (see http_utils.get) and return the JSON of the response,
+    served from the cache when possible.
+    Only successful responses are stored.
+
+    :param str url: endpoint
+    :param dict params: parameters of the request
+    :param cache: cache to use (default: the one set by function "configure_http_cache")
+    :param dict cache_params: parameters used for the cache key instead of params
+
+    :raises: CacheMiss in offline mode if the response is not cached
+    """
+    if cache is None:
+        cache = _http_cache
+    if cache_params is None:
+        cache_params = params
+
+    if cache is not None:
+        found, response = cache.get(url, cache_params)
+        if found:
+            return response
+        if cache.offline:
+            raise CacheMiss(f'{url} {params}')
+
+    r = http_utils.get(url, params)
+    response = r.json()
+
+    if cache is not None:
+        if r.status_code == 200 and not (isinstance(response, dict) and 'error' in response):
+            cache.set(url, cache_params, response)
+
+    return response
+
+
+def get_sparql_json(url, query, cache=None):
+    """
+    run a SPARQL query and return the JSON results, served from the cache when possible.
+    The cache key is based on the normalized query (see function "normalize_query").
+
+    :param str url: SPARQL endpoint
+    :param str query: SPARQL query
+    :param cache: cache to use (default: the one set by function "configure_sparql_cache",
+    or else the one set by function "configure_http_cache")
+
+    :raises: CacheMiss in offline mode if the results are not cached
+    """
+    if cache is None:
+        cache = _sparql_cache
+    return get_json(url,
+                    {'format': 'json', 'query': query},
+                    cache=cache,
+                    cache_params={'query': normalize_query(query)})
+
+
+def get_items(endpoint, keys, fetch_items, cache=None):
+    """
+    obtain the values of many keys (e.g., Wikidata ids) of one endpoint, served from the cache when possible.
+    Only the keys that are not cached are passed to fetch_items.
+    Keys that are missing in the result of fetch_items (e.g., because a request failed) are not stored.
+
+    :param str endpoint: name of the endpoint, part of the cache key, e.g., 'wbgetentities/sitelinks/en|nl'
+    :param iterable keys: the keys
+    :param fetch_items: function that obtains a dict key -> JSON value for a list of keys
+    :param cache: cache to use (default: the one set by function "configure_http_cache")
+
+    :rtype: dict
+    :return: key -> value (only for keys that are cached or fetched)
+
+    :raises: CacheMiss in offline mode if not all keys are cached
+    """
+    if cache is None:
+        cache = _http_cache
+
+    keys = list(dict.fromkeys(keys))
+    key2value = {}
+    missing_keys = keys
+
+    if cache is not None:
+        missing_keys = []
+        for key, (found, value) in zip(keys, cache.get_many(endpoint, [{'key': key} for key in keys])):
+            if found:
+                key2value[key] = value
+            else:
+                missing_keys.append(key)
+        if missing_keys and cache.offline:
+            raise CacheMiss(f'{endpoint} {missing_keys[:10]}')
+
+    if missing_keys:
+        fetched = fetch_items(missing_keys)
+        new_items = {key: fetched[key] for key in missing_keys if key in fetched}
+        key2value.update(new_items)
+
+        if cache is not None:
+            cache.set_many(endpoint, [({'key': key}, value) for key, value in new_items.items()])
+
+    return key2value
+
+
+def iter_decompressed(compressed_chunks, chunk_size=65536):
+    """
+    decompress chunks of zlib-compressed data one by one,
+    in chunks of at most chunk_size bytes (JSON text is compressed well, so one compressed chunk can be large)
+    """
+    decompressor = zlib.decompressobj()
+    for compressed_chunk in compressed_chunks:
+        while compressed_chunk:
+            yield decompressor.decompress(compressed_chunk, chunk_size)
+            compressed_chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+def iter_sparql_bindings(url, query, cache=None, chunk_size=65536, max_cached_size=MAX_STREAMED_VALUE_SIZE):
+    """
+    run a SPARQL query and yield the bindings one by one (see json_utils.iter_sparql_bindings),
+    such that the response is never parsed or held in memory as a whole.
+    The cache is the same as the one of function "get_sparql_json".
+    While the response is read, it is compressed into a temporary file,
+    which is stored in the cache once all bindings have been read (if it is at most max_cached_size bytes).
+    Cached results are read and decompressed in chunks.
+
+    :param str url: SPARQL endpoint
+    :param str query: SPARQL query
+    :param cache: cache to use (default: see function "get_sparql_json")
+    :param int chunk_size: number of bytes per chunk
+    :param int max_cached_size: larger (compressed) responses are not cached
+
+    :raises: CacheMiss in offline mode if the results are not cached
+    :raises: requests.HTTPError if the query failed (e.g., a syntax error), the body is not read
+    :raises: ValueError if the response is not valid SPARQL JSON
+    """
+    if cache is None:
+        cache = _sparql_cache if _sparql_cache is not None else _http_cache
+    cache_params = {'query': normalize_query(query)}
+
+    if cache is not None:
+        found, compressed_chunks = cache.get_raw_chunks(url, cache_params, chunk_size)
+        if found:
+            yield from json_utils.iter_sparql_bindings(iter_decompressed(compressed_chunks, chunk_size))
+            return
+        if cache.offline:
+            raise CacheMiss(f'{url} {cache_params}')
+
+    r = http_utils.get(url, {'format': 'json', 'query': query}, stream=True)
+    try:
+        r.raise_for_status() # retryable statuses have been retried by http_utils already
+        content_type = r.headers.get('Content-Type', '')
+        if 'json' not in content_type:
+            raise ValueError(f'SPARQL response is not JSON but {content_type!r}')
+
+        with tempfile.TemporaryFile() as compressed_file:
+            compressor = zlib.compressobj()
+            store = cache is not None
+
+            def iter_chunks():
+                nonlocal store
+                for chunk in r.iter_content(chunk_size):
+                    if store:
+                        compressed_file.write(compressor.compress(chunk))
+                        store = compressed_file.tell() <= max_cached_size
+                    yield chunk
+
+            yield from json_utils.iter_sparql_bindings(iter_chunks())
+
+            if store:
+                compressed_file.write(compressor.flush())
+                size = compressed_file.tell()
+                if size <= max_cached_size:
+                    compressed_file.seek(0)
+                    cache.set_raw_file(url, cache_params, compressed_file, size)
+    finally:
+        r.close()
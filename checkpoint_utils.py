@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+
+for_encoding = 'é'
+
+MANIFEST_FILENAME = 'manifest.json'
+DOCUMENT_LOG_SUFFIX = '_documents.log'
+
+
+def get_fingerprint(**settings):
+    """
+    fingerprint of the settings that influence the output of a run:
+    the recorded progress is only used if the fingerprint did not change.
+
+    :param settings: JSON-serializable settings
+
+    :rtype: str
+    """
+    fingerprint = json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+
+class RunManifest:
+    """
+    Checkpoint manifest of a pipeline run.
+    Per event type, it records the completed stages (with optional information, e.g., statistics)
+    in a JSON file, which is written (atomically) after every completed stage.
+    The NAF files that have been stored are appended to a log file per event type,
+    so that recording a document costs the same for the first and the last document.
+    Both reflect the completed work if the run is interrupted.
+    """
+
+    def __init__(self, folder, fingerprint, resume=True, verbose=0):
+        """
+        :param str folder: folder of the manifest and the document logs
+        :param str fingerprint: see function "get_fingerprint"
+        :param bool resume: if False, the recorded progress is discarded
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILENAME)
+        self.fingerprint = fingerprint
+        self.verbose = verbose
+        os.makedirs(folder, exist_ok=True)
+
+        self.data = {'fingerprint': fingerprint,
+                     'event_types': {}}
+        resumed = False
+        if resume and os.path.exists(self.path):
+            with open(self.path) as infile:
+                recorded = json.load(infile)
+            if recorded.get('fingerprint') == fingerprint:
+                self.data = recorded
+                resumed = True
+            elif verbose >= 1:
+                print(f'the settings changed since the run of {self.path}, not resuming')
+
+        if not resumed:
+            for filename in os.listdir(folder):
+                if filename.endswith(DOCUMENT_LOG_SUFFIX):
+                    os.remove(os.path.join(folder, filename))
+
+        # event type -> paths of the stored NAF files
+        self.event_type2documents = {}
+        self.save()
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as outfile:
+            json.dump(self.data, outfile, indent=2)
+        os.replace(temp_path, self.path)
+
+    def is_stage_done(self, event_type, stage, paths=()):
+        """
+        :param list paths: output files of the stage, which all have to exist
+
+        :rtype: bool
+        """
+        stages = self.data['event_types'].get(event_type, {}).get('stages', {})
+        return stage in stages and all(os.path.exists(path) for path in paths)
+
+    def get_stage_info(self, event_type, stage):
+        """
+        :rtype: dict
+        :return: the information stored with function "mark_stage_done"
+        """
+        return self.data['event_types'][event_type]['stages'][stage]
+
+    def mark_stage_done(self, event_type, stage, **info):
+        """
+        :param info: JSON-serializable information about the result of the stage
+        """
+        self.data['event_types'].setdefault(event_type, {'stages': {}})['stages'][stage] = info
+        self.save()
+        if self.verbose >= 2:
+            print(f'checkpoint: {event_type} {stage} done')
+
+    def get_document_log_path(self, event_type):
+        return os.path.join(self.folder, f'{event_type}{DOCUMENT_LOG_SUFFIX}')
+
+    def load_documents(self, event_type):
+        """
+        :rtype: set
+        :return: paths of the NAF files of the event type that have been recorded
+        """
+        if event_type not in self.event_type2documents:
+            documents = set()
+            log_path = self.get_document_log_path(event_type)
+            if os.path.exists(log_path):
+                with open(log_path, encoding='utf-8') as infile:
+                    for line in infile:
+                        if line.endswith('\n'): # the last line is incomplete if the run stopped while writing it
+                            documents.add(line[:-1])
+            self.event_type2documents[event_type] = documents
+        return self.event_type2documents[event_type]
+
+    def get_done_documents(self, event_type):
+        """
+        :rtype: set
+        :return: paths of the NAF files of the event type that have been stored (and still exist)
+        """
+        return {path for path in self.load_documents(event_type)
+                if os.path.exists(path)}
+
+    def mark_document_done(self, event_type, path):
+        documents = self.load_documents(event_type)
+        if path not in documents:
+            documents.add(path)
+            with open(self.get_document_log_path(event_type), 'a', encoding='utf-8') as outfile:
+                outfile.write(path + '\n')
+
+
+def prepare_folders(folders, clean=False):
+    """
+    create the output folders of a run
+
+    :param list folders: paths of folders
+    :param bool clean: if True, existing folders are removed first
+    """
+    for folder in folders:
+        if clean and os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder, exist_ok=True)
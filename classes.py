@@ -1,12 +1,7 @@
 import json
 from collections import defaultdict, Counter, OrderedDict
-from rdflib.namespace import Namespace
-from rdflib.namespace import RDF, RDFS
-from rdflib import Graph
-from rdflib import URIRef, BNode, Literal, XSD
-from scipy import stats
-import numpy as np
-import networkx as nx
+
+# rdflib, scipy, and numpy are imported in the methods that use them (they are slow to import)
 
 eventtype2json={}
 for_encoding = 'é'
@@ -109,6 +104,8 @@ class IncidentCollection:
                 direct_types.append(incident.direct_types)
 
         if num_with_prim_rt:
+            from scipy import stats
+            import numpy as np
             desc_prim_rt=stats.describe(np.array(num_prim_rt))
             cntr_prim_rt=Counter(num_prim_rt)
             cntr_prim_rt = dict(sorted(cntr_prim_rt.items()))
@@ -178,6 +175,9 @@ class IncidentCollection:
         with open(jsonfilename, 'rb') as f:
             wdt_fn_mappings_COL=json.load(f)
 
+        from rdflib import Graph, Literal, Namespace, URIRef, XSD
+        from rdflib.namespace import RDF, RDFS
+
         g = Graph()
 
         # Namespaces definition
@@ -276,6 +276,9 @@ class IncidentCollection:
         with open(jsonfilename, 'rb') as f:
             wdt_fn_mappings_COL=json.load(f)
 
+        from rdflib import Graph, Literal, Namespace, URIRef, XSD
+        from rdflib.namespace import RDF, RDFS
+
         g = Graph()
 
         # Namespaces definition
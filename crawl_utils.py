@@ -1,83 +1,255 @@
 from collections import defaultdict
-import urllib
-import http
-import ast
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+import hashlib
+import threading
+import urllib.error
+import http.client
+import json
 import socket
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 import urllib3
 
+import cache_utils
 import classes
-
-from newsplease import NewsPlease
-import langdetect
-import lxml
-from newspaper import article as AT
+import http_utils
 
 for_encoding = 'é'
-WAYBACK_CDX_SERVER = 'http://web.archive.org/cdx/search/cdx?'
+WAYBACK_SERVER = 'http://web.archive.org'
+WAYBACK_CDX_SERVER = WAYBACK_SERVER + '/cdx/search/cdx?'
+
+# same limits as the crawler of newsplease
+MAX_FILE_SIZE = 20000000
+MIN_FILE_SIZE = 10
+
+# endpoints of the crawl cache (see function "get_crawl_result")
+CRAWL_ENDPOINT = 'crawl'
+HTML_ENDPOINT = 'crawl/html'
+
+# statuses of function "crawl_article" that are stored in the crawl cache
+CACHED_STATI = {'succes', 'crawl error', 'Wayback Machine URL not found'}
+
+# endpoint of the index url -> best snapshot in the crawl cache (see function "resolve_wayback_uris")
+SNAPSHOT_ENDPOINT = 'wayback/snapshot'
+
+# statuses of function "generate_wayback_uri" that are stored in the index
+SNAPSHOT_STATI = {'succes', 'Wayback Machine URL not found'}
+
+# timeout of requests that do not specify one, e.g., CDX queries (seconds to connect, seconds between bytes)
+DEFAULT_TIMEOUT = urllib3.Timeout(connect=10.0, read=30.0)
+
+# connection pool shared by all crawl requests (see function "get_pool_manager")
+_pool_manager = None
+_pool_manager_lock = threading.Lock()
+
+
+def get_pool_manager(maxsize=10):
+    """
+    obtain the urllib3.PoolManager that is shared by all crawl requests,
+    so that connections (e.g., to web.archive.org) are reused.
+    Requests without a timeout use DEFAULT_TIMEOUT.
+
+    :param int maxsize: maximum number of connections per host (only used when the pool is created)
+
+    :rtype: urllib3.PoolManager
+    """
+    global _pool_manager
+    with _pool_manager_lock:
+        if _pool_manager is None:
+            _pool_manager = urllib3.PoolManager(num_pools=50,
+                                                maxsize=maxsize,
+                                                block=True,
+                                                timeout=DEFAULT_TIMEOUT,
+                                                headers={'User-Agent': http_utils.USER_AGENT})
+        return _pool_manager
+
+
+class DomainPoliteness:
+    """
+    Politeness limits per domain for the crawl workers:
+
+    * at most max_connections concurrent requests to one domain
+    * at most requests_per_second requests per second to one domain (see http_utils.TokenBucket)
+    """
+
+    def __init__(self, max_connections=4, requests_per_second=2.0):
+        """
+        :param int max_connections: maximum number of concurrent requests per domain
+        :param float requests_per_second: rate limit per domain
+        """
+        self.max_connections = max_connections
+        self.requests_per_second = requests_per_second
+        self.domain2semaphore = {}
+        self.domain2bucket = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, url):
+        """
+        wait until a request to the domain of the url is allowed,
+        e.g., with politeness.limit(url): ...
+        """
+        domain = urlparse(url).netloc
+        with self.lock:
+            if domain not in self.domain2semaphore:
+                self.domain2semaphore[domain] = threading.BoundedSemaphore(self.max_connections)
+                self.domain2bucket[domain] = http_utils.TokenBucket(self.requests_per_second)
+            semaphore = self.domain2semaphore[domain]
+            bucket = self.domain2bucket[domain]
+
+        with semaphore:
+            bucket.acquire()
+            yield
+
+
+@contextmanager
+def no_limit(url):
+    yield
+
+
+def fetch_html(url, timeout, pool_manager=None, politeness=None):
+    """
+    download the html of a url, in the same way as the crawler of newsplease
+    (only responses with status code 200 of an accepted size)
+
+    :param str url: a url
+    :param int timeout: timeout in seconds
+    :param urllib3.PoolManager pool_manager: default: function "get_pool_manager"
+    :param DomainPoliteness politeness: if provided, the politeness limits of the domain of the url are respected
+
+    :rtype: str
+    :return: the html, None if the url could not be downloaded
+    """
+    if pool_manager is None:
+        pool_manager = get_pool_manager()
+    limit = politeness.limit if politeness is not None else no_limit
+
+    try:
+        with limit(url):
+            r = pool_manager.request('GET', url,
+                                     timeout=timeout,
+                                     retries=urllib3.Retry(total=2, redirect=5, backoff_factor=0.5))
+    except (urllib3.exceptions.HTTPError, ValueError):
+        return None
+
+    if r.status != 200 or not MIN_FILE_SIZE <= len(r.data) <= MAX_FILE_SIZE:
+        return None
+
+    content_type = r.headers.get('Content-Type', '')
+    encoding = 'utf-8'
+    if 'charset=' in content_type:
+        encoding = content_type.split('charset=')[-1].split(';')[0].strip().strip('"')
+    try:
+        return r.data.decode(encoding, errors='replace')
+    except LookupError:
+        return r.data.decode('utf-8', errors='replace')
+
+
+def parse_cdx_response(data):
+    """
+    parse the JSON output of the CDX server: a list of rows, of which the first one contains the field names
+
+    :param bytes data: body of the response
+
+    :rtype: list
+    :return: list of dicts, one per snapshot, e.g., {'timestamp': '20190318...', 'original': 'https://...', ...}
+    (empty if the body is not valid JSON, e.g., 'Blocked Site Error')
+    """
+    try:
+        rows = json.loads(data)
+    except ValueError:
+        # org.archive.util.io.RuntimeIOException: org.archive.wayback.exception.AdministrativeAccessControlException: Blocked Site Error
+        return []
+
+    if not isinstance(rows, list) or len(rows) < 2:
+        return []
+
+    header = rows[0]
+    return [dict(zip(header, row)) for row in rows[1:]]
+
+
+def get_snapshot_url(timestamp, original):
+    """
+    :rtype: str
+    :return: Wayback Machine URL of a snapshot
+    """
+    return f'{WAYBACK_SERVER}/web/{timestamp}/{original}'
+
+
+def get_best_snapshot(snapshots):
+    """
+    select the latest snapshot with status code 200
+
+    :param list snapshots: see function "parse_cdx_response"
+
+    :rtype: str
+    :return: Wayback Machine URL, None if there is no snapshot with status code 200
+    """
+    wb_url = None
+    best_timestamp = ''
+    for snapshot in snapshots:
+        if snapshot.get('statuscode') != '200':
+            continue
+        if snapshot['timestamp'] >= best_timestamp:
+            best_timestamp = snapshot['timestamp']
+            wb_url = get_snapshot_url(snapshot['timestamp'], snapshot['original'])
+    return wb_url
+
 
 def generate_wayback_uri(url,
                          last_n=-5,
                          format='json',
+                         timeout=DEFAULT_TIMEOUT,
+                         pool_manager=None,
+                         politeness=None,
                          verbose=0):
     """
     call the https://github.com/internetarchive/wayback/tree/master/wayback-cdx-server#basic-usage
-    API to obtain the last snapshots of the wayback machine for a specific URL.
+    API to obtain the last snapshots with status code 200 of the wayback machine for a specific URL.
 
     :param str url: a URL
     :param int last_n: -5 indicates the 5 latest snapshots and 5 the first 5 snapshots
     :param str format: supported: 'json'
+    :param timeout: timeout of the CDX query in seconds (or urllib3.Timeout)
+    :param urllib3.PoolManager pool_manager: default: function "get_pool_manager"
+    :param DomainPoliteness politeness: see function "fetch_html"
 
     :rtype: tuple
     :return: (status, URL or None)
     """
-    http = urllib3.PoolManager()
-    wb_url = None
+    if pool_manager is None:
+        pool_manager = get_pool_manager()
+    limit = politeness.limit if politeness is not None else no_limit
 
     params = {'url': url,
               'output' : format,
+              'filter' : 'statuscode:200',
               'limit' : last_n}
 
     encoded_uri = WAYBACK_CDX_SERVER + urlencode(params)
-    print(encoded_uri)
+    if verbose >= 4:
+        print(encoded_uri)
 
     try:
-        r = http.request('GET', encoded_uri)
-    except urllib3.exceptions.MaxRetryError:
+        with limit(encoded_uri):
+            r = pool_manager.request('GET', encoded_uri, timeout=timeout)
+    except urllib3.exceptions.HTTPError: # e.g., MaxRetryError after timeouts
         return 'http request failed', url
 
     if r.status != 200:
-        status = 'status code not 200'
         if verbose >= 4:
             print(f'status code: {r.status}')
+        if r.status in http_utils.RETRY_STATUS_CODES:
+            return 'http request failed', url
 
-    data_as_string = r.data.decode('utf-8')
-
-    try:
-        snapshots = ast.literal_eval(data_as_string[:-1])
-    except:
-        # org.archive.util.io.RuntimeIOException: org.archive.wayback.exception.AdministrativeAccessControlException: Blocked Site Error
-        snapshots = ['']
-
-    for (urlkey,
-         timestamp,
-         original,
-         mimetype,
-         statuscode,
-         digest,
-         length) in snapshots[1:]:
-
-        if statuscode == '-':
-            continue
-
-        if int(statuscode) == 200:
-            wb_url = f'http://web.archive.org/web/{timestamp}/{original}'
-            status = 'succes'
+    wb_url = get_best_snapshot(parse_cdx_response(r.data))
 
     if wb_url is None:
         status = 'Wayback Machine URL not found'
-
-    if status == 'succes':
+    else:
+        status = 'succes'
         if verbose >= 3:
             print()
             print(f'Wayback machine: {wb_url} for url {url}')
@@ -86,52 +258,235 @@ def generate_wayback_uri(url,
     return status, wb_url
 
 
-def run_newsplease(url,
-                   timeout,
-                   startswith=None,
-                   accepted_languages=set(),
-                   excluded_domains=set(),
-                   title_required=True,
-                   num_chars_range=False,
-                   illegal_substrings=[],
-                   illegal_chars_in_title=set(),
-                   verbose=0):
+def get_urlkey(url):
     """
-    apply newsplease on a url
+    approximation of the SURT form of a url, which the CDX server uses as key (field urlkey),
+    e.g., https://www.nos.nl/artikel/2312406.html?b=2&a=1 -> nl,nos)/artikel/2312406.html?a=1&b=2
+
+    :rtype: str
+    """
+    parsed = urlparse(url.strip().lower())
+    host = parsed.hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    urlkey = ','.join(reversed(host.split('.'))) + ')' + (parsed.path or '/')
+    if parsed.query:
+        urlkey += '?' + '&'.join(sorted(parsed.query.split('&')))
+    return urlkey
+
+
+def get_domain(url):
+    """
+    :rtype: str
+    :return: host of a url without www., e.g., nos.nl
+    """
+    host = urlparse(url).hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+def get_domain_snapshots(domain,
+                         urls,
+                         max_pages=1,
+                         timeout=DEFAULT_TIMEOUT,
+                         pool_manager=None,
+                         politeness=None,
+                         verbose=0):
+    """
+    find the latest snapshots with status code 200 of many urls of one domain
+    with one CDX query for the complete domain (matchType=domain).
+    This is only done if the CDX server reports at most max_pages pages of results for the domain,
+    since large domains (e.g., news websites) have millions of snapshots.
+    The response is parsed line by line while it is read.
+    If a query fails (e.g., a timeout), an empty dict is returned,
+    so that the urls are looked up separately (see function "resolve_wayback_uris").
+
+    :param str domain: see function "get_domain"
+    :param list urls: urls of the domain
+    :param timeout: timeout of the CDX queries in seconds (or urllib3.Timeout), the read timeout applies between bytes of the response
+
+    :rtype: dict
+    :return: url -> Wayback Machine URL (only for the urls for which a snapshot was found)
+    """
+    if pool_manager is None:
+        pool_manager = get_pool_manager()
+    limit = politeness.limit if politeness is not None else no_limit
+
+    params = {'url': domain,
+              'matchType': 'domain',
+              'filter': 'statuscode:200',
+              'fl': 'urlkey,timestamp,original'}
+
+    try:
+        with limit(WAYBACK_CDX_SERVER):
+            r = pool_manager.request('GET',
+                                     WAYBACK_CDX_SERVER + urlencode({**params, 'showNumPages': 'true'}),
+                                     timeout=timeout)
+        num_pages = int(r.data.decode('utf-8').strip())
+    except (urllib3.exceptions.HTTPError, ValueError) as e:
+        if verbose >= 2:
+            print(f'{domain}: number of pages of snapshots not available ({e.__class__.__name__}), looking up {len(urls)} urls separately')
+        return {}
+
+    if num_pages > max_pages:
+        if verbose >= 2:
+            print(f'{domain}: {num_pages} pages of snapshots, looking up {len(urls)} urls separately')
+        return {}
+
+    urlkey2urls = defaultdict(list)
+    for url in urls:
+        urlkey2urls[get_urlkey(url)].append(url)
+
+    urlkey2best = {}
+    for page in range(num_pages):
+        try:
+            with limit(WAYBACK_CDX_SERVER):
+                r = pool_manager.request('GET',
+                                         WAYBACK_CDX_SERVER + urlencode({**params, 'page': page}),
+                                         timeout=timeout,
+                                         preload_content=False)
+                if r.status != 200:
+                    r.release_conn()
+                    return {}
+                for line in r:
+                    fields = line.decode('utf-8', errors='replace').split(' ')
+                    if len(fields) != 3 or fields[0] not in urlkey2urls:
+                        continue
+                    urlkey, timestamp, original = fields
+                    original = original.rstrip('\n')
+                    if urlkey not in urlkey2best or timestamp >= urlkey2best[urlkey][0]:
+                        urlkey2best[urlkey] = (timestamp, original)
+                r.release_conn()
+        except urllib3.exceptions.HTTPError as e:
+            if verbose >= 2:
+                print(f'{domain}: query of page {page} failed ({e.__class__.__name__}), looking up {len(urls)} urls separately')
+            return {}
+
+    url2wb_url = {}
+    for urlkey, (timestamp, original) in urlkey2best.items():
+        for url in urlkey2urls[urlkey]:
+            url2wb_url[url] = get_snapshot_url(timestamp, original)
+
+    if verbose >= 2:
+        print(f'{domain}: found snapshots of {len(url2wb_url)} of {len(urls)} urls with one query')
+    return url2wb_url
+
+
+def resolve_wayback_uris(urls,
+                         min_urls_per_domain_query=20,
+                         max_workers=8,
+                         pool_manager=None,
+                         politeness=None,
+                         crawl_cache=None,
+                         verbose=0):
+    """
+    batch version of function "generate_wayback_uri".
+    The urls are grouped per domain: for domains with at least min_urls_per_domain_query urls,
+    the snapshots are looked up with one query for the complete domain (see function "get_domain_snapshots"),
+    the remaining urls are looked up one by one with max_workers threads.
+    The results are stored in a local index url -> best snapshot in the crawl cache (see function "get_crawl_result").
+
+    :param urls: urls (not Wayback Machine urls)
+
+    :rtype: dict
+    :return: url -> (status, URL or None) (see function "generate_wayback_uri")
+    """
+    if crawl_cache is None:
+        crawl_cache = cache_utils.get_crawl_cache()
+
+    def fetch_snapshots(urls_to_resolve):
+        url2snapshot = {}
+
+        domain2urls = defaultdict(list)
+        for url in urls_to_resolve:
+            domain2urls[get_domain(url)].append(url)
+
+        for domain, domain_urls in domain2urls.items():
+            if len(domain_urls) >= min_urls_per_domain_query:
+                for url, wb_url in get_domain_snapshots(domain,
+                                                        domain_urls,
+                                                        pool_manager=pool_manager,
+                                                        politeness=politeness,
+                                                        verbose=verbose).items():
+                    url2snapshot[url] = {'wb_url': wb_url}
+
+        remaining_urls = [url for url in urls_to_resolve
+                          if url not in url2snapshot]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(partial(generate_wayback_uri,
+                                           pool_manager=pool_manager,
+                                           politeness=politeness,
+                                           verbose=verbose),
+                                   remaining_urls)
+            for url, (status, wb_url) in zip(remaining_urls, results):
+                if status in SNAPSHOT_STATI: # else the lookup is tried again in the next run
+                    url2snapshot[url] = {'wb_url': wb_url}
+
+        return url2snapshot
+
+    urls = list(dict.fromkeys(urls))
+    if crawl_cache is None:
+        url2snapshot = fetch_snapshots(urls)
+    elif crawl_cache.offline:
+        url2snapshot = {url: snapshot
+                        for url, (found, snapshot) in zip(urls, crawl_cache.get_many(SNAPSHOT_ENDPOINT,
+                                                                                     [{'key': url} for url in urls]))
+                        if found}
+    else:
+        url2snapshot = cache_utils.get_items(SNAPSHOT_ENDPOINT, urls, fetch_snapshots, cache=crawl_cache)
+
+    url2result = {}
+    for url in urls:
+        if url not in url2snapshot:
+            url2result[url] = ('http request failed', url)
+        elif url2snapshot[url]['wb_url'] is None:
+            url2result[url] = ('Wayback Machine URL not found', None)
+        else:
+            url2result[url] = ('succes', url2snapshot[url]['wb_url'])
+    return url2result
+
+
+def crawl_article(url,
+                  timeout,
+                  pool_manager=None,
+                  politeness=None,
+                  snapshot=None,
+                  verbose=0):
+    """
+    find the latest Wayback Machine snapshot of a url (if the url is not a snapshot already),
+    download it, and extract the article with newsplease
 
     :param str url: a url to crawl
     :param int timeout: timeout in seconds
-    :param startswith: if provided, the url has to start with this prefix, e.g., http
-    :param set accepted_languages: set of languages that are accepted
-    (https://en.wikipedia.org/wiki/ISO_639-1)
-    :param bool title_required: the article.title value can not be None
-    :param num_chars_range: if of type range, an article will only be included
-    if the number of characters falls within the specified range.
-    :param set illegal_substrings: if an article contains any of these substrings,
-    do not include them
+    :param urllib3.PoolManager pool_manager: see function "fetch_html"
+    :param DomainPoliteness politeness: see function "fetch_html"
+    :param tuple snapshot: (status, URL or None) of the url if it was already looked up (see function "resolve_wayback_uris")
 
     :rtype: tuple
-    :return (status, None of dict with all NewsPlease information)
+    :return: (status, Wayback Machine url or None, html or None, None of dict with all NewsPlease information)
     """
-    status = 'succes'
-    wb_url = None
-    news_please_info = None
+    # imported here, because newsplease is slow to import
+    from newsplease import NewsPlease
+    import langdetect
+    import lxml
+    from newspaper import article as AT
 
-    if startswith:
-        if not url.startswith(startswith):
-            status = 'not a valid url'
+    html = None
+    news_please_info = None
 
-    for excluded_domain in excluded_domains:
-        if excluded_domain in url:
-            status = 'excluded domain'
-    if status == 'succes':
-        if 'web.archive.org/web/' not in url:
-            print('generating wayback uri')
-            status, wb_url = generate_wayback_uri(url, verbose=verbose)
-            print(status, wb_url)
-        else:
-            status = 'succes'
-            wb_url = url
+    if snapshot is not None:
+        status, wb_url = snapshot
+    elif 'web.archive.org/web/' not in url:
+        print('generating wayback uri')
+        status, wb_url = generate_wayback_uri(url,
+                                              pool_manager=pool_manager,
+                                              politeness=politeness,
+                                              verbose=verbose)
+        print(status, wb_url)
+    else:
+        status = 'succes'
+        wb_url = url
 
     # TODO: what if url is not the same as the one crawler (via redirects?)
 
@@ -139,7 +494,12 @@ def run_newsplease(url,
         print('trying to crawl')
         try:
             print(wb_url)
-            article = NewsPlease.from_url(wb_url, timeout=timeout)
+            # same as NewsPlease.from_url, but with the shared connection pool and the politeness limits
+            download_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            html = fetch_html(wb_url, timeout, pool_manager=pool_manager, politeness=politeness)
+            if html is None:
+                raise ValueError(f'could not download {wb_url}')
+            article = NewsPlease.from_html(html, url=wb_url, download_date=download_date)
             print('article info')
             print(article.title)
             news_please_info = article.get_dict()
@@ -171,51 +531,238 @@ def run_newsplease(url,
                 AT.ArticleException
                 #newspaper.article.ArticleException
                 ) as e:
-            article = None
+            news_please_info = None
             status = 'URL error'
 
+    return status, wb_url, html, news_please_info
+
+
+def news_please_info_to_json(news_please_info):
+    """
+    make the dict with all NewsPlease information JSON-serializable (the dates are datetime objects)
+
+    :rtype: dict
+    """
+    json_info = {}
+    datetime_attrs = []
+    for attr, value in news_please_info.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+            datetime_attrs.append(attr)
+        json_info[attr] = value
+    json_info['_datetime_attrs'] = datetime_attrs
+    return json_info
+
+
+def news_please_info_from_json(json_info):
+    """
+    inverse of function "news_please_info_to_json"
+    """
+    news_please_info = dict(json_info)
+    for attr in news_please_info.pop('_datetime_attrs'):
+        news_please_info[attr] = datetime.fromisoformat(news_please_info[attr])
+    return news_please_info
+
+
+def get_crawl_result(url,
+                     timeout,
+                     pool_manager=None,
+                     politeness=None,
+                     crawl_cache=None,
+                     snapshot=None,
+                     verbose=0):
+    """
+    same as function "crawl_article", but served from the crawl cache when possible.
+    The cache is keyed by the original url and stores the Wayback Machine url, the status,
+    and the extracted NewsPlease information. The html is stored separately, keyed by its sha256 digest,
+    so that identical pages are stored once.
+    Only statuses in CACHED_STATI are stored, other errors (e.g., a timeout) are tried again in the next run.
+
+    :param crawl_cache: see cache_utils.configure_crawl_cache (default: the one set by that function, None: no caching)
+    :param tuple snapshot: see function "crawl_article"
+
+    :rtype: tuple
+    :return: (status, Wayback Machine url or None, None of dict with all NewsPlease information)
+    """
+    if crawl_cache is None:
+        crawl_cache = cache_utils.get_crawl_cache()
+
+    if crawl_cache is not None:
+        found, record = crawl_cache.get(CRAWL_ENDPOINT, {'url': url})
+        if found:
+            news_please_info = None
+            if record['article'] is not None:
+                news_please_info = news_please_info_from_json(record['article'])
+            return record['status'], record['wb_url'], news_please_info
+        if crawl_cache.offline:
+            return 'not in crawl cache', None, None
+
+    status, wb_url, html, news_please_info = crawl_article(url,
+                                                           timeout,
+                                                           pool_manager=pool_manager,
+                                                           politeness=politeness,
+                                                           snapshot=snapshot,
+                                                           verbose=verbose)
+
+    if crawl_cache is not None and status in CACHED_STATI:
+        html_sha256 = None
+        if html is not None:
+            html_sha256 = hashlib.sha256(html.encode('utf-8')).hexdigest()
+            crawl_cache.set(HTML_ENDPOINT, {'sha256': html_sha256}, html)
+
+        article = None
+        if news_please_info is not None:
+            article = news_please_info_to_json(news_please_info)
+
+        crawl_cache.set(CRAWL_ENDPOINT, {'url': url}, {'wb_url': wb_url,
+                                                       'status': status,
+                                                       'html_sha256': html_sha256,
+                                                       'article': article})
+
+    return status, wb_url, news_please_info
+
+
+def get_cached_html(html_sha256, crawl_cache=None):
+    """
+    obtain the html of a crawled page from the crawl cache,
+    e.g., to extract the article again with another version of newsplease
+
+    :param str html_sha256: see function "get_crawl_result"
+
+    :rtype: str
+    :return: the html, None if it is not cached
+    """
+    if crawl_cache is None:
+        crawl_cache = cache_utils.get_crawl_cache()
+    if crawl_cache is None:
+        return None
+
+    found, html = crawl_cache.get(HTML_ENDPOINT, {'sha256': html_sha256})
+    return html
+
+
+def validate_article(news_please_info,
+                     accepted_languages=set(),
+                     title_required=True,
+                     num_chars_range=False,
+                     illegal_substrings=[],
+                     illegal_chars_in_title=set()):
+    """
+    validate the attributes of a crawled article based on the settings
+    (see function "run_newsplease"). Only uses the NewsPlease information,
+    so that the settings can be applied again to a cached article.
+
+    :rtype: str
+    :return: status ('succes' if the article is accepted)
+    """
+    status = 'succes'
+
+    if accepted_languages:
+        if news_please_info['language'] not in accepted_languages:
+            status = 'not in accepted languages'
+
+    for illegal_substring in illegal_substrings:
+        if illegal_substring in news_please_info['maintext']:
+            status = 'illegal substring'
+
+    if num_chars_range:
+        num_chars = len(news_please_info['maintext'])
+        if num_chars not in num_chars_range:
+            status = 'outside of accepted number of characters range'
+
+    if title_required:
+        if news_please_info['title'] is None:
+            status = 'no title'
+        else:
+            for illegal_char_in_title in illegal_chars_in_title:
+                if illegal_char_in_title in news_please_info['title']:
+                    status = 'illegal char in title'
+
+    return status
+
+
+def run_newsplease(url,
+                   timeout,
+                   startswith=None,
+                   accepted_languages=set(),
+                   excluded_domains=set(),
+                   title_required=True,
+                   num_chars_range=False,
+                   illegal_substrings=[],
+                   illegal_chars_in_title=set(),
+                   pool_manager=None,
+                   politeness=None,
+                   crawl_cache=None,
+                   snapshot=None,
+                   verbose=0):
+    """
+    apply newsplease on a url
+
+    :param str url: a url to crawl
+    :param int timeout: timeout in seconds
+    :param startswith: if provided, the url has to start with this prefix, e.g., http
+    :param set accepted_languages: set of languages that are accepted
+    (https://en.wikipedia.org/wiki/ISO_639-1)
+    :param bool title_required: the article.title value can not be None
+    :param num_chars_range: if of type range, an article will only be included
+    if the number of characters falls within the specified range.
+    :param set illegal_substrings: if an article contains any of these substrings,
+    do not include them
+    :param urllib3.PoolManager pool_manager: see function "fetch_html"
+    :param DomainPoliteness politeness: see function "fetch_html"
+    :param crawl_cache: see function "get_crawl_result"
+    :param tuple snapshot: see function "crawl_article"
+
+    :rtype: tuple
+    :return (status, None of dict with all NewsPlease information)
+    """
+    status = 'succes'
+    wb_url = None
+    news_please_info = None
+
+    if startswith:
+        if not url.startswith(startswith):
+            status = 'not a valid url'
+
+    for excluded_domain in excluded_domains:
+        if excluded_domain in url:
+            status = 'excluded domain'
+
+    if status == 'succes':
+        status, wb_url, news_please_info = get_crawl_result(url,
+                                                            timeout,
+                                                            pool_manager=pool_manager,
+                                                            politeness=politeness,
+                                                            crawl_cache=crawl_cache,
+                                                            snapshot=snapshot,
+                                                            verbose=verbose)
+
     if status == 'succes':
 
         # validate attributes based on settings
-        news_please_info = article.get_dict()
         print("\n main text in news please output \n")
         print(news_please_info)
         print(news_please_info['maintext'])
 
-        if accepted_languages:
-            if news_please_info['language'] not in accepted_languages:
-                status = 'not in accepted languages'
-
-        for illegal_substring in illegal_substrings:
-            if illegal_substring in news_please_info['maintext']:
-                status = 'illegal substring'
-
-        if num_chars_range:
-            num_chars = len(news_please_info['maintext'])
-            if num_chars not in num_chars_range:
-                status = 'outside of accepted number of characters range'
-
-        if title_required:
-            if news_please_info['title'] is None:
-                status = 'no title'
-            else:
-                for illegal_char_in_title in illegal_chars_in_title:
-                    if illegal_char_in_title in news_please_info['title']:
-                        status = 'illegal char in title'
+        status = validate_article(news_please_info,
+                                  accepted_languages=accepted_languages,
+                                  title_required=title_required,
+                                  num_chars_range=num_chars_range,
+                                  illegal_substrings=illegal_substrings,
+                                  illegal_chars_in_title=illegal_chars_in_title)
 
     if verbose >= 3:
         if status == 'succes':
             print()
             print(f'{status} {url}')
-            if status == 'succes':
-                attrs = ['title',
-                         'url',
-                         'date_publish',
-                         'source_domain',
-                         'language']
+            attrs = ['title',
+                     'url',
+                     'date_publish',
+                     'source_domain',
+                     'language']
 
             for attr in attrs:
-                print(f'ATTR {attr}: {getattr(article, attr)}')
+                print(f'ATTR {attr}: {news_please_info.get(attr)}')
 # news_please no longer has the field 'text' so this breaks the code
 #            print('num chars', len(news_please_info['text']))
         else:
@@ -224,25 +771,65 @@ def run_newsplease(url,
 
     return status, news_please_info
 
-status, article = run_newsplease(url='https://www.aasdfjsoidfj.nl',
-                                 timeout=10)
-print('test 1 - should fail with wayback machine url not found')
-print(status)
-assert status == 'Wayback Machine URL not found'
 
-# Pia: link seems to have disappeared - creating new test
-# status, article = run_newsplease(url='https://www.rt.com/news/203203-ukraine-russia-troops-border/',
-#                                  timeout=10)
-#https://nos.nl/artikel/2312406-rechtbank-verplicht-verdachte-van-tramaanslag-om-naar-zitting-te-komen.html'
-#https://www.reuters.com/world/europe/uk-says-russian-forces-opened-new-route-advance-towards-kyiv-2022-02-25/'
-status, article = run_newsplease(url='https://nos.nl/artikel/2312406-rechtbank-verplicht-verdachte-van-tramaanslag-om-naar-zitting-te-komen.html',
-                                 timeout=10)
+def crawl_urls(urls,
+               timeout,
+               max_workers=8,
+               max_connections_per_domain=4,
+               requests_per_second_per_domain=2.0,
+               min_urls_per_domain_query=20,
+               verbose=0,
+               **newsplease_settings):
+    """
+    apply function "run_newsplease" on urls concurrently:
+    first the Wayback Machine snapshots of all urls are looked up (see function "resolve_wayback_uris"),
+    then a bounded pool of max_workers threads crawls the urls,
+    sharing one connection pool and the politeness limits per domain (see class DomainPoliteness).
+
+    :param urls: urls to crawl
+    :param timeout: see function "run_newsplease"
+    :param int max_workers: number of urls that are crawled concurrently
+    :param int max_connections_per_domain: see class DomainPoliteness
+    :param float requests_per_second_per_domain: see class DomainPoliteness
+    :param int min_urls_per_domain_query: see function "resolve_wayback_uris"
+    :param newsplease_settings: keyword arguments of function "run_newsplease",
+    e.g., startswith and accepted_languages
+
+    :rtype: dict
+    :return: mapping from url -> (status, None of dict with all NewsPlease information)
+    """
+    urls = list(dict.fromkeys(urls))
+    pool_manager = get_pool_manager(maxsize=max_connections_per_domain)
+    politeness = DomainPoliteness(max_connections=max_connections_per_domain,
+                                  requests_per_second=requests_per_second_per_domain)
+
+    startswith = newsplease_settings.get('startswith')
+    excluded_domains = newsplease_settings.get('excluded_domains', set())
+    urls_to_resolve = [url for url in urls
+                       if 'web.archive.org/web/' not in url
+                       and (not startswith or url.startswith(startswith))
+                       and not any(excluded_domain in url for excluded_domain in excluded_domains)]
+    url2snapshot = resolve_wayback_uris(urls_to_resolve,
+                                        min_urls_per_domain_query=min_urls_per_domain_query,
+                                        max_workers=max_workers,
+                                        pool_manager=pool_manager,
+                                        politeness=politeness,
+                                        crawl_cache=newsplease_settings.get('crawl_cache'),
+                                        verbose=verbose)
 
+    def crawl(url):
+        return run_newsplease(url,
+                              timeout=timeout,
+                              pool_manager=pool_manager,
+                              politeness=politeness,
+                              snapshot=url2snapshot.get(url),
+                              verbose=verbose,
+                              **newsplease_settings)
 
-print('test 2 - should be successful')
-print(status)
-assert status == 'succes'
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(crawl, urls))
 
+    return dict(zip(urls, results))
 
 
 def get_ref_text_obj_of_primary_reference_texts(urls,
@@ -254,6 +841,10 @@ def get_ref_text_obj_of_primary_reference_texts(urls,
                                                 num_chars_range=False,
                                                 illegal_substrings=[],
                                                 illegal_chars_in_title=set(),
+                                                max_workers=8,
+                                                max_connections_per_domain=4,
+                                                requests_per_second_per_domain=2.0,
+                                                min_urls_per_domain_query=20,
                                                 verbose=0):
     """
     crawl urls using newsplease and represent succesful crawls
@@ -266,6 +857,10 @@ def get_ref_text_obj_of_primary_reference_texts(urls,
     :param excluded_domains: see function "run_newsplease"
     :param title_required: see function "run_newsplease"
     :param num_chars_range: see function "run_newsplease"
+    :param max_workers: see function "crawl_urls"
+    :param max_connections_per_domain: see function "crawl_urls"
+    :param requests_per_second_per_domain: see function "crawl_urls"
+    :param min_urls_per_domain_query: see function "crawl_urls"
 
     :rtype: dict
     :return: mapping from uri ->
@@ -274,23 +869,27 @@ def get_ref_text_obj_of_primary_reference_texts(urls,
     url_to_info = {}
     stati = defaultdict(int)
 
-    for index, url in enumerate(urls, 1):
-
-        if verbose >= 5:
-            if index == 50:
-                print(f'QUITTING AFTER 5 BECAUSE VERBOSE == 50')
-                break
-
-        status, result = run_newsplease(url,
-                                        timeout=timeout,
-                                        startswith=startswith,
-                                        excluded_domains=excluded_domains,
-                                        accepted_languages=accepted_languages,
-                                        title_required=title_required,
-                                        num_chars_range=num_chars_range,
-                                        illegal_substrings=illegal_substrings,
-                                        illegal_chars_in_title=illegal_chars_in_title,
-                                        verbose=verbose)
+    urls = list(urls)
+    if verbose >= 5 and len(urls) >= 50:
+        print(f'QUITTING AFTER 49 BECAUSE VERBOSE >= 5')
+        urls = urls[:49]
+
+    url_to_result = crawl_urls(urls,
+                               timeout,
+                               max_workers=max_workers,
+                               max_connections_per_domain=max_connections_per_domain,
+                               requests_per_second_per_domain=requests_per_second_per_domain,
+                               min_urls_per_domain_query=min_urls_per_domain_query,
+                               startswith=startswith,
+                               excluded_domains=excluded_domains,
+                               accepted_languages=accepted_languages,
+                               title_required=title_required,
+                               num_chars_range=num_chars_range,
+                               illegal_substrings=illegal_substrings,
+                               illegal_chars_in_title=illegal_chars_in_title,
+                               verbose=verbose)
+
+    for url, (status, result) in url_to_result.items():
 
         info = {
             'status' : status,
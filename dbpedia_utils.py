@@ -1,9 +1,10 @@
 from datetime import datetime
 import time
 import wikipedia
-import requests
 import json
 
+import http_utils
+
 for_encoding = 'é'
 
 def get_interlanguage_links(page_names,
@@ -33,7 +34,7 @@ def get_interlanguage_links(page_names,
         url_name = page.url.split('/')[-1]
 
         query = f'http://dbpedia.org/data/{url_name}.json'
-        response = requests.get(query)
+        response = http_utils.get(query)
 
         try:
             data = response.json()
@@ -0,0 +1,235 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+for_encoding = 'é'
+
+USER_AGENT = 'MWEP/1.0 (multilingual Wikipedia event pipeline) python-requests'
+
+# status codes after which a request is tried again
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# the client used by function "get" (see function "configure_http_client")
+_http_client = None
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: at most rate requests per second on average,
+    with bursts of at most capacity requests.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param float rate: number of tokens that is added per second
+        :param float capacity: maximum number of tokens (default: max(1, rate))
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last_update = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        take one token, sleep until one is available if needed
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.last_update) * self.rate)
+                self.last_update = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def get_retry_after(response):
+    """
+    obtain the number of seconds from the Retry-After header of a response
+
+    :rtype: float
+    :return: number of seconds, None if the header is missing or invalid
+    """
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_maxlag_error(response):
+    """
+    MediaWiki returns HTTP 200 with error code "maxlag" when its replication lag is too high.
+    """
+    if 'MediaWiki-API-Error' in response.headers:
+        return response.headers['MediaWiki-API-Error'] == 'maxlag'
+    return False
+
+
+class HttpClient:
+    """
+    HTTP client for the Wikidata and Wikipedia APIs:
+
+    * one pooled requests.Session per host (connections are reused)
+    * exponential backoff with jitter for connection errors, timeouts, and RETRY_STATUS_CODES,
+    for at most max_retries retries
+    * the Retry-After header is honored
+    * a token-bucket rate limiter per host
+    * the maxlag parameter is sent to MediaWiki APIs (api.php)
+    """
+
+    def __init__(self,
+                 user_agent=USER_AGENT,
+                 timeout=120,
+                 max_retries=5,
+                 backoff_base=1.0,
+                 backoff_max=60.0,
+                 requests_per_second=10,
+                 host_requests_per_second={},
+                 maxlag=5,
+                 pool_size=10):
+        """
+        :param str user_agent: User-Agent header of all requests
+        :param float timeout: timeout in seconds of one request
+        :param int max_retries: maximum number of retries of one request
+        :param float backoff_base: delay in seconds before the first retry (doubled after every retry)
+        :param float backoff_max: maximum delay in seconds between two attempts
+        :param float requests_per_second: rate limit per host
+        :param dict host_requests_per_second: host -> rate limit, e.g., {'query.wikidata.org': 5}
+        :param int maxlag: maxlag parameter for MediaWiki APIs (None: not sent)
+        :param int pool_size: maximum number of connections per host
+        """
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests_per_second = requests_per_second
+        self.host_requests_per_second = host_requests_per_second
+        self.maxlag = maxlag
+        self.pool_size = pool_size
+
+        self.host2session = {}
+        self.host2bucket = {}
+        self.lock = threading.Lock()
+
+    def get_session(self, host):
+        with self.lock:
+            if host not in self.host2session:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = self.user_agent
+                self.host2session[host] = session
+            return self.host2session[host]
+
+    def get_bucket(self, host):
+        with self.lock:
+            if host not in self.host2bucket:
+                rate = self.host_requests_per_second.get(host, self.requests_per_second)
+                self.host2bucket[host] = TokenBucket(rate)
+            return self.host2bucket[host]
+
+    def get_backoff(self, attempt):
+        """
+        exponential backoff with full jitter
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def get(self, url, params=None, stream=False):
+        """
+        perform a GET request, with retries (see class docstring)
+
+        :param str url: url
+        :param dict params: parameters of the request
+        :param bool stream: do not read the body yet (see requests.Response.iter_content)
+
+        :rtype: requests.Response
+        :return: the response (also if the status code indicates an error after the last retry)
+
+        :raises: requests.RequestException if the last attempt failed with a connection error or timeout
+        """
+        host = urlparse(url).netloc
+        session = self.get_session(host)
+        bucket = self.get_bucket(host)
+
+        params = dict(params or {})
+        if self.maxlag is not None and urlparse(url).path.endswith('api.php'):
+            params.setdefault('maxlag', self.maxlag)
+
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                response = session.get(url, params=params, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.get_backoff(attempt)
+                print(f'{e}, retrying {url} in {round(delay, 2)} sec')
+            else:
+                if response.status_code not in RETRY_STATUS_CODES and not is_maxlag_error(response):
+                    return response
+                if attempt >= self.max_retries:
+                    return response
+                response.close()
+
+                delay = get_retry_after(response)
+                if delay is None:
+                    delay = self.get_backoff(attempt)
+                delay = min(delay, self.backoff_max)
+                print(f'status {response.status_code}, retrying {url} in {round(delay, 2)} sec')
+
+            time.sleep(delay)
+            attempt += 1
+
+
+def configure_http_client(**settings):
+    """
+    set the client that is used for all calls to the Wikidata and Wikipedia APIs.
+
+    :param settings: keyword arguments of HttpClient, e.g., from the http_client settings in mwep_settings.json
+
+    :return: the client
+    """
+    global _http_client
+    _http_client = HttpClient(**settings)
+    return _http_client
+
+
+def get_http_client():
+    """
+    :return: the client set by function "configure_http_client" (created with the default settings if none is set)
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = HttpClient()
+    return _http_client
+
+
+def get(url, params=None, stream=False):
+    """
+    perform a GET request with the current client (see HttpClient.get)
+    """
+    return get_http_client().get(url, params, stream=stream)
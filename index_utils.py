@@ -0,0 +1,189 @@
+import json
+import mmap
+import os
+import struct
+
+for_encoding = 'é'
+RECORDS_SUFFIX = '.records'
+OFFSETS_SUFFIX = '.offsets'
+OFFSET_FORMAT = '<Q'
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+
+
+def encode_key(key):
+    """
+    encode a key as it is stored in the records file.
+    JSON escapes tabs and newlines, so they can be used as separators.
+    """
+    return json.dumps(key, ensure_ascii=False).encode('utf-8')
+
+
+def build_sorted_key_index(key_value_pairs, output_path, verbose=0):
+    """
+    write a mapping to disk as a sorted key file with an offset array,
+    which can be searched with a binary search (see class SortedKeyIndex)
+
+    records file: one line per key: JSON(key) TAB JSON(value) NEWLINE, sorted by JSON(key)
+    offsets file: the byte offset of every record as an unsigned 64-bit integer,
+    plus a final one with the size of the records file.
+
+    :param iterable key_value_pairs: iterable of (key, value), e.g., dict.items()
+    :param str output_path: path without extension, e.g., resources/Wikipedia_Reader/wiki_store/page2path
+
+    :rtype: int
+    :return: number of keys
+    """
+    records = sorted((encode_key(key), json.dumps(value, ensure_ascii=False).encode('utf-8'))
+                     for key, value in key_value_pairs)
+
+    output_folder = os.path.dirname(output_path)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+
+    offset = 0
+    with open(f'{output_path}{RECORDS_SUFFIX}', 'wb') as records_file, \
+         open(f'{output_path}{OFFSETS_SUFFIX}', 'wb') as offsets_file:
+        for encoded_key, encoded_value in records:
+            record = b'%s\t%s\n' % (encoded_key, encoded_value)
+            offsets_file.write(struct.pack(OFFSET_FORMAT, offset))
+            records_file.write(record)
+            offset += len(record)
+        offsets_file.write(struct.pack(OFFSET_FORMAT, offset))
+
+    if verbose >= 2:
+        print(f'stored {len(records)} keys in {output_path}{RECORDS_SUFFIX}')
+
+    return len(records)
+
+
+def sorted_key_index_exists(path):
+    """
+    check whether both files of a sorted key index exist
+
+    :param str path: path without extension
+    """
+    return all([os.path.exists(f'{path}{RECORDS_SUFFIX}'),
+                os.path.exists(f'{path}{OFFSETS_SUFFIX}')])
+
+
+class SortedKeyIndex:
+    """
+    Read-only, memory-mapped mapping created by function "build_sorted_key_index".
+    Lookups are binary searches over the offsets array,
+    so only the pages of the files that are needed are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        path = self.path
+        with open(f'{path}{RECORDS_SUFFIX}', 'rb') as infile:
+            self.records = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.path.getsize(f'{path}{RECORDS_SUFFIX}') else b''
+        with open(f'{path}{OFFSETS_SUFFIX}', 'rb') as infile:
+            self.offsets = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.num_keys = len(self.offsets) // OFFSET_SIZE - 1
+
+    def __getstate__(self):
+        # memory maps can not be pickled, e.g., when sent to another process
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.open()
+
+    def __len__(self):
+        return self.num_keys
+
+    def _offset(self, index):
+        return struct.unpack_from(OFFSET_FORMAT, self.offsets, index * OFFSET_SIZE)[0]
+
+    def _find(self, key):
+        """
+        binary search for key
+
+        :rtype: tuple
+        :return: (start, end) of the value in the records file, or None
+        """
+        encoded_key = encode_key(key)
+        low, high = 0, self.num_keys
+        while low < high:
+            middle = (low + high) // 2
+            start = self._offset(middle)
+            separator = self.records.find(b'\t', start)
+            middle_key = self.records[start:separator]
+
+            if middle_key == encoded_key:
+                return separator + 1, self._offset(middle + 1) - 1
+            elif middle_key < encoded_key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __getitem__(self, key):
+        span = self._find(key)
+        if span is None:
+            raise KeyError(key)
+        start, end = span
+        return json.loads(self.records[start:end])
+
+    def get(self, key, default=None):
+        span = self._find(key)
+        if span is None:
+            return default
+        start, end = span
+        return json.loads(self.records[start:end])
+
+    def keys(self):
+        for index in range(self.num_keys):
+            start = self._offset(index)
+            separator = self.records.find(b'\t', start)
+            yield json.loads(self.records[start:separator])
+
+
+class LazySortedKeyIndices:
+    """
+    Mapping from name -> SortedKeyIndex for the indices stored as
+    FOLDER/NAME.records and FOLDER/NAME.offsets.
+    An index is only memory-mapped the first time it is requested
+    and only the names that are passed can be requested.
+    Which indices exist on disk is checked once.
+    """
+
+    def __init__(self, folder, names):
+        self.folder = folder
+        self.names = set(names)
+        self.name2index = {}
+        self._available_names = None
+
+    def __getstate__(self):
+        # indices are memory-mapped again when requested in another process
+        return {'folder': self.folder, 'names': self.names, 'name2index': {}, '_available_names': None}
+
+    def available_names(self):
+        if self._available_names is None:
+            self._available_names = {name
+                                     for name in self.names
+                                     if sorted_key_index_exists(os.path.join(self.folder, name))}
+        return self._available_names
+
+    def __bool__(self):
+        return bool(self.available_names())
+
+    def __contains__(self, name):
+        return name in self.available_names()
+
+    def __getitem__(self, name):
+        if name not in self.name2index:
+            path = os.path.join(self.folder, name)
+            if name not in self.available_names():
+                raise KeyError(name)
+            self.name2index[name] = SortedKeyIndex(path)
+        return self.name2index[name]
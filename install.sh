@@ -16,3 +16,6 @@ wget http://kyoto.let.vu.nl/~postma/dfn/mwep/merged_indices.p
 
 wget http://kyoto.let.vu.nl/~postma/dfn/mwep/Wikipedia_Reader.zip
 unzip Wikipedia_Reader.zip
+
+cd ..
+python build_resources.py --config_path="config/mwep_settings.json" --verbose=1
@@ -1,8 +1,12 @@
+import codecs
 import json
 from collections import defaultdict
 
 for_encoding = 'é'
 
+# maximum number of characters of one binding of SPARQL results (see function "iter_sparql_bindings")
+MAX_BINDING_SIZE = 1024 * 1024
+
 def create_indices_from_bin(datasets, project, json_dir):
 
     inc2doc_file='%s/inc2doc_index.json' % json_dir
@@ -47,3 +51,145 @@ def create_indices_from_bin(datasets, project, json_dir):
         json.dump(new_p2i, f)
     with open(type2inc_file, 'w') as f:
         json.dump(new_t2i, f)
+
+
+class JsonStream:
+    """
+    Reader of JSON text that arrives in chunks (e.g., the body of an HTTP response),
+    which decodes one value at a time, such that the complete text is never held in memory.
+    """
+
+    def __init__(self, chunks, max_value_size=None):
+        """
+        :param iterable chunks: str or bytes (UTF-8) chunks of JSON text
+        :param int max_value_size: maximum number of characters of one value (None: no maximum),
+        such that invalid JSON is detected before the rest of the text has been read into the buffer
+        """
+        self.chunks = iter(chunks)
+        self.utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+        self.max_value_size = max_value_size
+
+    def fill(self):
+        """
+        read the next chunk into the buffer
+
+        :rtype: bool
+        :return: False if there are no more chunks
+        """
+        if self.exhausted:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            chunk = self.utf8_decoder.decode(b'', final=True)
+        elif isinstance(chunk, bytes):
+            chunk = self.utf8_decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        :return: the next character that is not whitespace ('' at the end of the text)
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'expected {char!r} in JSON stream, found {found!r}')
+        self.pos += 1
+
+    def value(self):
+        """
+        decode the next JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.max_value_size is not None and len(self.buffer) - self.pos > self.max_value_size:
+                    raise ValueError(f'no valid JSON value in the next {self.max_value_size} characters')
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.buffer) and self.fill():
+                continue # e.g., a number that continues in the next chunk
+            self.pos = end
+            return value
+
+    def iter_object_keys(self):
+        """
+        iterate over the keys of the object that starts at the current position.
+        After each key, the caller has to read the value (e.g., with method "value").
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def iter_array(self):
+        """
+        iterate over the values of the array that starts at the current position
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def iter_sparql_bindings(chunks, max_binding_size=MAX_BINDING_SIZE):
+    """
+    Parse SPARQL JSON results incrementally, e.g.,
+    {"head": {"vars": ["incident"]}, "results": {"bindings": [{"incident": {"type": "uri", "value": "..."}}]}}
+
+    :param iterable chunks: str or bytes (UTF-8) chunks of the JSON text
+    :param int max_binding_size: see JsonStream (max_value_size)
+
+    :rtype: generator
+    :return: the bindings, one by one
+    """
+    stream = JsonStream(chunks, max_value_size=max_binding_size)
+    found_bindings = False
+    for key in stream.iter_object_keys():
+        if key != 'results':
+            stream.value()
+            continue
+        for results_key in stream.iter_object_keys():
+            if results_key != 'bindings':
+                stream.value()
+                continue
+            found_bindings = True
+            yield from stream.iter_array()
+
+    if stream.peek() != '':
+        raise ValueError('unexpected data after the SPARQL results')
+    if not found_bindings:
+        raise ValueError('no SPARQL bindings found in the response')
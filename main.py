@@ -8,7 +8,10 @@ Usage:
    --path_mapping_wd_to_sem=<path_mapping_wd_to_sem>\
    --languages=<languages>\
    --wikipedia_sources=<wikipedia_sources>\
-   --verbose=<verbose>
+   --verbose=<verbose>\
+   [--workers=<workers>]\
+   [--refresh-sparql]\
+   [--resume | --clean]
 
 Options:
     --config_path=<config_path>
@@ -18,6 +21,10 @@ Options:
     --languages=<languages> languages separated by -, e.g., "nl-it-en"
     --wikipedia_sources=<wikipedia_sources> if "True", crawl Wikipedia sources
     --verbose=<verbose> 0 --> no stdout 1 --> general stdout 2 --> detailed stdout
+    --workers=<workers>  number of processes to convert texts to NAF (each loads its own spaCy models) [default: 1]
+    --refresh-sparql  run all SPARQL queries again instead of using the cached results (the new results are cached)
+    --resume  continue an interrupted run: skip the event types, stages, and NAF files that were completed (see checkpoint_folder in the settings)
+    --clean  remove the NAF, RDF, BIN, JSON, and checkpoint folders before the run. Without --resume or --clean, nothing is removed and all work is done again.
 
 Example:
     python main.py --config_path="config_test/mwep_settings.json"\
@@ -26,7 +33,8 @@ Example:
     --path_mapping_wd_to_sem="wdt_fn_mappings/any.json"\
     --languages="nl-en"\
     --wikipedia_sources="False"\
-    --verbose=1
+    --verbose=1\
+    --workers=4
 
 python query_test.py --config_path="config/mwep_settings.json" --project="pilot" --path_event_types="config/event_types.txt" --path_mapping_wd_to_sem="wdt_fn_mappings/any.json" --languages="nl-en" --wikipedia_sources="True" --verbose=1
 
@@ -35,14 +43,17 @@ import json
 import os
 import pickle
 import time
+from collections import defaultdict
 from datetime import datetime
+from functools import partial
 
-import pandas as pd
-import spacy
 from tqdm import tqdm
 
+import cache_utils
+import checkpoint_utils
 import classes
 import crawl_utils
+import http_utils
 import json_utils
 import xml_utils
 import native_api_utils
@@ -54,26 +65,29 @@ for_encoding = 'é'
 
 def add_wikipedia_pages_from_api(incidents, wdt_ids):
     assert (len(wdt_ids) > 0)
-    id_batches = utils.split_in_batches(wdt_ids, 50)
-
-    for index, batch in enumerate(id_batches):
-        wiki_pages = native_api_utils.obtain_wiki_page_titles(batch, languages)
-        for incident in incidents:
-            if incident.wdt_id in wiki_pages.keys():
-                incident_wikipedia = wiki_pages[incident.wdt_id]
-                for language, name in incident_wikipedia.items():
-                    found = False
-                    for rt in incident.reference_texts:
-                        if rt.name == name and rt.language == language:
-                            rt.found_by.append('API')
-                            found = True
-                    if not found:
-                        ref_text = classes.ReferenceText(
-                            name=name,
-                            language=language,
-                            found_by=['API']
-                        )
-                        incident.reference_texts.append(ref_text)
+    wiki_pages = native_api_utils.obtain_wiki_page_titles_batch(wdt_ids, languages, verbose=2)
+
+    id2incidents = defaultdict(list)
+    for incident in incidents:
+        id2incidents[incident.wdt_id].append(incident)
+
+    for wdt_id, incident_wikipedia in wiki_pages.items():
+        for incident in id2incidents.get(wdt_id, []):
+            language_name2ref_texts = defaultdict(list)
+            for rt in incident.reference_texts:
+                language_name2ref_texts[(rt.language, rt.name)].append(rt)
+
+            for language, name in incident_wikipedia.items():
+                if (language, name) in language_name2ref_texts:
+                    for rt in language_name2ref_texts[(language, name)]:
+                        rt.found_by.append('API')
+                else:
+                    ref_text = classes.ReferenceText(
+                        name=name,
+                        language=language,
+                        found_by=['API']
+                    )
+                    incident.reference_texts.append(ref_text)
     return incidents
 
 def retrieve_incidents_per_participant(type_qid,
@@ -139,7 +153,9 @@ def retrieve_incidents_per_participant(type_qid,
 def retrieve_incidents_per_type(type_qid,
                                 event_type_matching,
                                 json_wd_to_sem,
-                                limit=10):
+                                limit=10,
+                                partitioning=None,
+                                stream=False):
     """
     Given an event type identifier, retrieve incidents that belong to this type.
     """
@@ -152,7 +168,9 @@ def retrieve_incidents_per_type(type_qid,
                                                   event_type_matching,
                                                   languages,
                                                   wdt_fn_mappings_COL,
-                                                  limit)
+                                                  limit,
+                                                  partitioning=partitioning,
+                                                  stream=stream)
     wdt_ids = []
     if not len(results_by_id.items()):
         return [], ''
@@ -197,23 +215,23 @@ def retrieve_incidents_per_type(type_qid,
     return incidents
 
 
-def obtain_reference_texts(incidents, wiki_folder, wiki_uri2path_info, language2info):
+def obtain_reference_texts(incidents, wiki_folder, wiki_uri2path_info, language2info, wiki_store_folder=None):
     print(
         '\n### 3. ### Retrieve reference text information: text and entity annotations from the local version of Wikipedia.')
+    title_language_pairs = [(ref_text.name, ref_text.language)
+                            for incident in incidents
+                            for ref_text in incident.reference_texts]
+    title_language2page_info = wu.load_wiki_pages_info(title_language_pairs,
+                                                       language2info,
+                                                       wiki_folder,
+                                                       wiki_uri2path_info,
+                                                       wiki_store_folder=wiki_store_folder)
+
     new_incidents = []
     for incident in tqdm(incidents):
         new_reference_texts = []
         for ref_text in incident.reference_texts:
-            language = ref_text.language
-            wiki_title = ref_text.name
-
-            prefix = language2info[ref_text.language]['prefix']
-
-            text, annotations, success, reason = wu.load_wiki_page_info(wiki_title,
-                                                                        prefix,
-                                                                        language,
-                                                                        wiki_folder,
-                                                                        wiki_uri2path_info)
+            text, annotations, success, reason = title_language2page_info[(ref_text.name, ref_text.language)]
 
             if success:
                 ref_text.annotations = annotations
@@ -230,9 +248,14 @@ def obtain_reference_texts(incidents, wiki_folder, wiki_uri2path_info, language2
 
 
 def get_primary_rt_links(incidents):
-    for incident in tqdm(incidents):
+    title_language_pairs = {(ref_text.name, ref_text.language)
+                            for incident in incidents
+                            for ref_text in incident.reference_texts}
+    title_language2links = native_api_utils.obtain_primary_rt_links_batch(title_language_pairs,
+                                                                          verbose=2)
+    for incident in incidents:
         for ref_text in incident.reference_texts:
-            ext_links = native_api_utils.obtain_primary_rt_links(ref_text.name, ref_text.language)
+            ext_links = title_language2links.get((ref_text.name, ref_text.language))
             if ext_links:
                 ref_text.primary_ref_texts = ext_links
     return incidents
@@ -256,6 +279,7 @@ if __name__ == '__main__':
     crawl_wikipedia_sources = arguments['--wikipedia_sources'] == "True"
     max_pilot_incidents = mwep_settings['max_pilot_incidents']
     verbose = int(arguments['--verbose'])
+    workers = int(arguments['--workers'])
 
     # settings for crawling Wikipedia sources
     excluded_domains = set(mwep_settings['newsplease']['excluded_domains'])
@@ -268,8 +292,13 @@ if __name__ == '__main__':
     timeout = mwep_settings['newsplease']['timeout']
     illegal_substrings = mwep_settings['newsplease']['illegal_substrings']
     illegal_chars_in_title = mwep_settings['newsplease']['illegal_chars_in_title']
+    crawl_workers = mwep_settings['newsplease']['max_workers']
+    max_connections_per_domain = mwep_settings['newsplease']['max_connections_per_domain']
+    requests_per_second_per_domain = mwep_settings['newsplease']['requests_per_second_per_domain']
+    min_urls_per_domain_query = mwep_settings['newsplease']['min_urls_per_domain_query']
 
     wiki_folder = mwep_settings['wiki_folder']
+    wiki_store_folder = mwep_settings['wiki_store_folder']
     naf_output_folder = mwep_settings['naf_output_folder']
     rdf_folder = mwep_settings['rdf_folder']
     bin_folder = mwep_settings['bin_folder']
@@ -280,18 +309,33 @@ if __name__ == '__main__':
 
     project = arguments['--project']
 
-    utils.remove_and_create_folder(rdf_folder)
-    utils.remove_and_create_folder(naf_output_folder)
-    utils.remove_and_create_folder(bin_folder)
-    utils.remove_and_create_folder(json_folder)
+    checkpoint_folder = mwep_settings['checkpoint_folder']
 
-    print('NAF, RDF, JSON, and BIN directories have been re-created')
+    checkpoint_utils.prepare_folders([rdf_folder, naf_output_folder, bin_folder, json_folder, checkpoint_folder],
+                                     clean=arguments['--clean'])
+
+    if arguments['--clean']:
+        print('NAF, RDF, JSON, BIN, and checkpoint directories have been re-created')
+
+    # progress per event type, used to skip completed work with --resume
+    fingerprint = checkpoint_utils.get_fingerprint(languages=arguments['--languages'],
+                                                   path_mapping_wd_to_sem=json_wd_to_sem,
+                                                   event_type_matching=event_type_matching,
+                                                   wikipedia_sources=crawl_wikipedia_sources,
+                                                   max_pilot_incidents=max_pilot_incidents,
+                                                   processing=mwep_settings['processing'],
+                                                   folders=[rdf_folder, naf_output_folder, bin_folder])
+    manifest = checkpoint_utils.RunManifest(checkpoint_folder,
+                                            fingerprint,
+                                            resume=arguments['--resume'],
+                                            verbose=verbose)
+
+    print('Checkpoint manifest:', manifest.path)
 
     # load index and language info
-    path_uri2path_info = os.path.join(wiki_folder, 'page2path.p')
-    print(path_uri2path_info)
-    with open(path_uri2path_info, 'rb') as infile:
-        wiki_uri2path_info = pickle.load(infile)  # make take some time
+    wiki_uri2path_info = wu.load_page2path_index(wiki_folder,
+                                                 wiki_store_folder,
+                                                 verbose=1)
 
     language_info_path = os.path.join(wiki_folder, 'language2info.json')
     with open(language_info_path, 'r')  as infile:
@@ -300,17 +344,51 @@ if __name__ == '__main__':
     print("Wikipedia indices loaded")
 
     wiki_langlinks_path = mwep_settings['wiki_langlinks_path']
-    with open(wiki_langlinks_path, 'rb') as infile:
-        wiki_langlinks = pickle.load(infile)
+    wiki_langlinks_folder = mwep_settings['wiki_langlinks_folder']
+    wiki_langlinks = wu.load_wiki_langlinks(wiki_langlinks_path,
+                                            wiki_langlinks_folder,
+                                            arguments['--languages'].split('-'),
+                                            verbose=1)
 
     print('Wikipedia parallel titles loaded')
 
-    # load spaCy models
+    # client (connection pooling, retries, rate limiting) and cache for the Wikidata and Wikipedia APIs
+    http_utils.configure_http_client(**mwep_settings['http_client'])
+    http_cache_settings = mwep_settings['http_cache']
+    http_cache = cache_utils.configure_http_cache(folder=http_cache_settings['folder'],
+                                                  ttl=http_cache_settings['ttl'],
+                                                  max_size_mb=http_cache_settings['max_size_mb'],
+                                                  offline=http_cache_settings['offline'])
+
+    print('HTTP cache configured:', http_cache.path)
+
+    sparql_cache_settings = mwep_settings['sparql_cache']
+    sparql_cache = cache_utils.configure_sparql_cache(folder=sparql_cache_settings['folder'],
+                                                      ttl=sparql_cache_settings['ttl'],
+                                                      max_size_mb=sparql_cache_settings['max_size_mb'],
+                                                      offline=http_cache_settings['offline'],
+                                                      refresh=arguments['--refresh-sparql'])
+
+    print('SPARQL cache configured:', sparql_cache.path)
+
+    crawl_cache_settings = mwep_settings['crawl_cache']
+    crawl_cache = cache_utils.configure_crawl_cache(folder=crawl_cache_settings['folder'],
+                                                    ttl=crawl_cache_settings['ttl'],
+                                                    max_size_mb=crawl_cache_settings['max_size_mb'],
+                                                    offline=http_cache_settings['offline'])
+
+    print('Crawl cache configured:', crawl_cache.path)
+
+    # load spaCy models (one spaCy-to-NAF converter per language)
     spacy_models = mwep_settings['spacy_models']
-    models = {}
-    for model_info in spacy_models.split(';'):
-        language, model_name = model_info.split('-')
-        models[language] = spacy.load(model_name)
+    spacy_batch_size = mwep_settings['spacy_batch_size']
+    spacy_n_process = mwep_settings['spacy_n_process']
+    converters = {}
+    if workers == 1: # else every worker loads its own models
+        converters = pilot_utils.load_converters(spacy_models,
+                                                 languages=arguments['--languages'].split('-'))
+    else: # fail before crawling if the langlinks can not be shared with the workers
+        pilot_utils.get_worker_langlinks(wiki_langlinks)
 
     print("Spacy models have been loaded.")
 
@@ -335,36 +413,63 @@ if __name__ == '__main__':
         print('----- INCIDENT TYPE: %s -----' % incident_type_uri)
         print('\n\n')
 
-        start = time.time()
+        output_file = utils.make_output_filename(bin_folder,
+                                                 incident_type_uri,
+                                                 languages)
+        ttl_filename = '%s/%s_%s.ttl' % (rdf_folder, incident_type_uri, '_'.join(languages))
+        pilot_output_file = utils.make_output_filename(bin_folder, incident_type_uri, pilot_and_languages)
+        pilot_ttl_filename = '%s/%s_%s_pilot.ttl' % (rdf_folder, incident_type_uri, '_'.join(pilot_and_languages))
 
-        # Query SPARQL and the API to get incidents, their properties, and labels.
-        incidents = retrieve_incidents_per_type(incident_type_uri,
-                                                event_type_matching,
-                                                json_wd_to_sem,
-                                                99999)
+        if manifest.is_stage_done(incident_type_uri, 'no_incidents'):
+            print('No incidents found for %s in a previous run. Continuing to next type...' % incident_type_uri)
+            continue
 
-        if not len(incidents):
-            print('NO INCIDENTS FOUND FOR %s. Continuing to next type...')
+        if manifest.is_stage_done(incident_type_uri, 'done', paths=[pilot_output_file, pilot_ttl_filename]):
+            print('%s was completed in a previous run. Continuing to next type...' % incident_type_uri)
+            with open(pilot_output_file, 'rb') as infile:
+                pilot_collections.append(pickle.load(infile))
+            all_inc_stats.append(manifest.get_stage_info(incident_type_uri, 'done')['inc_stats'])
             continue
 
-        new_incidents = obtain_reference_texts(incidents, wiki_folder, wiki_uri2path_info, language2info)
+        start = time.time()
+
+        if manifest.is_stage_done(incident_type_uri, 'incidents', paths=[output_file, ttl_filename]):
+            print('Incidents and reference texts of a previous run loaded from', output_file)
+            with open(output_file, 'rb') as infile:
+                collection = pickle.load(infile)
+        else:
+            # Query SPARQL and the API to get incidents, their properties, and labels.
+            incidents = retrieve_incidents_per_type(incident_type_uri,
+                                                    event_type_matching,
+                                                    json_wd_to_sem,
+                                                    99999,
+                                                    partitioning=mwep_settings['sparql_partitioning'],
+                                                    stream=mwep_settings['sparql_streaming'])
 
-        collection = classes.IncidentCollection(incidents=new_incidents,
-                                                incident_type=incident_type,
-                                                incident_type_uri=incident_type_uri,
-                                                languages=languages)
+            if not len(incidents):
+                print('NO INCIDENTS FOUND FOR %s. Continuing to next type...')
+                manifest.mark_stage_done(incident_type_uri, 'no_incidents')
+                continue
 
-        output_file = utils.make_output_filename(bin_folder,
-                                                 incident_type_uri,
-                                                 languages)
+            new_incidents = obtain_reference_texts(incidents,
+                                                   wiki_folder,
+                                                   wiki_uri2path_info,
+                                                   language2info,
+                                                   wiki_store_folder=wiki_store_folder)
 
-        with open(output_file, 'wb') as of:
-            pickle.dump(collection, of)
+            collection = classes.IncidentCollection(incidents=new_incidents,
+                                                    incident_type=incident_type,
+                                                    incident_type_uri=incident_type_uri,
+                                                    languages=languages)
 
-        inc_stats.append(len(collection.incidents))
+            with open(output_file, 'wb') as of:
+                pickle.dump(collection, of)
 
-        ttl_filename = '%s/%s_%s.ttl' % (rdf_folder, incident_type_uri, '_'.join(languages))
-        collection.serialize(ttl_filename)
+            collection.serialize(ttl_filename)
+
+            manifest.mark_stage_done(incident_type_uri, 'incidents')
+
+        inc_stats.append(len(collection.incidents))
 
         after_extraction = time.time()
 
@@ -375,7 +480,8 @@ if __name__ == '__main__':
                                                mwep_settings['processing']["one_page_per_language"])
 
         if len(pilots) > max_pilot_incidents:
-            pilots = list(pilots)[:max_pilot_incidents]
+            # sorted, so that a resumed run selects the same incidents
+            pilots = sorted(pilots, key=lambda incident: incident.wdt_id)[:max_pilot_incidents]
             print(f'selected first {max_pilot_incidents} pilot incidents')
 
         after_pilot_selection = time.time()
@@ -402,6 +508,38 @@ if __name__ == '__main__':
         else:
             print('start pilot data processing', datetime.now())
 
+        # Wikidata information to add to NAF (entities and coreferences layer)
+        wikidata_enrichment = xml_utils.get_wikidata_enrichment(inc_coll_obj=collection,
+                                                                languages=accepted_languages,
+                                                                verbose=2)
+
+        # NAF files that were stored in a previous run
+        done_documents = manifest.get_done_documents(incident_type_uri)
+
+        # crawl the primary text urls of all pilot incidents at once (concurrently)
+        primary_url_to_ref_text_obj = {}
+        if crawl_wikipedia_sources:
+            all_primary_text_urls = {primary_text_url
+                                     for incident_obj in pilot_collection.incidents
+                                     for ref_text_obj in incident_obj.reference_texts
+                                     for primary_text_url in ref_text_obj.primary_ref_texts}
+            print("number of urls to reference texts:", len(all_primary_text_urls))
+            primary_url_to_ref_text_obj = crawl_utils.get_ref_text_obj_of_primary_reference_texts(all_primary_text_urls,
+                                                                                                  timeout,
+                                                                                                  startswith=startswith,
+                                                                                                  accepted_languages=accepted_languages,
+                                                                                                  excluded_domains=excluded_domains,
+                                                                                                  title_required=True,
+                                                                                                  num_chars_range=num_chars_range,
+                                                                                                  illegal_substrings=illegal_substrings,
+                                                                                                  illegal_chars_in_title=illegal_chars_in_title,
+                                                                                                  max_workers=crawl_workers,
+                                                                                                  max_connections_per_domain=max_connections_per_domain,
+                                                                                                  requests_per_second_per_domain=requests_per_second_per_domain,
+                                                                                                  min_urls_per_domain_query=min_urls_per_domain_query,
+                                                                                                  verbose=verbose)
+
+        naf_inputs = []
         for incident_obj in pilot_collection.incidents:
 
             # add primary text urls
@@ -409,29 +547,14 @@ if __name__ == '__main__':
                 primary_text_urls = {primary_text_url
                                      for ref_text_obj in incident_obj.reference_texts
                                      for primary_text_url in ref_text_obj.primary_ref_texts}
-                print("number of urls to reference texts:", len(primary_text_urls))
-                primary_url_to_ref_text_obj = crawl_utils.get_ref_text_obj_of_primary_reference_texts(primary_text_urls,
-                                                                                                      timeout,
-                                                                                                      startswith=startswith,
-                                                                                                      accepted_languages=accepted_languages,
-                                                                                                      excluded_domains=excluded_domains,
-                                                                                                      title_required=True,
-                                                                                                      num_chars_range=num_chars_range,
-                                                                                                      illegal_substrings=illegal_substrings,
-                                                                                                      illegal_chars_in_title=illegal_chars_in_title,
-                                                                                                      verbose=verbose)
-
-                for url, primary_ref_text_obj in primary_url_to_ref_text_obj.items():
-                    incident_obj.reference_texts.append(primary_ref_text_obj)
-
-            # process with spaCy
+
+                for url in primary_text_urls:
+                    if url in primary_url_to_ref_text_obj:
+                        incident_obj.reference_texts.append(primary_url_to_ref_text_obj[url])
+
+            # collect texts to process with spaCy
             for ref_text_obj in incident_obj.reference_texts:
-                wiki_title = ref_text_obj.name
                 language = ref_text_obj.language
-                annotations = ref_text_obj.annotations
-                text = ref_text_obj.content
-                uri = ref_text_obj.uri
-
                 prefix = language2info[language]['prefix']
 
                 # dct of document
@@ -446,31 +569,46 @@ if __name__ == '__main__':
 
                 print(ref_text_obj.name, ref_text_obj.uri, ref_text_obj.found_by, dct)
 
-                nlp = models[language]
-
-                pilot_utils.text_to_naf(wiki_title,
-                                        languages,
-                                        text,
-                                        uri,
-                                        annotations,
-                                        prefix,
-                                        language,
-                                        nlp,
-                                        dct,
-                                        output_folder=naf_output_folder,
-                                        wiki_langlinks=wiki_langlinks)
-
-        out_file = utils.make_output_filename(bin_folder, incident_type_uri, pilot_and_languages)
-
-        with open(out_file, 'wb') as of:
+                if pilot_utils.get_naf_path(naf_output_folder, language, ref_text_obj.name) in done_documents:
+                    print('NAF file stored in a previous run, skipping')
+                    continue
+
+                naf_inputs.append(pilot_utils.NafInput(wiki_title=ref_text_obj.name,
+                                                       text=ref_text_obj.content,
+                                                       wiki_uri=ref_text_obj.uri,
+                                                       annotations=ref_text_obj.annotations,
+                                                       prefix=prefix,
+                                                       language=language,
+                                                       dct=dct,
+                                                       inc_id=f'{utils.WIKIDATA_PREFIX}{incident_obj.wdt_id}'))
+
+        # process with spaCy (in batches per language or in parallel processes)
+        if workers > 1:
+            naf_results, naf_failures = pilot_utils.texts_to_naf_parallel(naf_inputs,
+                                                                          languages,
+                                                                          spacy_models,
+                                                                          workers,
+                                                                          output_folder=naf_output_folder,
+                                                                          wiki_langlinks=wiki_langlinks,
+                                                                          wikidata_enrichment=wikidata_enrichment,
+                                                                          on_stored=partial(manifest.mark_document_done,
+                                                                                            incident_type_uri),
+                                                                          verbose=verbose)
+        else:
+            pilot_utils.texts_to_naf(naf_inputs,
+                                     languages,
+                                     converters,
+                                     output_folder=naf_output_folder,
+                                     wiki_langlinks=wiki_langlinks,
+                                     wikidata_enrichment=wikidata_enrichment,
+                                     batch_size=spacy_batch_size,
+                                     n_process=spacy_n_process,
+                                     on_stored=partial(manifest.mark_document_done, incident_type_uri),
+                                     verbose=verbose)
+
+        with open(pilot_output_file, 'wb') as of:
             pickle.dump(pilot_collection, of)
 
-        # add Wikidata information to NAF (entities and coreferences layer)
-        xml_utils.add_wikidata_uris_to_naf_files(inc_coll_obj=collection,
-                                                 main_naf_folder=mwep_settings['naf_output_folder'],
-                                                 languages=accepted_languages,
-                                                 verbose=2)
-
         inc_stats.append(len(pilot_collection.incidents))
 
         #Piek: this should be done here instead of before getting the reference text. Reason: the reference text function modify "pilot_collection".
@@ -478,8 +616,7 @@ if __name__ == '__main__':
 
         pilot_collections.append(pilot_collection)
 
-        ttl_filename = '%s/%s_%s_pilot.ttl' % (rdf_folder, incident_type_uri, '_'.join(pilot_and_languages))
-        pilot_collection.serialize(ttl_filename)
+        pilot_collection.serialize(pilot_ttl_filename)
         #Piek
 
 
@@ -493,13 +630,20 @@ if __name__ == '__main__':
 
         all_inc_stats.append(inc_stats)
 
+        manifest.mark_stage_done(incident_type_uri, 'done', inc_stats=inc_stats)
+
     json_utils.create_indices_from_bin(pilot_collections, project, json_folder)
 
     headers = ['Type', 'Languages', '#incidents', '#pilot incidents', 'Time to extract incidents+RTs',
                'Time to select pilot data', 'Time to get primary RT links',
                'Time to run spacy, enrich, and store to NAF+RDF', 'Total time']
 
+    import pandas as pd
+
     df = pd.DataFrame(all_inc_stats, columns=headers)
     print(df.to_csv(index=False))
 
-    print('TOTAL TIME TO RUN THE SCRIPT for', event_types, ':', utils.format_time(end - start_init), 'sec')
+    print('TOTAL TIME TO RUN THE SCRIPT for', event_types, ':', utils.format_time(time.time() - start_init), 'sec')
+    print('HTTP cache statistics:', http_cache.stats())
+    print('SPARQL cache statistics:', sparql_cache.stats())
+    print('Crawl cache statistics:', crawl_cache.stats())
@@ -1,11 +1,13 @@
+import asyncio
+import re
 from collections import defaultdict
 
+import cache_utils
 import utils
 
-import requests
-
 for_encoding = 'é'
 WIKIDATA_PREFIX = 'http://www.wikidata.org/entity/'
+WIKIDATA_ID_PATTERN = re.compile(r'^[QPL][1-9][0-9]*$')
 
 def obtain_date_of_creation(titles, language):
     """
@@ -23,8 +25,7 @@ def obtain_date_of_creation(titles, language):
             'format': 'json'
             }
     url='https://%s.wikipedia.org/w/api.php?' % language
-    r=requests.get(url, params=params)
-    json_response=r.json()
+    json_response=cache_utils.get_json(url, params)
     for page_id, page_info in json_response['query']['pages'].items():
         dates[page_info['title']]=page_info['revisions'][0]['timestamp']
 
@@ -45,8 +46,7 @@ def obtain_contributors(titles, language):
             'format': 'json'
             }
     url='https://%s.wikipedia.org/w/api.php?' % language
-    r=requests.get(url, params=params)
-    json_response=r.json()
+    json_response=cache_utils.get_json(url, params)
     for page_id, page_info in json_response['query']['pages'].items():
         c=[]
         for contributor in page_info['contributors']:
@@ -54,8 +54,13 @@ def obtain_contributors(titles, language):
         contributors[page_info['title']]=c
     return contributors
 
-def obtain_wiki_page_titles(wdt_ids, languages, verbose=0):
-    """Obtain Wikipedia page titles from a set of Wikidata IDs."""
+def obtain_sitelinks(wdt_ids, languages, verbose=0):
+    """
+    Obtain the Wikipedia page titles of at most 50 Wikidata IDs with one request.
+
+    :rtype: dict
+    :return: Wikidata ID -> {language: title} for every entity in the response (also without sitelinks)
+    """
     ids_filter='|'.join(wdt_ids)
     languages_filter='|'.join(list(map(lambda x: x + 'wiki', languages)))
     params={
@@ -72,8 +77,7 @@ def obtain_wiki_page_titles(wdt_ids, languages, verbose=0):
         print(url)
         print(params)
 
-    r=requests.get(url, params=params)
-    j=r.json()
+    j=cache_utils.get_json(url, params)
 
     if verbose >= 4:
         print(j)
@@ -83,13 +87,113 @@ def obtain_wiki_page_titles(wdt_ids, languages, verbose=0):
     if 'entities' in j.keys():
         for id, id_data in j['entities'].items():
             results_one={}
-            sitelinks=id_data['sitelinks']
+            sitelinks=id_data.get('sitelinks', {})
             for sitelink, data in sitelinks.items():
                 results_one[data['site'][:2]]=data['title']
-            if len(results_one.keys()):
-                results_batch[id]=results_one
+            results_batch[id]=results_one
     return results_batch
 
+def obtain_wiki_page_titles(wdt_ids, languages, verbose=0):
+    """Obtain Wikipedia page titles from a set of Wikidata IDs."""
+    results_batch={}
+    for id, results_one in obtain_sitelinks(wdt_ids, languages, verbose=verbose).items():
+        if len(results_one.keys()):
+            results_batch[id]=results_one
+    return results_batch
+
+def obtain_wiki_page_titles_batch(wdt_ids, languages, max_concurrency=4, batch_size=50, verbose=0):
+    """
+    Obtain Wikipedia page titles for many Wikidata IDs.
+    The sitelinks are cached per Wikidata ID (see cache_utils.get_items);
+    the IDs that are not cached are queried in batches of batch_size IDs,
+    with at most max_concurrency simultaneous requests.
+
+    :param iterable wdt_ids: Wikidata IDs, e.g., ['Q76', 'Q37079']
+    :param iterable languages: e.g., ['en', 'nl']
+
+    :rtype: dict
+    :return: Wikidata ID -> {language: title} (only for IDs with at least one sitelink)
+    """
+    languages=sorted(languages)
+    endpoint='wbgetentities/sitelinks/%s' % '|'.join(languages)
+
+    def fetch_sitelinks(missing_ids):
+        batches=list(utils.split_in_batches(missing_ids, batch_size))
+        if verbose >= 2:
+            print(f'querying the sitelinks of {len(missing_ids)} Wikidata IDs in {len(batches)} batches')
+        id2sitelinks={}
+        for batch_result in asyncio.run(gather_in_threads(obtain_sitelinks,
+                                                          [(batch, languages) for batch in batches],
+                                                          max_concurrency)):
+            id2sitelinks.update(batch_result)
+        return id2sitelinks
+
+    id2sitelinks=cache_utils.get_items(endpoint, sorted(set(wdt_ids)), fetch_sitelinks)
+
+    results={}
+    for id, results_one in id2sitelinks.items():
+        if len(results_one.keys()):
+            results[id]=results_one
+    return results
+
+def obtain_labels(wdt_ids, language='en'):
+    """
+    Obtain the labels of at most 50 Wikidata IDs with one request.
+
+    :rtype: dict
+    :return: Wikidata ID -> label ('' if there is no label in the language) for every entity in the response
+    """
+    params={
+            'action': 'wbgetentities',
+            'props': 'labels',
+            'ids': '|'.join(wdt_ids),
+            'languages': language,
+            'format': 'json'
+            }
+    url='https://www.wikidata.org/w/api.php?'
+
+    j=cache_utils.get_json(url, params)
+
+    labels={}
+    if 'entities' in j.keys():
+        for id, id_data in j['entities'].items():
+            requested_id=id_data.get('redirects', {}).get('from', id)
+            label=id_data.get('labels', {}).get(language, {}).get('value', '')
+            labels[requested_id]=label
+    else:
+        print('Error obtaining labels', j.get('error'))
+    return labels
+
+def obtain_labels_batch(wdt_ids, language='en', max_concurrency=4, batch_size=50, verbose=0):
+    """
+    Obtain the labels of many Wikidata IDs.
+    The labels are cached per Wikidata ID (see cache_utils.get_items);
+    the IDs that are not cached are queried in batches of batch_size IDs,
+    with at most max_concurrency simultaneous requests.
+
+    :param iterable wdt_ids: Wikidata IDs, e.g., ['Q76', 'Q37079']
+    :param str language: language of the labels
+
+    :rtype: dict
+    :return: Wikidata ID -> label ('' if the entity has no label in the language)
+    """
+    valid_ids=sorted({wdt_id for wdt_id in wdt_ids if WIKIDATA_ID_PATTERN.match(wdt_id)})
+    endpoint='wbgetentities/labels/%s' % language
+
+    def fetch_labels(missing_ids):
+        batches=list(utils.split_in_batches(missing_ids, batch_size))
+        if verbose >= 2:
+            print(f'querying the labels of {len(missing_ids)} Wikidata IDs in {len(batches)} batches')
+        id2label={}
+        for batch_result in asyncio.run(gather_in_threads(obtain_labels,
+                                                          [(batch, language) for batch in batches],
+                                                          max_concurrency)):
+            id2label.update(batch_result)
+        return id2label
+
+    id2label=cache_utils.get_items(endpoint, valid_ids, fetch_labels)
+    return {wdt_id: id2label.get(wdt_id, '') for wdt_id in wdt_ids}
+
 def filter_langlinks(a_list, other_l):
     """Filter the langlinks based on a list of languages of interest."""
     a_dict={}
@@ -109,120 +213,323 @@ def adapt_extlinks(a_list):
     
 def obtain_results_from_api(url, params):
     try:
-        r=requests.get(url, params=params)
+        j=cache_utils.get_json(url, params)
     except:
         print('Error with wikipage', url, params)
         return {}
-    j=r.json()
-    if 'batchcomplete' not in j.keys() and 'parse' not in j.keys():
-        print(r.request.url)
+    if 'batchcomplete' not in j.keys() and 'continue' not in j.keys() and 'parse' not in j.keys():
+        print(url, params)
     return j
 
-def obtain_primary_rt_links(title, lang):
+def query_with_continuation(url, params):
+    """
+    Perform a MediaWiki API query and follow the continuation until the result is complete.
+
+    :param str url: API endpoint
+    :param dict params: parameters of the query
+
+    :rtype: generator
+    :return: the JSON responses, one per request
+    """
+    params=dict(params)
+    while True:
+        j=obtain_results_from_api(url, params)
+        yield j
+        if 'continue' not in j.keys():
+            break
+        params.update(j['continue'])
+
+def map_pages_to_requested_titles(query_part, titles):
+    """
+    Map the titles of the returned pages back to the requested titles,
+    using the normalization and redirect maps of the response.
 
+    :param dict query_part: the 'query' part of a MediaWiki API response
+    :param iterable titles: the requested titles
+
+    :rtype: dict
+    :return: page title -> list of requested titles
+    """
+    normalized={n['from']: n['to'] for n in query_part.get('normalized', [])}
+    redirects={r['from']: r['to'] for r in query_part.get('redirects', [])}
+    page2titles=defaultdict(list)
+    for title in titles:
+        page_title=normalized.get(title, title)
+        page_title=redirects.get(page_title, page_title)
+        page2titles[page_title].append(title)
+    return page2titles
+
+def obtain_extlinks_batch(titles, lang):
+    """
+    Obtain the external links of at most 50 Wikipedia pages with one query (and its continuation).
+
+    :param list titles: page titles
+    :param str lang: language of the Wikipedia
+
+    :rtype: dict
+    :return: requested title -> list of external links (only for titles with external links)
+    """
     params_extlinks={
             'format': 'json',
             'action': 'query',
             'prop': 'extlinks',
-            'titles': title,
+            'titles': '|'.join(titles),
             'redirects': True,
             'ellimit': 500
             }
 
     url='https://%s.wikipedia.org/w/api.php?' % lang
 
-    j_el=obtain_results_from_api(url, params_extlinks)
-    if 'query' not in j_el.keys(): 
-        print('no query for this page')
-        return []
+    page2titles={}
+    page2extlinks=defaultdict(list)
+    for j_el in query_with_continuation(url, params_extlinks):
+        if 'query' not in j_el.keys():
+            print('no query for these pages', lang, titles)
+            break
+        if not page2titles:
+            page2titles=map_pages_to_requested_titles(j_el['query'], titles)
+
+        for page_id, page_info in j_el['query']['pages'].items():
+            if 'missing' in page_info or 'invalid' in page_info: continue
+
+            if 'extlinks' in page_info.keys():
+                page2extlinks[page_info['title']].extend(adapt_extlinks(page_info['extlinks']))
+
+    title2extlinks={}
+    for page_title, els in page2extlinks.items():
+        for title in page2titles.get(page_title, [page_title]):
+            title2extlinks[title]=els
+    return title2extlinks
+
+async def gather_in_threads(function, args_list, max_concurrency):
+    """
+    Call a (blocking) function for every tuple of arguments in worker threads,
+    with at most max_concurrency simultaneous calls.
+
+    :rtype: list
+    :return: the results, in the order of args_list
+    """
+    semaphore=asyncio.Semaphore(max_concurrency)
+
+    async def call_one(args):
+        async with semaphore:
+            return await asyncio.to_thread(function, *args)
+
+    return await asyncio.gather(*[call_one(args) for args in args_list])
+
+async def obtain_extlinks_of_language(titles, lang, max_concurrency, batch_size=50):
+    """
+    Obtain the external links of Wikipedia pages of one language,
+    with at most max_concurrency simultaneous requests to the Wikipedia of that language.
+    """
+    batches=list(utils.split_in_batches(sorted(titles), batch_size))
+    title2extlinks={}
+    for batch_result in await gather_in_threads(obtain_extlinks_batch,
+                                                [(batch, lang) for batch in batches],
+                                                max_concurrency):
+        title2extlinks.update(batch_result)
+    return title2extlinks
+
+async def obtain_extlinks_of_languages(lang2titles, max_concurrency, batch_size=50):
+    lang_results=await asyncio.gather(*[obtain_extlinks_of_language(titles, lang, max_concurrency, batch_size)
+                                        for lang, titles in lang2titles.items()])
+    title_language2extlinks={}
+    for lang, title2extlinks in zip(lang2titles.keys(), lang_results):
+        for title, els in title2extlinks.items():
+            title_language2extlinks[(title, lang)]=els
+    return title_language2extlinks
+
+def obtain_primary_rt_links_batch(title_language_pairs, max_concurrency=4, batch_size=50, verbose=0):
+    """
+    Obtain the external links of many Wikipedia pages.
+    The titles are queried in batches of batch_size titles per request,
+    with at most max_concurrency simultaneous requests per Wikipedia language.
+
+    :param iterable title_language_pairs: e.g., {('Mannheim', 'en'), ('Mannheim', 'nl')}
+    :param int max_concurrency: maximum number of simultaneous requests per language
+    :param int batch_size: number of titles per request (at most 50 for the MediaWiki API)
+
+    :rtype: dict
+    :return: (title, language) -> list of external links (only for pages with external links)
+    """
+    lang2titles=defaultdict(set)
+    for title, lang in title_language_pairs:
+        lang2titles[lang].add(title)
+
+    title_language2extlinks=asyncio.run(obtain_extlinks_of_languages(lang2titles, max_concurrency, batch_size))
+
+    if verbose >= 2:
+        num_titles=sum(len(titles) for titles in lang2titles.values())
+        print(f'found external links for {len(title_language2extlinks)} of {num_titles} Wikipedia pages')
+
+    return title_language2extlinks
+
+def obtain_primary_rt_links(title, lang):
+    return obtain_extlinks_batch([title], lang).get(title, [])
 
-    for page_id, page_info in j_el['query']['pages'].items():
-        if page_id=='-1': continue
+def obtain_wiki_pages_info(titles, lang, props, extract_text=True, other_languages=set(), batch_size=50):
+    """
+    Obtain information for many Wikipedia page titles of one language.
+    The query props (extracts, extlinks, langlinks) are combined into one query per batch of titles,
+    of which the continuation is followed until the results are complete.
+    The wikitext (of section 0) is obtained with one parse request per page.
+
+    :param iterable titles: page titles
+    :param str lang: language of the Wikipedia
+    :param iterable props: subset of {'extracts', 'extlinks', 'langlinks', 'wikitext'}
+    :param bool extract_text: obtain the extracts as plain text
+    :param set other_languages: languages of interest of the langlinks
+    :param int batch_size: number of titles per query (at most 50 for the MediaWiki API)
+
+    :rtype: dict
+    :return: requested title -> dict with the keys 'title' (after normalization and redirects),
+    'extract', 'extlinks', 'langlinks', and 'wikitext' (if found); empty dict if the page does not exist
+    """
+    query_props=[prop for prop in ['extracts', 'extlinks', 'langlinks'] if prop in props]
+    url='https://%s.wikipedia.org/w/api.php?' % lang
 
-        if 'extlinks' in page_info.keys():
-            els=adapt_extlinks(page_info['extlinks'])
-            return els
-    return []
+    title2data={}
+    for batch in utils.split_in_batches(sorted(set(titles)), batch_size):
+        params={
+                'format': 'json',
+                'action': 'query',
+                'titles': '|'.join(batch),
+                'redirects': True
+                }
+        if query_props:
+            params['prop']='|'.join(query_props)
+        if 'extracts' in query_props:
+            params['exlimit']='max'
+            if extract_text:
+                params['explaintext']=True
+        if 'extlinks' in query_props:
+            params['ellimit']=500
+        if 'langlinks' in query_props:
+            params['lllimit']=500
+
+        page2titles={}
+        page2data={}
+        for j in query_with_continuation(url, params):
+            if 'query' not in j.keys():
+                print('no query for these pages', lang, batch)
+                break
+            if not page2titles:
+                page2titles=map_pages_to_requested_titles(j['query'], batch)
+
+            for page_id, page_info in j['query']['pages'].items():
+                if 'missing' in page_info or 'invalid' in page_info: continue
+
+                data=page2data.setdefault(page_info['title'], {'title': page_info['title']})
+                if 'extract' in page_info.keys():
+                    data['extract']=page_info['extract']
+                if 'extlinks' in page_info.keys():
+                    data.setdefault('extlinks', []).extend(adapt_extlinks(page_info['extlinks']))
+                if 'langlinks' in page_info.keys():
+                    data.setdefault('langlinks', {}).update(filter_langlinks(page_info['langlinks'], other_languages))
+
+        if 'wikitext' in props:
+            for page_title, data in page2data.items():
+                params_wikitext={
+                        'format': 'json',
+                        'action': 'parse',
+                        'prop': 'wikitext',
+                        'page': page_title,
+                        'section': 0
+                }
+                j_wt=obtain_results_from_api(url, params_wikitext)
+                if 'parse' in j_wt.keys():
+                    data['wikitext']=j_wt['parse']['wikitext']
+
+        for title in batch:
+            title2data[title]={}
+        for page_title, data in page2data.items():
+            for title in page2titles.get(page_title, [page_title]):
+                title2data[title]=data
+
+    return title2data
 
 def obtain_wiki_page_info(title, lang, props, extract_text=True, other_languages=set()):
-    """Obtain information for a Wikipedia page title. The requested pieces of information are defined in the `props` parameter."""
-    params_extracts={
-            'format': 'json',
-            'action': 'query',
-            'prop': 'extracts',
-            'explaintext': extract_text,
-            'titles': title,
-            'redirects': True,
-            'exlimit': 1,
-            }
-    params_extlinks={
-            'format': 'json',
-            'action': 'query',
-            'prop': 'extlinks',
-            'titles': title,
-            'redirects': True,
-            'ellimit': 500
-            }
-    params_langlinks={
-            'format': 'json',
-            'action': 'query',
-            'prop': 'langlinks',
-            'titles': title,
-            'redirects': True,
-            'lllimit': 500
+    """Obtain information for a Wikipedia page title: the extract, extlinks, langlinks, and wikitext (see obtain_wiki_pages_info)."""
+    all_props=set(props) | {'extracts', 'extlinks', 'langlinks', 'wikitext'}
+    title2data=obtain_wiki_pages_info([title], lang, all_props, extract_text=extract_text, other_languages=other_languages)
+    return title2data[title]
+
+def obtain_uris_batch(titles, lang):
+    """
+    Obtain the canonical URIs of at most 50 Wikipedia pages with one request.
+
+    :rtype: dict
+    :return: requested title -> canonical URI (None if the page does not exist)
+    """
+    params={
+            "action": "query",
+            "format": "json",
+            "titles": '|'.join(titles),
+            "prop": "info",
+            "inprop": "url",
+            "redirects": True
             }
-    params_wikitext={
-            'format': 'json',
-            'action': 'parse',
-            'prop': 'wikitext',
-            'page': title,
-            'section': 0
-    }
-    url='https://%s.wikipedia.org/w/api.php?' % lang
+    url="https://%s.wikipedia.org/w/api.php" % lang
 
-    j=obtain_results_from_api(url, params_extracts)
-    data={}
+    j=obtain_results_from_api(url, params)
+    if 'query' not in j.keys():
+        return {}
+
+    page2titles=map_pages_to_requested_titles(j['query'], titles)
+    title2uri={}
     for page_id, page_info in j['query']['pages'].items():
-        if page_id=='-1': continue
-        data['title']=page_info['title']
-        if 'extract' in page_info.keys():
-            data['extract']=page_info['extract']
-
-        j_el=obtain_results_from_api(url, params_extlinks)
-        if page_id in j_el['query']['pages']:
-            if 'extlinks' in j_el['query']['pages'][page_id]:
-                els=adapt_extlinks(j_el['query']['pages'][page_id]['extlinks'])
-                data['extlinks']=els
-
-        j_ll=obtain_results_from_api(url, params_langlinks)
-        if page_id in j_ll['query']['pages']:
-            if 'langlinks' in j_ll['query']['pages'][page_id]:
-                lls=filter_langlinks(j_ll['query']['pages'][page_id]['langlinks'], other_languages)
-                data['langlinks']=lls
-    
-        j_wt=obtain_results_from_api(url, params_wikitext)
-        if int(page_id)==int(j_wt['parse']['pageid']):
-            data['wikitext']=j_wt['parse']['wikitext']
-    return data
+        uri=page_info.get('canonicalurl')
+        if 'missing' in page_info or 'invalid' in page_info:
+            uri=None
+        for title in page2titles.get(page_info['title'], [page_info['title']]):
+            title2uri[title]=uri
+    return title2uri
 
-def get_uri_from_title(name, lang):
+def get_invented_uri(name, lang):
+    return "https://%s.wikipedia.org/wiki/%s" % (lang, name.replace(' ', '_'))
 
-    URL = "https://%s.wikipedia.org/w/api.php" % lang
+def get_uris_from_titles(title_language_pairs, max_concurrency=4, batch_size=50, verbose=0):
+    """
+    Obtain the canonical URIs of many Wikipedia pages.
+    The URIs are cached per title (see cache_utils.get_items);
+    the titles that are not cached are queried in batches of batch_size titles per language,
+    with at most max_concurrency simultaneous requests.
+    For pages that do not exist, the URI is created from the title.
 
-    PARAMS = {
-    "action": "query",
-    "format": "json",
-    "titles": name,
-    "prop": "info",
-    "inprop": "url|talkid"
-    }
+    :param iterable title_language_pairs: e.g., {('Mannheim', 'en'), ('Mannheim', 'nl')}
 
-    j=obtain_results_from_api(URL, PARAMS)
-    for page_id, page_info in j['query']['pages'].items():
-        if page_id=='-1': continue
-        return page_info['canonicalurl']
-    invented_uri="https://%s.wikipedia.org/wiki/%s" % (lang, name.replace(' ', '_'))
-    return invented_uri
+    :rtype: dict
+    :return: (title, language) -> URI
+    """
+    lang2titles=defaultdict(set)
+    for title, lang in title_language_pairs:
+        lang2titles[lang].add(title)
+
+    title_language2uri={}
+    for lang, titles in lang2titles.items():
+
+        def fetch_uris(missing_titles):
+            batches=list(utils.split_in_batches(missing_titles, batch_size))
+            if verbose >= 2:
+                print(f'querying the URIs of {len(missing_titles)} {lang} Wikipedia pages in {len(batches)} batches')
+            title2uri={}
+            for batch_result in asyncio.run(gather_in_threads(obtain_uris_batch,
+                                                              [(batch, lang) for batch in batches],
+                                                              max_concurrency)):
+                title2uri.update(batch_result)
+            return title2uri
+
+        title2uri=cache_utils.get_items('info/canonicalurl/%s' % lang, sorted(titles), fetch_uris)
+        for title in titles:
+            uri=title2uri.get(title)
+            if uri is None:
+                uri=get_invented_uri(title, lang)
+            title_language2uri[(title, lang)]=uri
+
+    return title_language2uri
+
+def get_uri_from_title(name, lang):
+    return get_uris_from_titles([(name, lang)])[(name, lang)]
 
 
 def map_wd_uri_to_wikipedia_uri(uris,
@@ -1,17 +1,16 @@
 import json
 import os
 import re
-import time
 import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
 #Pia: adding named tuple for entity elements
-from collections import namedtuple
-
-import spacy_to_naf
-from spacy_to_naf.converter import Converter
+from collections import namedtuple, defaultdict
 
 from lxml import etree
 
+import index_utils
 import native_api_utils as api
 import utils
 import xml_utils
@@ -31,6 +30,24 @@ EntityElement = namedtuple('EntityElement', ['eid',
                                                                               # 'resource' : 'Wikipedia'}]
                                      ])
 
+# input of function "texts_to_naf": one reference text
+# inc_id: Wikidata uri of the incident, used to add the coreferences layer
+NafInput = namedtuple('NafInput', ['wiki_title',
+                                   'text',
+                                   'wiki_uri',
+                                   'annotations',
+                                   'prefix',
+                                   'language',
+                                   'dct',
+                                   'inc_id'],
+                      defaults=[None])
+
+# output of function "texts_to_naf_parallel": error is None if the NAF file was stored
+NafResult = namedtuple('NafResult', ['wiki_title',
+                                     'language',
+                                     'output_path',
+                                     'error'])
+
 def add_entity_element(entities_layer,
                        naf_version,
                        entity_data,
@@ -124,6 +141,52 @@ def skip_this_incident(ref_texts,
     return skip_incident
 
 
+def add_uris_to_reference_texts(incidents, verbose=0):
+    """
+    Add the Wikipedia URI to every reference text of the incidents that does not have one yet.
+    The URIs of all reference texts are obtained in bulk (see native_api_utils.get_uris_from_titles).
+    """
+    title_language_pairs = {(ref_text.name, ref_text.language)
+                            for incident in incidents
+                            for ref_text in incident.reference_texts
+                            if not ref_text.uri}
+
+    title_language2uri = api.get_uris_from_titles(title_language_pairs, verbose=verbose)
+
+    for incident in incidents:
+        for ref_text in incident.reference_texts:
+            if not ref_text.uri:
+                ref_text.uri = title_language2uri[(ref_text.name, ref_text.language)]
+
+
+def add_labels_to_extra_info(incidents, verbose=0):
+    """
+    Add the English label to every value of the extra_info of the incidents that does not have one yet,
+    e.g., 'http://www.wikidata.org/entity/Q76' -> 'http://www.wikidata.org/entity/Q76 | Barack Obama'.
+    The labels of all values are obtained in bulk (see native_api_utils.obtain_labels_batch).
+    """
+    q_ids = set()
+    for incident in incidents:
+        for p, v_set in incident.extra_info.items():
+            for v in v_set:
+                if '|' not in v and v.startswith('http'):
+                    q_ids.add(v.split('/')[-1])
+
+    id2label = api.obtain_labels_batch(q_ids, verbose=verbose)
+
+    for incident in incidents:
+        for p, v_set in incident.extra_info.items():
+            new_v_set = set()
+            for v in v_set:
+                if '|' not in v:
+                    label = ''
+                    if v.startswith('http'):
+                        label = id2label[v.split('/')[-1]]
+                    v += ' | ' + label
+                new_v_set.add(v)
+            incident.extra_info[p] = new_v_set
+
+
 def create_pilot_data(data,
                       target_languages,
                       must_have_all_languages,
@@ -131,8 +194,6 @@ def create_pilot_data(data,
                       one_page_per_language):
     pilot_incidents = set()
 
-    cached = {}
-
     data.incidents = remove_incidents_with_missing_FEs(data.incidents, data.incident_type)
     for incident in data.incidents:
         langs = set()
@@ -153,27 +214,10 @@ def create_pilot_data(data,
                               one_page_per_language):
             continue
 
-        for ref_text in incident.reference_texts:
-            if not ref_text.uri:
-                ref_text.uri = api.get_uri_from_title(ref_text.name, ref_text.language)
         pilot_incidents.add(incident)
-        for p, v_set in incident.extra_info.items():
-            new_v_set = set()
-            for v in v_set:
-                if '|' not in v:
-                    label = ''
-                    q_id = v.split('/')[-1]
-                    if q_id in cached.keys():
-                        label = cached[q_id]
-                    elif v.startswith('http'):
-                        label = utils.obtain_label(q_id)
-                        time.sleep(1)
-                        cached[q_id] = label
-                    v += ' | ' + label
-                    new_v_set.add(v)
-                else:
-                    new_v_set.add(v)
-            incident.extra_info[p] = new_v_set
+
+    add_uris_to_reference_texts(pilot_incidents)
+    add_labels_to_extra_info(pilot_incidents)
     print('Num of pilot incidents', len(pilot_incidents))
     return pilot_incidents
 
@@ -184,8 +228,6 @@ def create_participant_data(data,
                       one_page_per_language):
     pilot_incidents = set()
 
-    cached = {}
-
     for incident in data.incidents:
         langs = set()
         incident.reference_texts = utils.deduplicate_ref_texts(incident.reference_texts)
@@ -205,27 +247,10 @@ def create_participant_data(data,
                               one_page_per_language):
             continue
 
-        for ref_text in incident.reference_texts:
-            if not ref_text.uri:
-                ref_text.uri = api.get_uri_from_title(ref_text.name, ref_text.language)
         pilot_incidents.add(incident)
-        for p, v_set in incident.extra_info.items():
-            new_v_set = set()
-            for v in v_set:
-                if '|' not in v:
-                    label = ''
-                    q_id = v.split('/')[-1]
-                    if q_id in cached.keys():
-                        label = cached[q_id]
-                    elif v.startswith('http'):
-                        label = utils.obtain_label(q_id)
-                        time.sleep(1)
-                        cached[q_id] = label
-                    v += ' | ' + label
-                    new_v_set.add(v)
-                else:
-                    new_v_set.add(v)
-            incident.extra_info[p] = new_v_set
+
+    add_uris_to_reference_texts(pilot_incidents)
+    add_labels_to_extra_info(pilot_incidents)
     print('Num of pilot incidents', len(pilot_incidents))
     return pilot_incidents
 
@@ -293,6 +318,7 @@ def add_hyperlinks(naf, annotations, prefix, language, dct, wiki_langlinks={}, v
     date = datetime(2019, 7, 20)
     date_as_string = time_in_correct_format(date)
 
+    add_langlinks = bool(wiki_langlinks) # checked once, it can be a lazy index on disk
 
     for (start, end), (sf, uri) in start_end2info.items():
 
@@ -316,7 +342,7 @@ def add_hyperlinks(naf, annotations, prefix, language, dct, wiki_langlinks={}, v
                      'reference': uri,
                      'source': 'https://www.wikipedia.org/',
                      'timestamp' : date_as_string}]
-        if wiki_langlinks:
+        if add_langlinks:
             for lang, uri in wiki_langlinks[language][uri].items():
                 ext_refs.append({'resource': 'Wikipedia hyperlinks',
                                  'reference': uri,
@@ -340,6 +366,202 @@ def add_hyperlinks(naf, annotations, prefix, language, dct, wiki_langlinks={}, v
                                         add_comments=True)
 
 
+def load_converters(spacy_models, languages=None, verbose=0):
+    """
+    create one spaCy-to-NAF converter per language,
+    which are reused for every document of the run.
+
+    :param str spacy_models: the spacy_models setting of mwep_settings.json, e.g.,
+    "en-en_core_web_sm;nl-nl_core_news_sm"
+    :param languages: if provided, only the models of these languages are loaded
+
+    :rtype: dict
+    :return: language -> spacy_to_naf.converter.Converter
+    """
+    # imported here, because spaCy is slow to import
+    from spacy_to_naf.converter import Converter
+
+    language2converter = {}
+    for model_info in spacy_models.split(';'):
+        language, model_name = model_info.split('-')
+        if languages is not None and language not in languages:
+            continue
+        language2converter[language] = Converter(model_name,
+                                                 add_terms=True,
+                                                 add_deps=True,
+                                                 add_entities=False,
+                                                 add_chunks=False)
+        if verbose >= 2:
+            print(f'loaded spaCy model {model_name} for {language}')
+
+    return language2converter
+
+
+def get_naf_path(output_folder, language, wiki_title):
+    """
+    path of the NAF file of a document (without creating any folder)
+    """
+    if output_folder is not None:
+        return os.path.join(output_folder, language, f'{wiki_title}.naf')
+    return 'dummpy.naf'
+
+
+def get_naf_output_path(output_folder, language, wiki_title):
+    """
+    create the language folder in output_folder (if needed)
+    and return the path of the NAF file of a document
+    """
+    if output_folder is not None:
+        print("Creating naf folder")
+        lang_dir = os.path.join(output_folder, language)
+        os.makedirs(lang_dir, exist_ok=True) # can be called from several processes
+    return get_naf_path(output_folder, language, wiki_title)
+
+
+def convert_spacy_doc(converter, doc, text, filename):
+    """
+    same as spacy_to_naf.converter.Converter.process_text,
+    but for a text that has already been parsed with converter.nlp,
+    e.g., using nlp.pipe
+
+    :rtype: nafparserpy.parser.NafParser
+    """
+    naf = converter.init_naf(filename, text)
+    converter.add_text_layer(doc, naf)
+    if converter.add_terms:
+        converter.add_terms_layer(doc, naf)
+    if converter.add_deps:
+        converter.add_deps_layer(doc, naf)
+    if converter.add_entities:
+        converter.add_entities_layer(doc, naf)
+    if converter.add_chunks:
+        converter.add_chunks_layer(doc, naf)
+    return naf
+
+
+def enrich_and_write_naf(naf,
+                         annotations,
+                         prefix,
+                         language,
+                         dct,
+                         output_path,
+                         output_folder=None,
+                         wiki_langlinks={},
+                         wikidata_enrichment=None,
+                         inc_id=None,
+                         verbose=0):
+    """
+    add the Wikipedia hyperlinks as entities to a NAF tree,
+    add the Wikidata uris and coreferences layer (if wikidata_enrichment and inc_id are provided),
+    and (if output_folder is provided) store the NAF file.
+
+    :param xml_utils.WikidataEnrichment wikidata_enrichment: see xml_utils.get_wikidata_enrichment
+    :param str inc_id: Wikidata uri of the incident of the text
+    """
+    # add hyperlinks as entity elements
+    add_hyperlinks(naf,
+                   annotations,
+                   prefix,
+                   language,
+                   dct,
+                   wiki_langlinks=wiki_langlinks)
+
+    # add Wikidata information (entities and coreferences layer)
+    if wikidata_enrichment is not None and inc_id is not None:
+        xml_utils.add_wikidata_to_naf(naf,
+                                      wikidata_enrichment,
+                                      inc_id,
+                                      naf_path=output_path,
+                                      verbose=verbose)
+
+    # if wanted, write output to disk
+    if output_folder is not None:
+        print("Storing naf file:", output_path)
+        naf.write(output_path,
+                  encoding='utf-8',
+                  pretty_print=True,
+                  xml_declaration=True)
+
+    if verbose >= 3:
+        print(f'saved to {output_path}')
+
+    return naf
+
+
+def build_naf(doc,
+              text,
+              annotations,
+              prefix,
+              language,
+              converter,
+              dct,
+              output_path,
+              output_folder=None,
+              wiki_langlinks={},
+              wikidata_enrichment=None,
+              inc_id=None,
+              verbose=0):
+    """
+    convert a parsed text to NAF, add the Wikipedia hyperlinks
+    as entities and (if output_folder is provided) store the NAF file.
+
+    :raises: Exception when the conversion fails
+    """
+    naf = convert_spacy_doc(converter, doc, text, output_path)
+    naf = naf.tree
+    assert naf.find('raw').text == text, f'mismatch between raw text JSON and NAF file'
+
+    return enrich_and_write_naf(naf,
+                                annotations,
+                                prefix,
+                                language,
+                                dct,
+                                output_path,
+                                output_folder=output_folder,
+                                wiki_langlinks=wiki_langlinks,
+                                wikidata_enrichment=wikidata_enrichment,
+                                inc_id=inc_id,
+                                verbose=verbose)
+
+
+def spacy_doc_to_naf(doc,
+                     text,
+                     annotations,
+                     prefix,
+                     language,
+                     converter,
+                     dct,
+                     output_path,
+                     output_folder=None,
+                     wiki_langlinks={},
+                     wikidata_enrichment=None,
+                     inc_id=None,
+                     verbose=0):
+    """
+    same as function "build_naf", but returns None
+    if the parsed text could not be converted to NAF
+    """
+    try:
+        naf = convert_spacy_doc(converter, doc, text, output_path)
+        naf = naf.tree
+        assert naf.find('raw').text == text, f'mismatch between raw text JSON and NAF file'
+    except:
+        print("Did not write to files- problem:")
+        return
+
+    return enrich_and_write_naf(naf,
+                                annotations,
+                                prefix,
+                                language,
+                                dct,
+                                output_path,
+                                output_folder=output_folder,
+                                wiki_langlinks=wiki_langlinks,
+                                wikidata_enrichment=wikidata_enrichment,
+                                inc_id=inc_id,
+                                verbose=verbose)
+
+
 def text_to_naf(wiki_title,
                 target_languages,
                 text,
@@ -347,87 +569,261 @@ def text_to_naf(wiki_title,
                 annotations,
                 prefix,
                 language,
-                nlp,
+                converter,
                 dct,
                 output_folder=None,
                 wiki_langlinks={},
                 verbose=0):
+    """
+    parse a text with spaCy, convert it to NAF, add the Wikipedia hyperlinks
+    as entities and (if output_folder is provided) store the NAF file.
+
+    :param spacy_to_naf.converter.Converter converter: converter of the language
+    (see function "load_converters")
+    """
     assert language in target_languages, f'{language} not part of supported languages: {" ".join(target_languages)}'
 
-    # prepare output path
-    if output_folder is not None:
-        print("Creating naf folder")
-        if not os.path.exists(output_folder):
-            os.mkdir(output_folder)
-        lang_dir = os.path.join(output_folder, language)
-        if not os.path.exists(lang_dir):
-            os.mkdir(lang_dir)
-        output_path = os.path.join(lang_dir, f'{wiki_title}.naf')
-    else:
-        output_path = 'dummpy.naf'
+    output_path = get_naf_output_path(output_folder, language, wiki_title)
 
+    if converter is None:
+        print(f'No spaCy model for {language}, did not write to files: {output_path}')
+        return
 
     # parse with spaCy
-    add_mw = False
-    if language in {'en', 'nl'}:
-        add_mw = True
-    if language == 'en':
-        converter = Converter('en_core_web_sm', add_terms=True, add_deps=True, add_entities=False, add_chunks=False)
-    elif language == 'nl':
-        converter = Converter('nl_core_news_sm', add_terms=True, add_deps=True, add_entities=False, add_chunks=False)
-
     try:
-        # naf = spacy_to_naf.text_to_NAF(text=text,
-        #                                nlp=nlp,
-        #                                dct=dct,
-        #                                layers={'raw', 'text', 'terms', 'deps'},
-        #                                naf_version='v3.1',
-        #                                title=wiki_title,
-        #                                uri=wiki_uri,
-        #                                language=language,
-        #                                add_mws=add_mw)
-        naf = converter.process_text(text, output_path)
-        #naf = naf.root
-        naf = naf.tree
-        # print('naf after tree')
-        # print(type(naf))
-        # print(help(naf.write))
-        assert naf.find('raw').text == text, f'mismatch between raw text JSON and NAF file'
-
+        doc = converter.nlp(text)
     except:
         print("Did not write to files- problem:")
         return
-        # naf = converter.process_text(text, output_path)
 
+    return spacy_doc_to_naf(doc,
+                            text,
+                            annotations,
+                            prefix,
+                            language,
+                            converter,
+                            dct,
+                            output_path,
+                            output_folder=output_folder,
+                            wiki_langlinks=wiki_langlinks,
+                            verbose=verbose)
+
+
+def texts_to_naf(naf_inputs,
+                 target_languages,
+                 language2converter,
+                 output_folder=None,
+                 wiki_langlinks={},
+                 wikidata_enrichment=None,
+                 batch_size=32,
+                 n_process=1,
+                 on_stored=None,
+                 verbose=0):
+    """
+    batch version of function "text_to_naf".
+    The texts are grouped per language and parsed with nlp.pipe,
+    after which every spaCy Doc is converted to NAF, enriched with the Wikipedia hyperlinks,
+    and stored.
+    A text that can not be parsed or converted is reported and skipped.
+    If nlp.pipe fails, the remaining texts of the language are parsed one by one.
+
+    :param list naf_inputs: list of NafInput objects
+    :param list target_languages: see function "text_to_naf"
+    :param dict language2converter: see function "load_converters"
+    :param xml_utils.WikidataEnrichment wikidata_enrichment: if provided, the Wikidata uris and
+    coreferences layer are added before the NAF files are written
+    :param int batch_size: batch_size of nlp.pipe
+    :param int n_process: n_process of nlp.pipe
+    :param on_stored: if provided, function that is called with the output path
+    of every NAF file directly after it has been stored (e.g., to record it in a checkpoint manifest)
+
+    :rtype: list
+    :return: list of NAF trees (None if a document could not be converted),
+    in the same order as naf_inputs
+    """
+    nafs = [None] * len(naf_inputs)
 
+    language2indices = defaultdict(list)
+    for index, naf_input in enumerate(naf_inputs):
+        assert naf_input.language in target_languages, f'{naf_input.language} not part of supported languages: {" ".join(target_languages)}'
+        language2indices[naf_input.language].append(index)
 
-    # add hyperlinks as entity elements
-    add_hyperlinks(naf,
-                   annotations,
-                   prefix,
-                   language,
-                   dct,
-                   wiki_langlinks=wiki_langlinks)
+    for language, indices in language2indices.items():
+        converter = language2converter.get(language)
+        if converter is None:
+            print(f'No spaCy model for {language}, did not write {len(indices)} files')
+            continue
 
-    # if wanted, write output to disk
-    if output_folder is not None:
-        # print("Creating naf folder")
-        # if not os.path.exists(output_folder):
-        #     os.mkdir(output_folder)
-        # lang_dir = os.path.join(output_folder, language)
-        # if not os.path.exists(lang_dir):
-        #     os.mkdir(lang_dir)
-        # output_path = os.path.join(lang_dir, f'{wiki_title}.naf')
-        print("Storing naf file:", output_path)
+        texts = (naf_inputs[index].text for index in indices)
+        docs = iter(converter.nlp.pipe(texts,
+                                       batch_size=batch_size,
+                                       n_process=n_process))
+
+        for index in indices:
+            naf_input = naf_inputs[index]
+            output_path = get_naf_output_path(output_folder, language, naf_input.wiki_title)
+
+            doc = None
+            if docs is not None:
+                try:
+                    doc = next(docs)
+                except Exception as e:
+                    print(f'nlp.pipe failed ({type(e).__name__}: {e}), parsing the remaining {language} texts one by one')
+                    docs = None
+
+            try:
+                if doc is None:
+                    doc = converter.nlp(naf_input.text)
+                nafs[index] = spacy_doc_to_naf(doc,
+                                               naf_input.text,
+                                               naf_input.annotations,
+                                               naf_input.prefix,
+                                               language,
+                                               converter,
+                                               naf_input.dct,
+                                               output_path,
+                                               output_folder=output_folder,
+                                               wiki_langlinks=wiki_langlinks,
+                                               wikidata_enrichment=wikidata_enrichment,
+                                               inc_id=naf_input.inc_id,
+                                               verbose=verbose)
+            except Exception as e:
+                print(f'Did not write to files- problem with {naf_input.wiki_title}: {type(e).__name__}: {e}')
+                continue
+
+            if on_stored is not None and output_folder is not None and nafs[index] is not None:
+                on_stored(output_path)
+
+        if verbose >= 2:
+            print(f'processed {len(indices)} {language} texts with nlp.pipe')
+
+    return nafs
+
+
+# state of the processes of function "texts_to_naf_parallel"
+_worker_converters = {}
+_worker_wiki_langlinks = {}
+_worker_wikidata_enrichment = None
+
+
+def get_worker_langlinks(wiki_langlinks):
+    """
+    what the processes of function "texts_to_naf_parallel" need to open the langlinks themselves.
+    Only the memory-mapped indices are supported (see wikipedia_utils.load_wiki_langlinks):
+    a dict would be copied into every process.
 
-        #spacy_to_naf.NAF_to_file(naf, output_path)
-        # naf.write(output_path)
-        # print(type(naf))
-        # print(dir(naf))
-        # tree = etree.ElementTree(naf)
-        naf.write(output_path, pretty_print=True)
+    :param wiki_langlinks: index_utils.LazySortedKeyIndices or an empty dict
 
-    if verbose >= 3:
-        print(f'saved to {output_path}')
+    :rtype: tuple
+    :return: (folder, names) of the indices, or None if there are no langlinks
+    """
+    if not wiki_langlinks:
+        return None
+    assert isinstance(wiki_langlinks, index_utils.LazySortedKeyIndices), \
+        'with more than one worker, the langlinks have to be stored as indices (see wiki_langlinks_folder and build_resources.py)'
+    return wiki_langlinks.folder, sorted(wiki_langlinks.names)
 
-    return naf
+
+def init_naf_worker(spacy_models, languages, worker_langlinks, wikidata_enrichment=None):
+    """
+    initializer of the processes of function "texts_to_naf_parallel":
+    every process loads its own spaCy models and memory-maps the langlinks indices itself
+
+    :param tuple worker_langlinks: see function "get_worker_langlinks"
+    """
+    global _worker_converters, _worker_wiki_langlinks, _worker_wikidata_enrichment
+    _worker_converters = load_converters(spacy_models, languages=languages)
+    if worker_langlinks is not None:
+        _worker_wiki_langlinks = index_utils.LazySortedKeyIndices(*worker_langlinks)
+    _worker_wikidata_enrichment = wikidata_enrichment
+
+
+def naf_worker(naf_input, target_languages, output_folder=None, verbose=0):
+    """
+    parse one text, convert it to NAF, add the Wikipedia hyperlinks and store it,
+    using the spaCy models of the current process
+
+    :rtype: NafResult
+    """
+    output_path = None
+    try:
+        assert naf_input.language in target_languages, f'{naf_input.language} not part of supported languages: {" ".join(target_languages)}'
+        output_path = get_naf_output_path(output_folder, naf_input.language, naf_input.wiki_title)
+
+        converter = _worker_converters.get(naf_input.language)
+        assert converter is not None, f'no spaCy model for {naf_input.language}'
+
+        doc = converter.nlp(naf_input.text)
+        build_naf(doc,
+                  naf_input.text,
+                  naf_input.annotations,
+                  naf_input.prefix,
+                  naf_input.language,
+                  converter,
+                  naf_input.dct,
+                  output_path,
+                  output_folder=output_folder,
+                  wiki_langlinks=_worker_wiki_langlinks,
+                  wikidata_enrichment=_worker_wikidata_enrichment,
+                  inc_id=naf_input.inc_id,
+                  verbose=verbose)
+    except Exception as e:
+        return NafResult(naf_input.wiki_title, naf_input.language, output_path, f'{type(e).__name__}: {e}')
+
+    return NafResult(naf_input.wiki_title, naf_input.language, output_path, None)
+
+
+def texts_to_naf_parallel(naf_inputs,
+                          target_languages,
+                          spacy_models,
+                          workers,
+                          output_folder=None,
+                          wiki_langlinks={},
+                          wikidata_enrichment=None,
+                          chunksize=8,
+                          on_stored=None,
+                          verbose=0):
+    """
+    parallel version of function "texts_to_naf":
+    the NAF conversion, hyperlink enrichment, and serialization of the texts
+    is distributed over a pool of processes, which each load their own spaCy models.
+
+    :param list naf_inputs: list of NafInput objects
+    :param list target_languages: see function "text_to_naf"
+    :param str spacy_models: see function "load_converters"
+    :param int workers: number of processes
+    :param wiki_langlinks: see function "get_worker_langlinks", only the folder and names of the indices are sent to the processes
+    :param xml_utils.WikidataEnrichment wikidata_enrichment: see function "texts_to_naf"
+    :param int chunksize: number of texts sent to a process at once
+    :param on_stored: see function "texts_to_naf"
+
+    :rtype: tuple
+    :return: (list of NafResult objects in the same order as naf_inputs,
+    list of NafResult objects of the texts that failed)
+    """
+    languages = sorted({naf_input.language for naf_input in naf_inputs})
+    worker_langlinks = get_worker_langlinks(wiki_langlinks)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=init_naf_worker,
+                             initargs=(spacy_models, languages, worker_langlinks, wikidata_enrichment)) as executor:
+        results = []
+        for result in executor.map(partial(naf_worker,
+                                           target_languages=target_languages,
+                                           output_folder=output_folder,
+                                           verbose=verbose),
+                                   naf_inputs,
+                                   chunksize=chunksize):
+            if on_stored is not None and output_folder is not None and result.error is None:
+                on_stored(result.output_path)
+            results.append(result)
+
+    failures = [result for result in results
+                if result.error is not None]
+
+    if verbose >= 1:
+        print(f'processed {len(results)} texts with {workers} workers, {len(failures)} failed')
+        for failure in failures:
+            print(f'FAILED {failure.language} {failure.wiki_title}: {failure.error}')
+
+    return results, failures
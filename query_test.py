@@ -8,7 +8,8 @@ Usage:
    --path_mapping_wd_to_sem=<path_mapping_wd_to_sem>\
    --languages=<languages>\
    --wikipedia_sources=<wikipedia_sources>\
-   --verbose=<verbose>
+   --verbose=<verbose>\
+   [--refresh-sparql]
 
 Options:
     --config_path=<config_path>
@@ -18,6 +19,7 @@ Options:
     --languages=<languages> languages separated by -, e.g., "nl-it-en"
     --wikipedia_sources=<wikipedia_sources> if "True", crawl Wikipedia sources
     --verbose=<verbose> 0 --> no stdout 1 --> general stdout 2 --> detailed stdout
+    --refresh-sparql  run all SPARQL queries again instead of using the cached results (the new results are cached)
 
 Example:
     python main.py --config_path="config/mwep_settings.json"\
@@ -47,14 +49,16 @@ import json
 import os
 import pickle
 import time
+from collections import defaultdict
 from datetime import datetime
 
 import pandas as pd
-import spacy
 from tqdm import tqdm
 
+import cache_utils
 import classes
 import crawl_utils
+import http_utils
 import json_utils
 import xml_utils
 import native_api_utils
@@ -66,51 +70,56 @@ for_encoding = 'é'
 
 def add_wikipedia_pages_from_api(incidents, wdt_ids):
     assert (len(wdt_ids) > 0)
-    id_batches = utils.split_in_batches(wdt_ids, 50)
-
-    for index, batch in enumerate(id_batches):
-        wiki_pages = native_api_utils.obtain_wiki_page_titles(batch, languages)
-        for incident in incidents:
-            if incident.wdt_id in wiki_pages.keys():
-                incident_wikipedia = wiki_pages[incident.wdt_id]
-                for language, name in incident_wikipedia.items():
-                    found = False
-                    for rt in incident.reference_texts:
-                        if rt.name == name and rt.language == language:
-                            rt.found_by.append('API')
-                            found = True
-                    if not found:
-                        ref_text = classes.ReferenceText(
-                            name=name,
-                            language=language,
-                            found_by=['API']
-                        )
-                        incident.reference_texts.append(ref_text)
+    wiki_pages = native_api_utils.obtain_wiki_page_titles_batch(wdt_ids, languages, verbose=2)
+
+    id2incidents = defaultdict(list)
+    for incident in incidents:
+        id2incidents[incident.wdt_id].append(incident)
+
+    for wdt_id, incident_wikipedia in wiki_pages.items():
+        for incident in id2incidents.get(wdt_id, []):
+            language_name2ref_texts = defaultdict(list)
+            for rt in incident.reference_texts:
+                language_name2ref_texts[(rt.language, rt.name)].append(rt)
+
+            for language, name in incident_wikipedia.items():
+                if (language, name) in language_name2ref_texts:
+                    for rt in language_name2ref_texts[(language, name)]:
+                        rt.found_by.append('API')
+                else:
+                    ref_text = classes.ReferenceText(
+                        name=name,
+                        language=language,
+                        found_by=['API']
+                    )
+                    incident.reference_texts.append(ref_text)
     return incidents
 
 def add_participant_wikipedia_pages_from_api(incidents, wdt_ids):
     assert (len(wdt_ids) > 0)
-    id_batches = utils.split_in_batches(wdt_ids, 50)
-
-    for index, batch in enumerate(id_batches):
-        print('batch for getting wikipedia pages', batch)
-        wiki_pages = native_api_utils.obtain_wiki_page_titles(batch, languages)
-        for incident in incidents:
-            if incident.participant_id in wiki_pages.keys():
-                incident_wikipedia = wiki_pages[incident.participant_id]
-                for language, name in incident_wikipedia.items():
-                    found = False
-                    for rt in incident.reference_texts:
-                        if rt.name == name and rt.language == language:
-                            rt.found_by.append('API')
-                            found = True
-                    if not found:
-                        ref_text = classes.ReferenceText(
-                            name=name,
-                            language=language,
-                            found_by=['API']
-                        )
-                        incident.reference_texts.append(ref_text)
+    wiki_pages = native_api_utils.obtain_wiki_page_titles_batch(wdt_ids, languages, verbose=2)
+
+    id2incidents = defaultdict(list)
+    for incident in incidents:
+        id2incidents[incident.participant_id].append(incident)
+
+    for wdt_id, incident_wikipedia in wiki_pages.items():
+        for incident in id2incidents.get(wdt_id, []):
+            language_name2ref_texts = defaultdict(list)
+            for rt in incident.reference_texts:
+                language_name2ref_texts[(rt.language, rt.name)].append(rt)
+
+            for language, name in incident_wikipedia.items():
+                if (language, name) in language_name2ref_texts:
+                    for rt in language_name2ref_texts[(language, name)]:
+                        rt.found_by.append('API')
+                else:
+                    ref_text = classes.ReferenceText(
+                        name=name,
+                        language=language,
+                        found_by=['API']
+                    )
+                    incident.reference_texts.append(ref_text)
     return incidents
 
 def retrieve_incidents_per_participant(participant_type_qid, type_qid,
@@ -186,7 +195,9 @@ def retrieve_incidents_per_participant(participant_type_qid, type_qid,
 def retrieve_incidents_per_type(type_qid,
                                 event_type_matching,
                                 json_wd_to_sem,
-                                limit=10):
+                                limit=10,
+                                partitioning=None,
+                                stream=False):
     """
     Given an event type identifier, retrieve incidents that belong to this type.
     """
@@ -199,7 +210,9 @@ def retrieve_incidents_per_type(type_qid,
                                                   event_type_matching,
                                                   languages,
                                                   wdt_fn_mappings_COL,
-                                                  limit)
+                                                  limit,
+                                                  partitioning=partitioning,
+                                                  stream=stream)
     wdt_ids = []
     if not len(results_by_id.items()):
         return [], ''
@@ -277,9 +290,14 @@ def obtain_reference_texts(incidents, wiki_folder, wiki_uri2path_info, language2
 
 
 def get_primary_rt_links(incidents):
-    for incident in tqdm(incidents):
+    title_language_pairs = {(ref_text.name, ref_text.language)
+                            for incident in incidents
+                            for ref_text in incident.reference_texts}
+    title_language2links = native_api_utils.obtain_primary_rt_links_batch(title_language_pairs,
+                                                                          verbose=2)
+    for incident in incidents:
         for ref_text in incident.reference_texts:
-            ext_links = native_api_utils.obtain_primary_rt_links(ref_text.name, ref_text.language)
+            ext_links = title_language2links.get((ref_text.name, ref_text.language))
             if ext_links:
                 ref_text.primary_ref_texts = ext_links
     return incidents
@@ -324,6 +342,7 @@ if __name__ == '__main__':
     illegal_chars_in_title = mwep_settings['newsplease']['illegal_chars_in_title']
 
     wiki_folder = mwep_settings['wiki_folder']
+    wiki_store_folder = mwep_settings['wiki_store_folder']
     naf_output_folder = mwep_settings['naf_output_folder']
     rdf_folder = mwep_settings['rdf_folder']
     bin_folder = mwep_settings['bin_folder']
@@ -342,10 +361,9 @@ if __name__ == '__main__':
     print('NAF, RDF, JSON, and BIN directories have been re-created')
 
     # load index and language info
-    path_uri2path_info = os.path.join(wiki_folder, 'page2path.p')
-    print(path_uri2path_info)
-    with open(path_uri2path_info, 'rb') as infile:
-        wiki_uri2path_info = pickle.load(infile)  # make take some time
+    wiki_uri2path_info = wu.load_page2path_index(wiki_folder,
+                                                 wiki_store_folder,
+                                                 verbose=1)
 
     language_info_path = os.path.join(wiki_folder, 'language2info.json')
     with open(language_info_path, 'r')  as infile:
@@ -354,18 +372,45 @@ if __name__ == '__main__':
     print("Wikipedia indices loaded")
 
     wiki_langlinks_path = mwep_settings['wiki_langlinks_path']
-    with open(wiki_langlinks_path, 'rb') as infile:
-        wiki_langlinks = pickle.load(infile)
+    wiki_langlinks_folder = mwep_settings['wiki_langlinks_folder']
+    wiki_langlinks = wu.load_wiki_langlinks(wiki_langlinks_path,
+                                            wiki_langlinks_folder,
+                                            arguments['--languages'].split('-'),
+                                            verbose=1)
 
     print('Wikipedia parallel titles loaded')
 
-    # load spaCy models
+    # client (connection pooling, retries, rate limiting) and cache for the Wikidata and Wikipedia APIs
+    http_utils.configure_http_client(**mwep_settings['http_client'])
+    http_cache_settings = mwep_settings['http_cache']
+    http_cache = cache_utils.configure_http_cache(folder=http_cache_settings['folder'],
+                                                  ttl=http_cache_settings['ttl'],
+                                                  max_size_mb=http_cache_settings['max_size_mb'],
+                                                  offline=http_cache_settings['offline'])
+
+    print('HTTP cache configured:', http_cache.path)
+
+    sparql_cache_settings = mwep_settings['sparql_cache']
+    sparql_cache = cache_utils.configure_sparql_cache(folder=sparql_cache_settings['folder'],
+                                                      ttl=sparql_cache_settings['ttl'],
+                                                      max_size_mb=sparql_cache_settings['max_size_mb'],
+                                                      offline=http_cache_settings['offline'],
+                                                      refresh=arguments['--refresh-sparql'])
+
+    print('SPARQL cache configured:', sparql_cache.path)
+
+    crawl_cache_settings = mwep_settings['crawl_cache']
+    crawl_cache = cache_utils.configure_crawl_cache(folder=crawl_cache_settings['folder'],
+                                                    ttl=crawl_cache_settings['ttl'],
+                                                    max_size_mb=crawl_cache_settings['max_size_mb'],
+                                                    offline=http_cache_settings['offline'])
+
+    print('Crawl cache configured:', crawl_cache.path)
+
+    # load spaCy models (one spaCy-to-NAF converter per language)
     spacy_models = mwep_settings['spacy_models']
-    models = {}
-    for model_info in spacy_models.split(';'):
-         language, model_name = model_info.split('-')
-         print("Spacy modal_name", model_name)
-         models[language] = spacy.load(model_name)
+    converters = pilot_utils.load_converters(spacy_models,
+                                             languages=arguments['--languages'].split('-'))
 
     print("Spacy models have been loaded.")
 
@@ -398,7 +443,9 @@ if __name__ == '__main__':
             incidents = retrieve_incidents_per_type(incident_type_uri,
                                                 event_type_matching,
                                                 json_wd_to_sem,
-                                                99999)
+                                                99999,
+                                                partitioning=mwep_settings['sparql_partitioning'],
+                                                stream=mwep_settings['sparql_streaming'])
         elif method == "by_participant":
 
             print("Extracting data by:", method, " for incident type:", incident_type_uri, " and participant type:", participant_type_uri)
@@ -529,7 +576,7 @@ if __name__ == '__main__':
 
                 print(ref_text_obj.name, ref_text_obj.uri, ref_text_obj.found_by, dct)
 
-                nlp = models[language]
+                converter = converters.get(language)
 
                 pilot_utils.text_to_naf(wiki_title,
                                         languages,
@@ -538,7 +585,7 @@ if __name__ == '__main__':
                                         annotations,
                                         prefix,
                                         language,
-                                        nlp,
+                                        converter,
                                         dct,
                                         output_folder=naf_output_folder,
                                         wiki_langlinks=wiki_langlinks)
@@ -585,3 +632,6 @@ if __name__ == '__main__':
     print(df.to_csv(index=False))
 
     print('TOTAL TIME TO RUN THE SCRIPT for', event_types, ':', utils.format_time(end - start_init), 'sec')
+    print('HTTP cache statistics:', http_cache.stats())
+    print('SPARQL cache statistics:', sparql_cache.stats())
+    print('Crawl cache statistics:', crawl_cache.stats())
@@ -0,0 +1,201 @@
+"""
+Smoke tests of crawl_utils, wikipedia_utils, and xml_utils.
+These used to run (partly against live websites) every time the modules were imported.
+
+By default, the crawl tests run against a local HTTP server that stands in for the Wayback Machine
+(CDX server and snapshots), so that they are fast, deterministic, and work offline.
+With --live, the tests are also run against the real Wayback Machine.
+
+Usage:
+  smoke_tests.py [--live]
+
+Options:
+    --live  also crawl live urls via the Wayback Machine
+
+Example:
+    python smoke_tests.py
+"""
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from lxml import etree
+
+import cache_utils
+import crawl_utils
+import wikipedia_utils
+import xml_utils
+
+for_encoding = 'é'
+
+NOT_ARCHIVED_URL = 'https://www.aasdfjsoidfj.nl'
+ARCHIVED_URL = 'https://nos.nl/artikel/2312406-rechtbank-verplicht-verdachte-van-tramaanslag-om-naar-zitting-te-komen.html'
+
+ARTICLE_TITLE = 'Rechtbank verplicht verdachte van tramaanslag om naar zitting te komen'
+ARTICLE_HTML = f"""<html>
+<head><title>{ARTICLE_TITLE}</title>
+<meta property="article:published_time" content="2019-12-03T10:21:00+01:00"></head>
+<body><article>
+<h1>{ARTICLE_TITLE}</h1>
+<p>De verdachte van de tramaanslag in Utrecht moet bij de volgende zitting in de rechtszaal aanwezig zijn.
+Dat heeft de rechtbank vandaag besloten. De man weigerde eerder om naar de zittingen te komen.</p>
+<p>Bij de aanslag op 18 maart kwamen vier mensen om het leven. Het Openbaar Ministerie verdenkt de man
+van moord en doodslag met een terroristisch oogmerk. De inhoudelijke behandeling van de zaak begint in maart.</p>
+</article></body>
+</html>"""
+
+
+class WaybackStandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves the CDX server (/cdx/search/cdx, JSON output) and the snapshots (/web/<timestamp>/<url>)
+    of the urls in self.server.snapshots (url -> html)
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.num_requests += 1
+        parsed = urlparse(self.path)
+
+        if parsed.path == '/cdx/search/cdx':
+            url = parse_qs(parsed.query)['url'][0]
+            rows = []
+            if url in self.server.snapshots:
+                rows = [['urlkey', 'timestamp', 'original', 'mimetype', 'statuscode', 'digest', 'length'],
+                        [crawl_utils.get_urlkey(url), '20191203120000', url, 'text/html', '200', 'DIGEST', '2000']]
+            self.send_body(json.dumps(rows) + '\n', 'application/json')
+        elif parsed.path.startswith('/web/'):
+            url = self.path.split('/', 3)[-1]
+            if url in self.server.snapshots:
+                self.send_body(self.server.snapshots[url], 'text/html; charset=utf-8')
+            else:
+                self.send_response(404)
+                self.end_headers()
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def send_body(self, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WaybackStandIn:
+    """
+    local stand-in for the Wayback Machine, e.g.,
+    with WaybackStandIn({url: html}) as stand_in: ...
+    crawl_utils uses it while the with block is active.
+    """
+
+    def __init__(self, snapshots):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WaybackStandInHandler)
+        self.server.snapshots = snapshots
+        self.server.num_requests = 0
+        self.original_servers = None
+
+    @property
+    def num_requests(self):
+        return self.server.num_requests
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.original_servers = (crawl_utils.WAYBACK_SERVER, crawl_utils.WAYBACK_CDX_SERVER)
+        crawl_utils.WAYBACK_SERVER = 'http://127.0.0.1:%s' % self.server.server_address[1]
+        crawl_utils.WAYBACK_CDX_SERVER = crawl_utils.WAYBACK_SERVER + '/cdx/search/cdx?'
+        return self
+
+    def __exit__(self, *args):
+        crawl_utils.WAYBACK_SERVER, crawl_utils.WAYBACK_CDX_SERVER = self.original_servers
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_wikipedia_utils():
+    result = wikipedia_utils.urlencode_wikititle('François Hollande', prefix='https://nl.wikipedia.org/wiki/')
+    assert result == 'https://nl.wikipedia.org/wiki/Fran%C3%A7ois_Hollande'
+
+
+def test_xml_utils():
+    assert xml_utils.range_overlap(range(1, 2), range(1, 2))  # identity
+    assert xml_utils.range_overlap(range(1, 2), range(1, 3))  # subset
+    assert xml_utils.range_overlap(range(1, 3), range(1, 2)) == False  # superset
+    assert xml_utils.range_overlap(range(4, 5), range(1, 2)) == False
+
+    example = etree.fromstring("""<span></span>""")
+    assert xml_utils.get_range_of_targets(example) == tuple()
+    example = etree.fromstring("""<span><target id="t351"/></span>""")
+    assert xml_utils.get_range_of_targets(example) == range(351, 352)
+    example = etree.fromstring("""<span><target id="t351"/><target id="t352"/><target id="t353"/></span>""")
+    assert xml_utils.get_range_of_targets(example) == range(351, 354)
+
+    assert xml_utils.get_range_of_tids('t10', 't10') == ['t10']
+    assert xml_utils.get_range_of_tids('t10', 't11') == ['t10', 't11']
+    assert xml_utils.get_range_of_tids('t10', 't12') == ['t10', 't11', 't12']
+
+
+def test_run_newsplease():
+    status, article = crawl_utils.run_newsplease(url=NOT_ARCHIVED_URL,
+                                                 timeout=10)
+    print('test 1 - should fail with wayback machine url not found')
+    print(status)
+    assert status == 'Wayback Machine URL not found'
+
+    status, article = crawl_utils.run_newsplease(url=ARCHIVED_URL,
+                                                 timeout=10)
+    print('test 2 - should be successful')
+    print(status)
+    assert status == 'succes'
+
+    return article
+
+
+def test_crawl_with_cache(stand_in):
+    """
+    crawl the urls twice with a crawl cache: the second time, no requests are needed,
+    and the filters are applied again to the cached article
+    """
+    crawl_cache = cache_utils.ResponseCache(tempfile.mkdtemp() + '/crawl_store.sqlite')
+    settings = {'startswith': 'http',
+                'accepted_languages': {'nl'},
+                'num_chars_range': range(100, 10001),
+                'crawl_cache': crawl_cache}
+
+    url_to_result = crawl_utils.crawl_urls([NOT_ARCHIVED_URL, ARCHIVED_URL], 10, **settings)
+    assert url_to_result[NOT_ARCHIVED_URL][0] == 'Wayback Machine URL not found'
+    assert url_to_result[ARCHIVED_URL][0] == 'succes'
+    assert url_to_result[ARCHIVED_URL][1]['title'] == ARTICLE_TITLE
+
+    num_requests = stand_in.num_requests
+    url_to_result = crawl_utils.crawl_urls([NOT_ARCHIVED_URL, ARCHIVED_URL], 10, **settings)
+    assert stand_in.num_requests == num_requests, 'the second crawl should be served from the crawl cache'
+    assert url_to_result[ARCHIVED_URL][0] == 'succes'
+
+    settings['accepted_languages'] = {'en'}
+    url_to_result = crawl_utils.crawl_urls([ARCHIVED_URL], 10, **settings)
+    assert url_to_result[ARCHIVED_URL][0] == 'not in accepted languages'
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    arguments = docopt(__doc__)
+
+    test_wikipedia_utils()
+    test_xml_utils()
+    print('wikipedia_utils and xml_utils: ok')
+
+    with WaybackStandIn({ARCHIVED_URL: ARTICLE_HTML}) as stand_in:
+        test_run_newsplease()
+        test_crawl_with_cache(stand_in)
+    print('crawl_utils with the local Wayback Machine stand-in: ok')
+
+    if arguments['--live']:
+        test_run_newsplease()
+        print('crawl_utils with the live Wayback Machine: ok')
@@ -1,14 +1,18 @@
+import hashlib
+import json
 import shutil
 import os.path
-import requests
+import sys
+import gc
 from collections import defaultdict
-import time
+from contextlib import contextmanager
 from datetime import datetime
 import pickle
-import networkx as nx
 from glob import glob
 import os
 
+import cache_utils
+
 for_encoding = 'é'
 wdt_sparql_url = 'https://query.wikidata.org/sparql'
 WIKIDATA_PREFIX = 'http://www.wikidata.org/entity/'
@@ -39,24 +43,38 @@ def split_in_batches(a_list, batch_size=500):
     for i in range(0, len(a_list), batch_size):
         yield a_list[i:i + batch_size]
 
-def get_results_with_retry(wdt_sparql_url, query):
+def get_results_with_retry(wdt_sparql_url, query, max_attempts=3):
     """
-    Run SPARQL query multiple times until the results are there.
+    Run SPARQL query, retrying when the response is not valid JSON (e.g., a truncated result).
+    Connection errors, timeouts, rate limiting, and server errors are retried with backoff by http_utils.
     """
-    while True:
+    for attempt in range(1, max_attempts + 1):
         try:
-            r = requests.get(wdt_sparql_url,
-                     params = {'format': 'json', 'query': query})
-        #    res_text=r.text
-        #    response = json.loads(res_text)
-            response = r.json()
+            response = cache_utils.get_sparql_json(wdt_sparql_url, query)
             break
-        except Exception as e:
+        except ValueError as e:
+            if attempt == max_attempts:
+                raise
             print(e, 'error, retrying')
-            time.sleep(2)
-            continue
     return response
 
+def get_indexed_results_with_retry(wdt_sparql_url, query, index_function, max_attempts=3):
+    """
+    Run SPARQL query in streaming mode: the bindings are parsed one by one while the response is read,
+    and fed directly into index_function, such that the full response is never held in memory.
+    The query is run again (and the index rebuilt) when the response is not valid JSON.
+    A failed query (e.g., requests.HTTPError for a syntax error) is not run again.
+
+    :param index_function: function that aggregates an iterable of bindings, e.g., function "index_results_by_id"
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return index_function(cache_utils.iter_sparql_bindings(wdt_sparql_url, query))
+        except ValueError as e:
+            if attempt == max_attempts:
+                raise
+            print(e, 'error, retrying')
+
 def obtain_label(wd_id):
     """
     Obtain an English label for a property of Wikidata.
@@ -77,15 +95,17 @@ def obtain_label(wd_id):
     the_label=results[0]['label']['value']
     return the_label
 
-def construct_and_run_query(type_qid,
-                            event_type_matching,
-                            languages,
-                            more_props,
-                            limit):
+def construct_query(type_qid,
+                    event_type_matching,
+                    languages,
+                    more_props,
+                    limit):
     """
-    Construct a wikidata query to obtain all events of a specific type with their structured data, then run this query.
+    Construct a wikidata query to obtain all events of a specific type with their structured data.
+
+    :rtype: tuple
+    :return: (query, mapping from language to the variable of the label in that language)
     """
-    
     lang2var={}
     for l in languages:
         var='?label_%s' % l
@@ -132,8 +152,44 @@ def construct_and_run_query(type_qid,
            optional_more_info,
            limit)
 
+    return query, lang2var
+
+
+def construct_and_run_query(type_qid,
+                            event_type_matching,
+                            languages,
+                            more_props,
+                            limit,
+                            partitioning=None,
+                            stream=False):
+    """
+    Construct a wikidata query to obtain all events of a specific type with their structured data, then run this query.
+
+    :param bool stream: parse the results while they are read (see function "get_indexed_results_with_retry")
+    :param dict partitioning: settings of the partitioned extraction (see function "run_partitioned_query"),
+    e.g., {"enabled": true, "page_size": 10000, "values_batch_size": 200, "folder": "sparql_partitions"}.
+    If not enabled, one query is used for all events.
+    """
+    if partitioning and partitioning['enabled']:
+        return run_partitioned_query(type_qid,
+                                     event_type_matching,
+                                     languages,
+                                     more_props,
+                                     limit,
+                                     page_size=partitioning['page_size'],
+                                     values_batch_size=partitioning['values_batch_size'],
+                                     partition_folder=partitioning['folder'],
+                                     verbose=2)
+
+    query, lang2var=construct_query(type_qid, event_type_matching, languages, more_props, limit)
+
     print('QUERY:\n', query)
 
+    if stream:
+        return get_indexed_results_with_retry(wdt_sparql_url,
+                                              query,
+                                              lambda results: index_results_by_id(results, lang2var, more_props))
+
     response=get_results_with_retry(wdt_sparql_url, query)
     
     results=response['results']['bindings']
@@ -143,6 +199,226 @@ def construct_and_run_query(type_qid,
     return results_by_id
 
 
+
+def query_subclasses(type_qid):
+    """
+    Obtain an event type and all its descendants according to the Wikidata ontology (wdt:P279*).
+
+    :param str type_qid: e.g., Q40231
+
+    :rtype: list
+    :return: sorted list of Wikidata URIs, including the one of type_qid
+    """
+    query = """SELECT DISTINCT ?type WHERE {
+      ?type wdt:P279* wd:%s .
+    }""" % type_qid
+
+    response=get_results_with_retry(wdt_sparql_url, query)
+    types={info['type']['value'] for info in response['results']['bindings']}
+    types.add(f'{WIKIDATA_PREFIX}{type_qid}')
+    return sorted(types)
+
+
+def query_incident_ids(direct_type_uri, page_size, max_incidents):
+    """
+    Obtain the instances (wdt:P31) of one type, in keyset pages of at most page_size incidents ordered by ?incident.
+
+    :rtype: list
+    :return: incident URIs (at most max_incidents)
+    """
+    incident_ids=[]
+    last_incident=None
+    while len(incident_ids) < max_incidents:
+        keyset_filter=''
+        if last_incident is not None:
+            keyset_filter=f'FILTER ( STR(?incident) > "{last_incident}" )'
+        page_limit=min(page_size, max_incidents - len(incident_ids))
+
+        query = """
+        SELECT DISTINCT ?incident WHERE {
+          ?incident wdt:P31 <%s> .
+          %s
+        } ORDER BY STR(?incident) LIMIT %d
+        """ % (direct_type_uri, keyset_filter, page_limit)
+
+        response=get_results_with_retry(wdt_sparql_url, query)
+        page=[info['incident']['value'] for info in response['results']['bindings']]
+        incident_ids.extend(page)
+        if len(page) < page_limit:
+            break
+        last_incident=page[-1]
+    return incident_ids
+
+
+def query_incident_details(incident_ids,
+                           type_qid,
+                           event_type_matching,
+                           lang2var,
+                           more_props,
+                           values_batch_size):
+    """
+    Obtain the structured data of incidents with VALUES-batched queries:
+    one query per batch for the direct types and labels, and one query per batch and property path.
+
+    :rtype: list
+    :return: SPARQL bindings with the same variables as the query of function "construct_and_run_query",
+    such that they can be indexed with function "index_results_by_id"
+    """
+    return_langs=' '.join(lang2var.values())
+    optional_clauses_str=""
+    for l, var in lang2var.items():
+        clause=f"""OPTIONAL {{ \n\t?incident rdfs:label {var}.\n\tFILTER ( LANGMATCHES ( LANG ( {var} ), \"{l}\" )) }}\n\t"""
+        optional_clauses_str+=clause
+
+    if event_type_matching == 'direct_match':
+        type_part = f'BIND(wd:{type_qid} as ?direct_type) .'
+    elif event_type_matching == 'subsumed_by':
+        type_part = '?incident wdt:P31 ?direct_type .'
+
+    var2path={}
+    for fn_role, wdt_prop_paths in more_props.items():
+        for a_path in wdt_prop_paths:
+            var='?' + a_path.replace('wdt:', '').replace('/', '_')
+            var2path.setdefault(var, a_path)
+
+    bindings=[]
+    for batch in split_in_batches(incident_ids, values_batch_size):
+        values=' '.join(f'<{incident_id}>' for incident_id in batch)
+
+        query = """
+        SELECT DISTINCT ?direct_type ?incident ?incidentLabel %s WHERE {
+          SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+          VALUES ?incident { %s }
+          %s
+          %s
+        }
+        """ % (return_langs, values, type_part, optional_clauses_str)
+        response=get_results_with_retry(wdt_sparql_url, query)
+        main_bindings=response['results']['bindings']
+
+        incident2binding={}
+        for info in main_bindings:
+            incident2binding.setdefault(info['incident']['value'], info)
+
+        for var, a_path in var2path.items():
+            label_var=''
+            if type_qid not in {"Q40231"}:
+                label_var=var + 'Label'
+            query = """
+            SELECT DISTINCT ?incident %s %s WHERE {
+              SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+              VALUES ?incident { %s }
+              ?incident %s %s .
+            }
+            """ % (var, label_var, values, a_path, var)
+            response=get_results_with_retry(wdt_sparql_url, query)
+            for info in response['results']['bindings']:
+                incident_id=info['incident']['value']
+                if incident_id not in incident2binding:
+                    continue
+                entry=dict(incident2binding[incident_id])
+                entry.update(info)
+                bindings.append(entry)
+
+        bindings.extend(main_bindings)
+    return bindings
+
+
+def run_partitioned_query(type_qid,
+                          event_type_matching,
+                          languages,
+                          more_props,
+                          limit,
+                          page_size=10000,
+                          values_batch_size=200,
+                          partition_folder=None,
+                          verbose=0):
+    """
+    Obtain the same results as function "construct_and_run_query" with many small queries instead of one big one:
+
+    1. the event type and its descendants are obtained (only the event type itself in the case of direct_match)
+    2. per direct type (partition), the incidents are obtained in keyset pages of at most page_size incidents
+    3. the structured data of the incidents is obtained with VALUES-batched queries (see function "query_incident_details")
+
+    If partition_folder is provided, the bindings of each partition are stored there,
+    such that an interrupted extraction resumes from the first partition that was not finished.
+    In the case of subsumed_by, incidents are instances (wdt:P31) of the event type or one of its descendants.
+
+    :param int limit: maximum number of incidents
+    :param int page_size: maximum number of incidents per query in step 2
+    :param int values_batch_size: number of incidents per query in step 3
+    :param str partition_folder: folder in which the bindings per partition are stored (None: not stored)
+
+    :rtype: dict
+    :return: see function "index_results_by_id"
+    """
+    lang2var={}
+    for l in languages:
+        var='?label_%s' % l
+        lang2var[l]=var
+
+    if event_type_matching == 'direct_match':
+        partitions=[f'{WIKIDATA_PREFIX}{type_qid}']
+    elif event_type_matching == 'subsumed_by':
+        partitions=query_subclasses(type_qid)
+
+    if verbose >= 2:
+        print(f'partitioned extraction of {type_qid}: {len(partitions)} partitions')
+
+    run_folder=None
+    if partition_folder is not None:
+        fingerprint=json.dumps([type_qid, event_type_matching, sorted(languages), more_props, limit, page_size],
+                               sort_keys=True)
+        fingerprint=hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+        run_folder=os.path.join(partition_folder, f'{type_qid}_{fingerprint}')
+        os.makedirs(run_folder, exist_ok=True)
+
+    all_bindings=[]
+    seen_incidents=set()
+    for partition in partitions:
+        if len(seen_incidents) >= limit:
+            break
+
+        partition_path=None
+        if run_folder is not None:
+            partition_path=os.path.join(run_folder, partition.split('/')[-1] + '.json')
+
+        bindings=None
+        if partition_path is not None and os.path.exists(partition_path):
+            try:
+                with open(partition_path) as infile:
+                    bindings=json.load(infile)
+            except ValueError: # e.g., a partial file of an interrupted run: the partition is not finished
+                if verbose >= 2:
+                    print(f'partition file {partition_path} could not be parsed, querying {partition} again')
+
+        if bindings is None:
+            incident_ids=query_incident_ids(partition, page_size, limit - len(seen_incidents))
+            new_incident_ids=[incident_id for incident_id in incident_ids
+                              if incident_id not in seen_incidents]
+            bindings=query_incident_details(new_incident_ids,
+                                            type_qid,
+                                            event_type_matching,
+                                            lang2var,
+                                            more_props,
+                                            values_batch_size)
+            if partition_path is not None: # written atomically, so that an interrupted run leaves no partial file
+                temp_path=partition_path + '.tmp'
+                with open(temp_path, 'w') as outfile:
+                    json.dump(bindings, outfile)
+                os.replace(temp_path, partition_path)
+
+        partition_incidents={info['incident']['value'] for info in bindings}
+        if verbose >= 3:
+            print(f'partition {partition}: {len(partition_incidents)} incidents')
+        seen_incidents.update(partition_incidents)
+        all_bindings.extend(bindings)
+
+    if verbose >= 2:
+        print(f'found {len(seen_incidents)} incidents of type {type_qid}')
+
+    return index_results_by_id(all_bindings, lang2var, more_props)
+
 #@TODO:
 # - create a query to look for a participant in an event of a certain type
 # - create a fake instance ID by combining the q-code of the person with the q-code of the event-type
@@ -259,44 +535,105 @@ def construct_and_run_participant_query(participant_id, type_qid,
     return results_by_id
 
 
+def compile_column_plan(lang2var, extra_info):
+    """
+    Precompile the mapping from the variables of the SPARQL results to the fields of an incident,
+    such that the aggregation does not need to derive variable names for every row.
+
+    :param dict lang2var: language -> variable of the label, e.g., {'en': '?label_en'}
+    :param dict extra_info: predicate -> list of Wikidata property paths, e.g., {'sem:hasPlace': ['wdt:P17']}
+
+    :rtype: tuple
+    :return: (label_columns, property_columns)
+    label_columns: list of (language, variable), e.g., [('en', 'label_en')]
+    property_columns: list of (predicate, variable, label variable), e.g., [('sem:hasPlace', 'P17', 'P17Label')]
+    """
+    label_columns=[(l, var.strip('?')) for l, var in lang2var.items()]
+
+    property_columns=[]
+    for predicate, wdt_prop_paths in extra_info.items():
+        for a_path in wdt_prop_paths:
+            var=a_path.replace('wdt:', '').replace('/', '_')       # fn_role.split('@')[-1]
+            property_columns.append((predicate, var, var + 'Label'))
+
+    return label_columns, property_columns
+
+def add_extra_info_of_entry(entry, property_columns, extra_info, complex_values):
+    """
+    Add the values of the properties in one row of the SPARQL results to the extra_info of an incident.
+    The same values (e.g., countries) occur in many rows, hence every value is created and interned only once.
+
+    :param dict complex_values: (value, label) -> value as stored in extra_info, shared by all rows
+    """
+    for predicate, var, label_var in property_columns:
+        binding=entry.get(var)
+        if binding is None or not binding['value']:
+            continue
+        label_binding=entry.get(label_var)
+        key=(binding['value'], label_binding['value'] if label_binding is not None else '')
+        complex_value=complex_values.get(key)
+        if complex_value is None:
+            if key[1]:
+                complex_value=sys.intern('%s | %s' % key)
+            else:
+                complex_value=sys.intern(key[0])
+            complex_values[key]=complex_value
+        extra_info[predicate].add(complex_value)
+
+@contextmanager
+def garbage_collection_paused():
+    """
+    Pause the cyclic garbage collector, e.g., while building large nested structures without reference cycles,
+    for which the repeated collections take most of the time.
+    """
+    was_enabled=gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
 def index_results_by_id(raw_results, lang2var, extra_info):
     """
     Aggregate/index the SPARQL results by incident ID.
+    The rows of an incident are usually consecutive, hence its containers are only looked up
+    when the incident changes.
     """
+    label_columns, property_columns=compile_column_plan(lang2var, extra_info)
+    complex_values={}
+    direct_type_values={}
+
     indexed_results=defaultdict(dict)
-    for entry in raw_results:
-        wdt_id=entry['incident']['value']
-        current_result=indexed_results[wdt_id]
-        if not len(current_result.keys()):
-            current_result=defaultdict(dict)
-
-        if 'references' not in current_result:
-            current_result['references']=defaultdict(str)
-        name=entry['incidentLabel']['value']
-        #current_result['type_id']=entry['type_id']['value']
-
-        if 'direct_types' not in current_result.keys():
-            current_result['direct_types']=set()
-        current_result['direct_types'].add(entry['direct_type']['value'])
-
-        for l, var in lang2var.items():
-            label_in_lang=var.strip('?')
-            if label_in_lang in entry.keys():
-                name_in_lang=entry[label_in_lang]['value']
-                current_result['references'][l]=name_in_lang
-
-        if 'extra_info' not in current_result.keys():
-            current_result['extra_info']=defaultdict(set)
-        for predicate, wdt_prop_paths in extra_info.items():
-            for a_path in wdt_prop_paths:
-                var=a_path.replace('wdt:', '').replace('/', '_')       # fn_role.split('@')[-1] 
-                if var in entry.keys() and entry[var]['value']:
-                    if var + 'Label' in entry.keys() and entry[var + 'Label']['value']:
-                        complex_value='%s | %s' % (entry[var]['value'], entry[var + 'Label']['value'])
-                    else:
-                        complex_value=entry[var]['value']
-                    current_result['extra_info'][predicate].add(complex_value)
-        indexed_results[wdt_id]=current_result
+    current_id=None
+    with garbage_collection_paused():
+        for entry in raw_results:
+            wdt_id=entry['incident']['value']
+            if wdt_id != current_id:
+                current_id=wdt_id
+                current_result=indexed_results.get(wdt_id)
+                if current_result is None:
+                    current_result=defaultdict(dict)
+                    current_result['references']=defaultdict(str)
+                    current_result['direct_types']=set()
+                    current_result['extra_info']=defaultdict(set)
+                    indexed_results[sys.intern(wdt_id)]=current_result
+                references=current_result['references']
+                direct_types=current_result['direct_types']
+                incident_extra_info=current_result['extra_info']
+
+            direct_type=entry['direct_type']['value']
+            direct_type_value=direct_type_values.get(direct_type)
+            if direct_type_value is None:
+                direct_type_value=direct_type_values[direct_type]=sys.intern(direct_type)
+            direct_types.add(direct_type_value)
+
+            for l, label_var in label_columns:
+                binding=entry.get(label_var)
+                if binding is not None:
+                    references[l]=binding['value']
+
+            add_extra_info_of_entry(entry, property_columns, incident_extra_info, complex_values)
     return indexed_results
 
 #@TODO: adapt this function to handle the results for the participant query
@@ -333,45 +670,35 @@ def index_results_by_participant_id(raw_results, lang2var, extra_info):
     """
     Aggregate/index the SPARQL results by incident ID.
     """
+    label_columns, property_columns=compile_column_plan(lang2var, extra_info)
+    complex_values={}
+
     indexed_results=defaultdict(dict)
-    for entry in raw_results:
-        participant_id=entry['participant']['value']
-        event_id = entry['event']['value']
-        wdt_id=event_id+"_"+participant_id
-        current_result=indexed_results[wdt_id]
-        if not len(current_result.keys()):
-            current_result=defaultdict(dict)
-
-        if 'references' not in current_result:
-            current_result['references']=defaultdict(str)
-        name=entry['participantLabel']['value']
-        #current_result['type_id']=entry['type_id']['value']
-        participant_eventName = name+" "+entry['eventLabel']['value']
-        if 'direct_types' not in current_result.keys():
-            current_result['direct_types']=set()
-        current_result['direct_types'].add(entry['event']['value'])
-        current_result['participant_event_label']=participant_eventName
-
-        for l, var in lang2var.items():
-            label_in_lang=var.strip('?')
-            if label_in_lang in entry.keys():
-                #name_in_lang=entry[label_in_lang]['value']
-                name_in_lang=name #### We want the participant name here, this works for people and companies but probably not for places as their names can be different for each language.
-
-                current_result['references'][l]=name_in_lang
-
-        if 'extra_info' not in current_result.keys():
-            current_result['extra_info']=defaultdict(set)
-        for predicate, wdt_prop_paths in extra_info.items():
-            for a_path in wdt_prop_paths:
-                var=a_path.replace('wdt:', '').replace('/', '_')       # fn_role.split('@')[-1]
-                if var in entry.keys() and entry[var]['value']:
-                    if var + 'Label' in entry.keys() and entry[var + 'Label']['value']:
-                        complex_value='%s | %s' % (entry[var]['value'], entry[var + 'Label']['value'])
-                    else:
-                        complex_value=entry[var]['value']
-                    current_result['extra_info'][predicate].add(complex_value)
-        indexed_results[wdt_id]=current_result
+    with garbage_collection_paused():
+        for entry in raw_results:
+            participant_id=entry['participant']['value']
+            event_id = entry['event']['value']
+            wdt_id=event_id+"_"+participant_id
+            current_result=indexed_results.get(wdt_id)
+            if current_result is None:
+                current_result=defaultdict(dict)
+                current_result['references']=defaultdict(str)
+                current_result['direct_types']=set()
+                current_result['extra_info']=defaultdict(set)
+                indexed_results[wdt_id]=current_result
+
+            name=entry['participantLabel']['value']
+            participant_eventName = name+" "+entry['eventLabel']['value']
+            current_result['direct_types'].add(sys.intern(event_id))
+            current_result['participant_event_label']=participant_eventName
+
+            references=current_result['references']
+            for l, label_var in label_columns:
+                if label_var in entry:
+                    #name_in_lang=entry[label_var]['value']
+                    references[l]=name #### We want the participant name here, this works for people and companies but probably not for places as their names can be different for each language.
+
+            add_extra_info_of_entry(entry, property_columns, current_result['extra_info'], complex_values)
     return indexed_results
 
 def get_languages_and_names(ref_texts):
@@ -495,6 +822,9 @@ def load_ontology_as_directed_graph(output_folder, top_node, verbose=0):
     :rtype: networkx.classes.digraph.DiGraph
     :return: directed graph containing all subclass of relations of Wikidata
     """
+    # imported here, because networkx is slow to import
+    import networkx as nx
+
     graph_path = f'{output_folder}/g.p'
     if os.path.exists(graph_path):
         sub_g = nx.read_gpickle(graph_path)
@@ -561,6 +891,8 @@ def update_incident(instance_of_values, g, verbose=0):
     wd:IDENTIFIER
     :param networkx.classes.digraph.DiGrap g: directed graph
     """
+    import networkx as nx
+
     all_ancestors = set()
     for instance_of_value in instance_of_values:
         assert instance_of_value.startswith('wd:')
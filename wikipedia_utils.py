@@ -1,9 +1,14 @@
 import bz2
 import json
+import mmap
 import os
+import pickle
+import struct
 import urllib.parse
+from collections import defaultdict
 
 from lxml import etree
+import index_utils
 import xml_utils
 
 
@@ -50,19 +55,257 @@ def urlencode_wikititle(wiki_title, prefix=None):
 
     return result
 
-result = urlencode_wikititle('François Hollande', prefix='https://nl.wikipedia.org/wiki/')
-assert result == 'https://nl.wikipedia.org/wiki/Fran%C3%A7ois_Hollande'
+STORE_DATA_SUFFIX = '.jsonl'
+STORE_OFFSETS_SUFFIX = '.offsets'
+OFFSET_FORMAT = '<Q'
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+
+PAGE2PATH_BASENAME = 'page2path'
+
+# path of offsets file -> memory-mapped offsets table
+_offset_tables = {}
+
+
+def get_store_paths(wiki_store_folder, relative_path):
+    """
+    map the relative path of a bz2 shard of the Wikipedia_Reader output
+    to the paths of its random-access version
+
+    :param str wiki_store_folder: folder with the random-access version of the "wiki" folder
+    :param str relative_path: e.g., "en/AA/wiki_00.bz2"
+
+    :rtype: tuple
+    :return: (path to uncompressed JSONL file, path to offsets file)
+    """
+    base = os.path.join(wiki_store_folder, relative_path)
+    if base.endswith('.bz2'):
+        base = base[:-4]
+    return f'{base}{STORE_DATA_SUFFIX}', f'{base}{STORE_OFFSETS_SUFFIX}'
+
+
+def convert_shard_to_store(bz2_path, data_path, offsets_path):
+    """
+    decompress one bz2 shard to JSONL and store the byte offset of every line.
+    The offsets file contains one unsigned 64-bit integer per line, plus
+    a final one with the size of the JSONL file.
+
+    :param str bz2_path: path to a bz2 shard, e.g., wiki/en/AA/wiki_00.bz2
+    :param str data_path: path to write the uncompressed JSONL to
+    :param str offsets_path: path to write the offsets table to
+
+    :rtype: int
+    :return: number of lines (=Wikipedia pages) in the shard
+    """
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+    num_lines = 0
+    offset = 0
+    with bz2.BZ2File(bz2_path, 'r') as infile, \
+         open(data_path, 'wb') as data_file, \
+         open(offsets_path, 'wb') as offsets_file:
+        for line in infile:
+            offsets_file.write(struct.pack(OFFSET_FORMAT, offset))
+            data_file.write(line)
+            offset += len(line)
+            num_lines += 1
+        offsets_file.write(struct.pack(OFFSET_FORMAT, offset))
+
+    return num_lines
+
+
+def convert_wiki_folder_to_store(wiki_folder, wiki_store_folder, verbose=0):
+    """
+    one-time conversion of all bz2 shards in the "wiki" folder
+    to a random-access store (see function "convert_shard_to_store").
+    The relative paths of the shards are kept, such that
+    the page2path index can be used as is.
+
+    :param str wiki_folder: path to where extracted Wikipedia output is stored, e.g, the folder "wiki"
+    :param str wiki_store_folder: folder to write the random-access store to
+
+    :rtype: int
+    :return: number of converted shards
+    """
+    num_shards = 0
+    for root, dirs, files in os.walk(wiki_folder):
+        for filename in sorted(files):
+            if not filename.endswith('.bz2'):
+                continue
+            bz2_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(bz2_path, wiki_folder)
+            data_path, offsets_path = get_store_paths(wiki_store_folder, relative_path)
+
+            num_lines = convert_shard_to_store(bz2_path, data_path, offsets_path)
+            num_shards += 1
+
+            if verbose >= 2:
+                print(f'converted {relative_path}: {num_lines} pages')
+
+    if verbose:
+        print(f'converted {num_shards} shards from {wiki_folder} to {wiki_store_folder}')
+
+    return num_shards
+
+
+def get_offset_table(offsets_path):
+    """
+    memory-map an offsets file (only the first time it is requested)
+    """
+    if offsets_path not in _offset_tables:
+        with open(offsets_path, 'rb') as infile:
+            _offset_tables[offsets_path] = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    return _offset_tables[offsets_path]
+
+
+def read_page_from_store(data_path, offsets_path, line_number):
+    """
+    read one Wikipedia page from the random-access store
+    using one seek in the JSONL file
+
+    :rtype: dict
+    :return: the JSON of the Wikipedia page
+    """
+    offset_table = get_offset_table(offsets_path)
+    start, end = struct.unpack_from('<2Q', offset_table, line_number * OFFSET_SIZE)
+
+    with open(data_path, 'rb') as infile:
+        infile.seek(start)
+        line = infile.read(end - start)
+
+    return json.loads(line)
+
+
+def read_page_from_bz2(path, line_number):
+    """
+    read one Wikipedia page from a bz2 shard by decompressing
+    all lines until line_number is reached
+
+    :rtype: dict
+    :return: the JSON of the Wikipedia page (empty dict if not found)
+    """
+    wiki_page = {}
+    with bz2.BZ2File(path, "r") as infile:
+        for index, line in enumerate(infile):
+            if index == line_number:
+                wiki_page = json.loads(line)
+                break
+    return wiki_page
+
+
+def convert_page2path_to_index(wiki_folder, wiki_store_folder, verbose=0):
+    """
+    one-time conversion of the page2path.p pickle in the "wiki" folder
+    to an on-disk, memory-mapped index (see index_utils.SortedKeyIndex)
+
+    :param str wiki_folder: folder containing page2path.p
+    :param str wiki_store_folder: folder to write the index to
+
+    :rtype: int
+    :return: number of keys
+    """
+    path_uri2path_info = os.path.join(wiki_folder, f'{PAGE2PATH_BASENAME}.p')
+    with open(path_uri2path_info, 'rb') as infile:
+        wiki_uri2path_info = pickle.load(infile)  # make take some time
+
+    num_keys = index_utils.build_sorted_key_index(wiki_uri2path_info.items(),
+                                                  os.path.join(wiki_store_folder, PAGE2PATH_BASENAME),
+                                                  verbose=verbose)
+    if verbose:
+        print(f'converted {path_uri2path_info}: {num_keys} pages')
+
+    return num_keys
+
+
+def load_page2path_index(wiki_folder, wiki_store_folder=None, verbose=0):
+    """
+    load the mapping from Wikipedia uri -> (relative_path, line_number).
+    The memory-mapped index in wiki_store_folder is used if it exists,
+    else page2path.p is unpickled.
+
+    :rtype: dict or index_utils.SortedKeyIndex
+    :return: Wikipedia uri -> (relative_path, line_number)
+    """
+    if wiki_store_folder is not None:
+        index_path = os.path.join(wiki_store_folder, PAGE2PATH_BASENAME)
+        if index_utils.sorted_key_index_exists(index_path):
+            if verbose:
+                print(f'memory-mapped {index_path}')
+            return index_utils.SortedKeyIndex(index_path)
+
+    path_uri2path_info = os.path.join(wiki_folder, f'{PAGE2PATH_BASENAME}.p')
+    if verbose:
+        print(path_uri2path_info)
+    with open(path_uri2path_info, 'rb') as infile:
+        wiki_uri2path_info = pickle.load(infile)  # make take some time
+
+    return wiki_uri2path_info
+
+
+def convert_langlinks_to_indices(wiki_langlinks_path, wiki_langlinks_folder, verbose=0):
+    """
+    one-time conversion of the langlinks pickle (merged_indices.p),
+    i.e., language -> uri -> other language -> uri,
+    to one memory-mapped index per language (see index_utils.SortedKeyIndex)
+
+    :param str wiki_langlinks_path: path to merged_indices.p
+    :param str wiki_langlinks_folder: folder to write the indices to
+
+    :rtype: dict
+    :return: language -> number of keys
+    """
+    with open(wiki_langlinks_path, 'rb') as infile:
+        wiki_langlinks = pickle.load(infile)
+
+    language2num_keys = {}
+    for language, uri2langlinks in wiki_langlinks.items():
+        language2num_keys[language] = index_utils.build_sorted_key_index(uri2langlinks.items(),
+                                                                         os.path.join(wiki_langlinks_folder, language),
+                                                                         verbose=verbose)
+    if verbose:
+        print(f'converted {wiki_langlinks_path}: {language2num_keys}')
+
+    return language2num_keys
+
+
+def load_wiki_langlinks(wiki_langlinks_path, wiki_langlinks_folder, languages, verbose=0):
+    """
+    load the mapping language -> uri -> other language -> uri.
+    If wiki_langlinks_folder exists, the index of a language is only memory-mapped
+    when it is used for the first time and only for the provided languages.
+    Else, the pickle is loaded.
+
+    :param str wiki_langlinks_path: path to merged_indices.p
+    :param str wiki_langlinks_folder: folder with one index per language
+    (see function "convert_langlinks_to_indices")
+    :param list languages: languages of the current run, e.g., ['nl', 'en']
+
+    :rtype: dict or index_utils.LazySortedKeyIndices
+    """
+    if wiki_langlinks_folder is not None and os.path.isdir(wiki_langlinks_folder):
+        if verbose:
+            print(f'langlinks will be loaded lazily from {wiki_langlinks_folder} for {languages}')
+        return index_utils.LazySortedKeyIndices(wiki_langlinks_folder, languages)
+
+    with open(wiki_langlinks_path, 'rb') as infile:
+        wiki_langlinks = pickle.load(infile)
+
+    return wiki_langlinks
+
 
 def load_wiki_page_info(wiki_title,
                         prefix,
                         language,
                         wiki_folder,
-                        wiki_uri2relative_path):
+                        wiki_uri2relative_path,
+                        wiki_store_folder=None):
     """
     :param str wiki_title: Wikipedia article title, e.g., "President van Frankrijk"
     :param str language: supported: 'nl' | 'en' | 'it'
     :param str wiki_folder: path to where extracted Wikipedia output is stored, e.g, the folder "wiki",
     with subfolders for the output per language
+    :param str wiki_store_folder: if provided, the page is read from the random-access store
+    (see function "convert_wiki_folder_to_store") when it exists for the shard.
+    Else, the bz2 shard is decompressed until the page is found.
 
     :rtype: tuple
     :return: (success, reason, naf)
@@ -84,20 +327,94 @@ def load_wiki_page_info(wiki_title,
         return None, None, success, reason
     else:
         relative_path, line_number = wiki_uri2relative_path[wiki_uri_encoded]
-        path = os.path.join(wiki_folder, relative_path)
 
         # load wiki_page
         wiki_page = {}
-        with bz2.BZ2File(path, "r") as infile:
-            for index, line in enumerate(infile):
-                if index == line_number:
-                    wiki_page = json.loads(line)
-                    break
+        if wiki_store_folder is not None:
+            data_path, offsets_path = get_store_paths(wiki_store_folder, relative_path)
+            if os.path.exists(offsets_path):
+                wiki_page = read_page_from_store(data_path, offsets_path, line_number)
+
+        if not wiki_page:
+            path = os.path.join(wiki_folder, relative_path)
+            wiki_page = read_page_from_bz2(path, line_number)
 
         assert wiki_page, f'index is wrong for {language} {wiki_title}'
 
         return wiki_page['text'], wiki_page['annotations'], success, reason
 
+def load_wiki_pages_info(title_language_pairs,
+                         language2info,
+                         wiki_folder,
+                         wiki_uri2relative_path,
+                         wiki_store_folder=None,
+                         verbose=0):
+    """
+    batch version of function "load_wiki_page_info".
+    The requested pages are grouped by shard and sorted by line number,
+    such that every shard is read in one sequential pass.
+
+    :param iterable title_language_pairs: iterable of (wiki_title, language), e.g.,
+    [("President van Frankrijk", "nl")]
+    :param dict language2info: language -> info, e.g., the prefix of the language
+    (see language2info.json in the "wiki" folder)
+    :param str wiki_folder: see function "load_wiki_page_info"
+    :param wiki_uri2relative_path: see function "load_wiki_page_info"
+    :param str wiki_store_folder: see function "load_wiki_page_info"
+
+    :rtype: dict
+    :return: (wiki_title, language) -> (text, annotations, success, reason)
+    """
+    results = {}
+    relative_path2requests = defaultdict(list)
+
+    for wiki_title, language in set(title_language_pairs):
+        assert language in {'nl', 'en', 'it'}, f'{language} not part of supported languages: nl it en'
+
+        prefix = language2info[language]['prefix']
+        wiki_uri_encoded = urlencode_wikititle(wiki_title, prefix=prefix)
+
+        if wiki_uri_encoded not in wiki_uri2relative_path:
+            results[(wiki_title, language)] = (None, None, False, 'page not extracted')
+        else:
+            relative_path, line_number = wiki_uri2relative_path[wiki_uri_encoded]
+            relative_path2requests[relative_path].append((line_number, (wiki_title, language)))
+
+    for relative_path, page_requests in relative_path2requests.items():
+        page_requests.sort(key=lambda request: request[0])
+
+        line_number2page = {}
+        data_path = offsets_path = None
+        if wiki_store_folder is not None:
+            data_path, offsets_path = get_store_paths(wiki_store_folder, relative_path)
+
+        if offsets_path is not None and os.path.exists(offsets_path):
+            for line_number, key in page_requests:
+                line_number2page[line_number] = read_page_from_store(data_path, offsets_path, line_number)
+        else:
+            needed = {line_number for line_number, key in page_requests}
+            last_line_number = page_requests[-1][0]
+            path = os.path.join(wiki_folder, relative_path)
+            with bz2.BZ2File(path, "r") as infile:
+                for index, line in enumerate(infile):
+                    if index in needed:
+                        line_number2page[index] = json.loads(line)
+                    if index == last_line_number:
+                        break
+
+        for line_number, (wiki_title, language) in page_requests:
+            wiki_page = line_number2page.get(line_number)
+            assert wiki_page, f'index is wrong for {language} {wiki_title}'
+            results[(wiki_title, language)] = (wiki_page['text'], wiki_page['annotations'], True, 'success')
+
+        if verbose >= 3:
+            print(f'loaded {len(page_requests)} pages from {relative_path}')
+
+    if verbose >= 2:
+        print(f'loaded {len(results)} Wikipedia pages from {len(relative_path2requests)} shards')
+
+    return results
+
 if __name__ == '__main__':
     import spacy
     import os
@@ -110,6 +427,7 @@ if __name__ == '__main__':
 
     spacy_models = "en-en_core_web_sm;nl-nl_core_news_sm;it-it_core_news_sm"
     wiki_folder = '/home/postma/Wikipedia_Reader/wiki'
+    wiki_store_folder = '/home/postma/Wikipedia_Reader/wiki_store'
     naf_output_folder = 'wiki_output'
 
     if os.path.exists(naf_output_folder):
@@ -129,9 +447,7 @@ if __name__ == '__main__':
         models[language] = spacy.load(model_name)
 
     # load index and language info
-    path_uri2path_info = os.path.join(wiki_folder, 'page2path.p')
-    with open(path_uri2path_info, 'rb') as infile:
-        wiki_uri2path_info = pickle.load(infile) # make take some time
+    wiki_uri2path_info = load_page2path_index(wiki_folder, wiki_store_folder)
 
     language_info_path = os.path.join(wiki_folder, 'language2info.json')
     with open(language_info_path, 'r')  as infile:
@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import os
 import pickle
 from lxml import etree
@@ -11,6 +11,11 @@ for_encoding = 'é'
 COREFERENCES_ID = 'Wikipedia_hyperlinks'
 WIKIDATA_PREFIX = 'http://www.wikidata.org/entity/'
 
+# see function "get_wikidata_enrichment"
+WikidataEnrichment = namedtuple('WikidataEnrichment', ['wiki_to_wd',
+                                                       'uri_to_rels',
+                                                       'inc_id_to_wd_uris'])
+
 def mapping_wid2tid(doc):
     """
     create mapping from w_id to t_id
@@ -181,12 +186,6 @@ def range_overlap(range1, range2):
     return result
 
 
-assert range_overlap(range(1, 2), range(1, 2))  # identity
-assert range_overlap(range(1, 2), range(1, 3))  # subset
-assert range_overlap(range(1, 3), range(1, 2)) == False  # superset
-assert range_overlap(range(4, 5), range(1, 2)) == False
-
-
 def get_range_of_targets(span_el):
     targets = []
 
@@ -207,14 +206,6 @@ def get_range_of_targets(span_el):
     return the_range
 
 
-example = etree.fromstring("""<span></span>""")
-assert get_range_of_targets(example) == tuple()
-example = etree.fromstring("""<span><target id="t351"/></span>""")
-assert get_range_of_targets(example) == range(351, 352)
-example = etree.fromstring("""<span><target id="t351"/><target id="t352"/><target id="t353"/></span>""")
-assert get_range_of_targets(example) == range(351, 354)
-
-
 def get_label2freq(naf_paths, xpath_query, attributes, verbose=0):
     label2freq = defaultdict(int)
     for naf_path in naf_paths:
@@ -269,12 +260,6 @@ def get_range_of_tids(start_tid, end_tid):
             for number in the_range]
 
 
-assert get_range_of_tids('t10', 't10') == ['t10']
-assert get_range_of_tids('t10', 't11') == ['t10', 't11']
-assert get_range_of_tids('t10', 't12') == ['t10', 't11', 't12']
-# assert get_range_of_tids('t12', 't10') # should raise exception
-
-
 def iterable_of_lexical_items(doc,
                               xml_path,
                               selected_attributes,
@@ -347,27 +332,22 @@ def get_naf_paths(inc_coll_obj,
 
     return naf_paths, naf_to_inc_id
 
-def add_wd_uris_to_naf_file(naf_path,
-                            wiki_to_wd,
-                            pass_if_coreferences_el_exists=True,
-                            verbose=0):
+def add_wd_uris_to_naf(doc,
+                       wiki_to_wd,
+                       naf_path='',
+                       verbose=0):
     """
+    add Wikidata uris to the entities layer of a NAF tree in memory
 
-    :param naf_path:
-    :param wiki_to_wd:
-    :return:
+    :param lxml.etree._ElementTree doc: NAF with entities layer
+    :param dict wiki_to_wd: Wikipedia uri -> Wikidata uri
+    :param str naf_path: only used in error messages
+
+    :rtype: bool
+    :return: True if the NAF tree was changed
     """
-    parser = etree.XMLParser(remove_blank_text=True)
-    doc = etree.parse(naf_path, parser)
     changed = False
 
-    if pass_if_coreferences_el_exists:
-        coreferences_header_el = doc.find('nafHeader/linguisticProcessors[@layer="coreferences"]')
-        if coreferences_header_el is not None:
-            if verbose >= 5:
-                print(f'skipped {naf_path} since it already contains coreferences layer.')
-            return
-
     for ext_refs_el in doc.xpath('entities/entity/externalReferences'):
         ext_ref_els = list(ext_refs_el.xpath('externalRef'))
 
@@ -397,6 +377,34 @@ def add_wd_uris_to_naf_file(naf_path,
                     for ext_ref_el in ext_ref_els]
         assert len(all_refs) == len(set(all_refs)), f'duplicate references in {naf_path}'
 
+    return changed
+
+
+def add_wd_uris_to_naf_file(naf_path,
+                            wiki_to_wd,
+                            pass_if_coreferences_el_exists=True,
+                            verbose=0):
+    """
+
+    :param naf_path:
+    :param wiki_to_wd:
+    :return:
+    """
+    parser = etree.XMLParser(remove_blank_text=True)
+    doc = etree.parse(naf_path, parser)
+
+    if pass_if_coreferences_el_exists:
+        coreferences_header_el = doc.find('nafHeader/linguisticProcessors[@layer="coreferences"]')
+        if coreferences_header_el is not None:
+            if verbose >= 5:
+                print(f'skipped {naf_path} since it already contains coreferences layer.')
+            return
+
+    changed = add_wd_uris_to_naf(doc,
+                                 wiki_to_wd,
+                                 naf_path=naf_path,
+                                 verbose=verbose)
+
     # overwrite NAF file
     if changed:
         doc.write(naf_path,
@@ -408,28 +416,23 @@ def add_wd_uris_to_naf_file(naf_path,
             print(f'add links to {naf_path}')
 
 
-def add_coreferences_layer(naf_path,
-                           uri_to_rels,
-                           wd_uris_of_inc_id,
-                           pass_if_coreferences_el_exists=True,
-                           verbose=0):
+def add_coreferences_to_naf(doc,
+                            uri_to_rels,
+                            wd_uris_of_inc_id,
+                            verbose=0):
     """
+    add the coreferences layer to a NAF tree in memory
 
-    :param str naf_path: NAF file with entities layer
+    :param lxml.etree._ElementTree doc: NAF with entities layer
     and without coreferences layer
-    :param verbose:
+    :param dict uri_to_rels: see utils.get_uris
+    :param set wd_uris_of_inc_id: Wikidata uris of the incident of the NAF
+
+    :rtype: bool
+    :return: True if the coreferences layer was added
     """
-    parser = etree.XMLParser(remove_blank_text=True)
-    doc = etree.parse(naf_path, parser)
     root = doc.getroot()
 
-    if pass_if_coreferences_el_exists:
-        coreferences_header_el = doc.find('nafHeader/linguisticProcessors[@layer="coreferences"]')
-        if coreferences_header_el is not None:
-            if verbose >= 5:
-                print(f'skipped {naf_path} since it already contains coreferences layer.')
-            return
-
     added = False
 
     # extract wd_uri -> set of spans
@@ -536,6 +539,37 @@ def add_coreferences_layer(naf_path,
     root.append(coreferences_el)
     added = True
 
+    return added
+
+
+def add_coreferences_layer(naf_path,
+                           uri_to_rels,
+                           wd_uris_of_inc_id,
+                           pass_if_coreferences_el_exists=True,
+                           verbose=0):
+    """
+
+    :param str naf_path: NAF file with entities layer
+    and without coreferences layer
+    :param verbose:
+    """
+    parser = etree.XMLParser(remove_blank_text=True)
+    doc = etree.parse(naf_path, parser)
+
+    if pass_if_coreferences_el_exists:
+        coreferences_header_el = doc.find('nafHeader/linguisticProcessors[@layer="coreferences"]')
+        if coreferences_header_el is not None:
+            if verbose >= 5:
+                print(f'skipped {naf_path} since it already contains coreferences layer.')
+            return
+
+    added = add_coreferences_to_naf(doc,
+                                    uri_to_rels,
+                                    wd_uris_of_inc_id,
+                                    verbose=verbose)
+    if not added:
+        return added
+
     # overwrite NAF file
     doc.write(naf_path,
               encoding='utf-8',
@@ -548,6 +582,61 @@ def add_coreferences_layer(naf_path,
     return added
 
 
+def get_wikidata_enrichment(inc_coll_obj,
+                            languages,
+                            verbose=0):
+    """
+    compute the information needed to add Wikidata information to the NAF files
+    of an IncidentCollection, such that it can be added before the NAF files are written
+    (see function "add_wikidata_to_naf")
+
+    :rtype: WikidataEnrichment
+    """
+    # get uris
+    uri_to_rels, inc_id_to_wd_uris = utils.get_uris(inc_coll_obj,
+                                                    verbose=verbose)
+
+    # get mapping Wikidata <-> Wikipedia
+    wd_to_wiki,\
+    wiki_to_wd = native_api_utils.map_wd_uri_to_wikipedia_uri(uri_to_rels,
+                                                              languages,
+                                                              verbose=verbose)
+
+    return WikidataEnrichment(wiki_to_wd=wiki_to_wd,
+                              uri_to_rels=uri_to_rels,
+                              inc_id_to_wd_uris=inc_id_to_wd_uris)
+
+
+def add_wikidata_to_naf(doc,
+                        wikidata_enrichment,
+                        inc_id,
+                        naf_path='',
+                        verbose=0):
+    """
+    add Wikidata uris to the entities layer and the coreferences layer
+    to a NAF tree in memory (same result as function "add_wikidata_uris_to_naf_files")
+
+    :param lxml.etree._ElementTree doc: NAF with entities layer
+    :param WikidataEnrichment wikidata_enrichment: see function "get_wikidata_enrichment"
+    :param str inc_id: Wikidata uri of the incident of the NAF,
+    e.g., http://www.wikidata.org/entity/Q123
+
+    :rtype: bool
+    :return: True if the coreferences layer was added
+    """
+    add_wd_uris_to_naf(doc,
+                       wikidata_enrichment.wiki_to_wd,
+                       naf_path=naf_path,
+                       verbose=verbose)
+
+    wd_uris_of_inc_id = wikidata_enrichment.inc_id_to_wd_uris[inc_id]
+    added = add_coreferences_to_naf(doc,
+                                    wikidata_enrichment.uri_to_rels,
+                                    wd_uris_of_inc_id,
+                                    verbose=verbose)
+    return added
+
+
 def add_wikidata_uris_to_naf_files(inc_coll_obj,
                                    main_naf_folder,
                                    languages,
@@ -562,15 +651,12 @@ def add_wikidata_uris_to_naf_files(inc_coll_obj,
                                              main_naf_folder,
                                              verbose=verbose)
 
-    # get uris
-    uri_to_rels, inc_id_to_wd_uris = utils.get_uris(inc_coll_obj,
-                                                    verbose=verbose)
-
-    # get mapping Wikidata <-> Wikipedia
-    wd_to_wiki,\
-    wiki_to_wd = native_api_utils.map_wd_uri_to_wikipedia_uri(uri_to_rels,
-                                                              languages,
-                                                              verbose=verbose)
+    wikidata_enrichment = get_wikidata_enrichment(inc_coll_obj,
+                                                  languages,
+                                                  verbose=verbose)
+    wiki_to_wd = wikidata_enrichment.wiki_to_wd
+    uri_to_rels = wikidata_enrichment.uri_to_rels
+    inc_id_to_wd_uris = wikidata_enrichment.inc_id_to_wd_uris
 
     # add entity links to NAF files
     for naf_path in naf_paths: